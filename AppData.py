@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# === 程序数据目录和文件写入工具
+
+import os
+import tempfile
+
+
+APP_DATA_DIR_NAME = "VirtualDesktopEnhancer"
+
+
+# 获取用户目录下的程序数据目录，不存在时创建
+# Windows 下是 %LOCALAPPDATA%\VirtualDesktopEnhancer，其他系统是 ~/.VirtualDesktopEnhancer
+def get_app_data_dir() -> str:
+    base_dir = os.environ.get('LOCALAPPDATA')
+    if base_dir:
+        data_dir = os.path.join(base_dir, APP_DATA_DIR_NAME)
+    else:
+        data_dir = os.path.join(os.path.expanduser('~'), '.' + APP_DATA_DIR_NAME)
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+def get_app_data_path(file_name: str) -> str:
+    return os.path.join(get_app_data_dir(), file_name)
+
+# 原子写入：先写入同目录下的临时文件，再替换目标文件，中途失败不会留下写了一半的文件
+def atomic_write_bytes(path: str, data: bytes):
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=dir_name)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_text(path: str, text: str, encoding: str = 'utf-8'):
+    atomic_write_bytes(path, text.encode(encoding))
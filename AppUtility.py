@@ -1,58 +1,170 @@
 # -*- coding: utf-8 -*-
 
+import os
 import psutil
-from pywinauto import Application
-from typing import List, Dict
-from PIL import Image, ImageQt
+import threading
+import time
+from typing import List, Dict, Set, Tuple
 import win32gui
-import win32ui
 import win32con
 import win32process
 import win32api
 from PyQt5.QtGui import QImage
-from UWP_Utility import get_icon_from_UWP_hwnd
+from UWP_Utility import get_icon_from_UWP_hwnd, get_UWP_package_identity
+from IconCache import get_icon_cache
 from LP_Wrapper import lp_wrapper
 
 
+# 进程名 -> PID 索引
+# 第一次使用时扫描全部进程，之后每次刷新只比较 PID 集合：只打开新出现的进程获取进程名，消失的进程直接移除
+# 无权访问的进程记为拒绝访问，在它退出之前不再重复打开
+# 刷新间隔内 PID 可能被新进程复用，查询结果中的 PID 会检查一次创建时间，每次刷新之后每个 PID 只检查一次
+# 查询是 O(1) 的字典查找，max_age 秒内的多次查询共用一次刷新，所以 N 条按应用匹配的规则只需要一次进程扫描
+class ProcessIndex:
+    def __init__(self, max_age: float = 1.0):
+        self.max_age: float = max_age
+        self._processes: Dict[int, Tuple[str, float]] = {}  # pid -> (进程名, 创建时间)
+        self._pids_by_name: Dict[str, Set[int]] = {}
+        self._pids_by_folded_name: Dict[str, Set[int]] = {}  # 进程名 casefold 之后的索引，用于大小写不敏感的查询
+        self._denied_pids: Dict[int, float] = {}  # 无权获取进程名的 PID -> 创建时间，创建时间变化后重新尝试
+        self._verified_pids: Set[int] = set()  # 上次刷新之后已经检查过创建时间的 PID
+        self._last_refresh_time: float = None
+        self._lock = threading.RLock()
+
+    def _add(self, pid: int, name: str, create_time: float):
+        self._processes[pid] = (name, create_time)
+        self._pids_by_name.setdefault(name, set()).add(pid)
+        self._pids_by_folded_name.setdefault(name.casefold(), set()).add(pid)
+
+    def _remove(self, pid: int):
+        name, _create_time = self._processes.pop(pid)
+        for index, key in ((self._pids_by_name, name), (self._pids_by_folded_name, name.casefold())):
+            pids = index.get(key)
+            if pids is not None:
+                pids.discard(pid)
+                if not pids:
+                    del index[key]
+
+    # 打开新出现的进程，获取进程名，create_time 是刷新时一并取得的创建时间
+    def _open(self, pid: int, create_time: float):
+        try:
+            self._add(pid, psutil.Process(pid).name(), create_time)
+        except psutil.NoSuchProcess:
+            pass
+        except psutil.AccessDenied:
+            self._denied_pids[pid] = create_time
+
+    # 刷新索引，距离上次刷新不足 max_age 秒时不做任何事，除非 force=True
+    def refresh(self, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_refresh_time is not None and now - self._last_refresh_time < self.max_age:
+                return
+
+            # 按 (PID, 创建时间) 比较，PID 被其他程序的新进程复用时创建时间不同，按新的进程名重新索引
+            # 只读取创建时间，只有新出现的进程才获取进程名
+            create_times = {process.pid: process.info['create_time']
+                            for process in psutil.process_iter(['create_time'], ad_value=None)}
+            for pid, (_name, create_time) in list(self._processes.items()):
+                if pid not in create_times or create_times[pid] != create_time:
+                    self._remove(pid)
+            self._denied_pids = {pid: create_time for pid, create_time in self._denied_pids.items()
+                                 if pid in create_times and create_times[pid] == create_time}
+            for pid in create_times.keys() - self._processes.keys() - self._denied_pids.keys():
+                self._open(pid, create_times[pid])
+            self._verified_pids.clear()
+
+            self._last_refresh_time = time.monotonic()
+
+    # 确认 PID 仍然属于索引中的进程，创建时间不同说明 PID 已经被新进程复用，重新获取进程名
+    def _verify(self, pid: int):
+        if pid in self._verified_pids:
+            return
+        self._verified_pids.add(pid)
+        known = self._processes.get(pid)
+        if known is None:
+            return
+        create_time = None
+        try:
+            process = psutil.Process(pid)
+            create_time = _get_process_create_time(process)
+            if create_time == known[1]:
+                return
+            name = process.name()
+            self._remove(pid)
+            self._add(pid, name, create_time)
+        except psutil.NoSuchProcess:
+            self._remove(pid)
+        except psutil.AccessDenied:
+            self._remove(pid)
+            self._denied_pids[pid] = create_time
+
+    def _find_pids(self, app_name: str, case_sensitive: bool) -> Set[int]:
+        pids = self._pids_by_name.get(app_name) if case_sensitive else self._pids_by_folded_name.get(app_name.casefold())
+        if not pids:
+            return set()
+        for pid in list(pids):
+            self._verify(pid)
+        pids = self._pids_by_name.get(app_name) if case_sensitive else self._pids_by_folded_name.get(app_name.casefold())
+        return set(pids) if pids else set()
+
+    # 获取应用程序的所有进程 ID，按 PID 排序
+    def get_pids(self, app_name: str, case_sensitive: bool = True) -> List[int]:
+        self.refresh()
+        with self._lock:
+            return sorted(self._find_pids(app_name, case_sensitive))
+
+    def get_is_running(self, app_name: str, case_sensitive: bool = True) -> bool:
+        self.refresh()
+        with self._lock:
+            return bool(self._find_pids(app_name, case_sensitive))
+
+    # 获取进程名，索引中没有时返回 None
+    def get_process_name(self, pid: int) -> str:
+        self.refresh()
+        with self._lock:
+            self._verify(pid)
+            known = self._processes.get(pid)
+        return known[0] if known is not None else None
+
+def _get_process_create_time(process: 'psutil.Process') -> float:
+    try:
+        return process.create_time()
+    except psutil.AccessDenied:
+        return None
+
+_process_index: ProcessIndex = None
+
+def get_process_index() -> ProcessIndex:
+    global _process_index
+    if _process_index is None:
+        _process_index = ProcessIndex()
+    return _process_index
+
 # 判断应用是否已经启动
 def get_is_app_running(app_name: str, case_sensitive : bool = True) -> bool:
-    found_processes = psutil.process_iter(['pid', 'name'])
-    is_running = False
-
-    for process in found_processes:
-        process_name_to_check = process.info['name'] if case_sensitive else process.info['name'].lower()
-        app_name_to_check = app_name if case_sensitive else app_name.lower()
-        if process_name_to_check == app_name_to_check:
-            is_running = True
-            break
-    return is_running
+    return get_process_index().get_is_running(app_name, case_sensitive)
 
 # 获取多个应用程序的进程 ID
 def get_apps_pids(app_names: List[str], case_sensitive : bool = True) -> Dict[str, List[int]]:
-    app_names_to_check = app_names if case_sensitive else  [name.lower() for name in app_names] 
-    found_processes = psutil.process_iter(['pid', 'name'])
-    results = {name: [] for name in app_names}
-    for process in found_processes:
-        name_to_check = process.info['name'] if case_sensitive else process.info['name'].lower()
-        if name_to_check in app_names_to_check:
-            idx = app_names_to_check.index(name_to_check)
-            results[app_names[idx]].append(process.info['pid'])
-    return results
+    index = get_process_index()
+    return {name: index.get_pids(name, case_sensitive) for name in app_names}
 
 # 获取单个应用程序的进程 ID
 def get_app_pid(app_name : str, case_sensitive : bool = True) -> int:
-    r = get_apps_pids([app_name], case_sensitive)
-    return r[app_name][0] if len(r[app_name])>0 else None
+    pids = get_process_index().get_pids(app_name, case_sensitive)
+    return pids[0] if len(pids)>0 else None
 
 # 判断多个应用程序是否已经启动
 def get_apps_is_running(app_names : List[str], case_sensitive : bool = True) -> Dict[str, bool]:
-    pids = get_apps_pids(app_names, case_sensitive)
-    results = {name: len(pids[name])>0 for name in app_names}
-    return results
+    index = get_process_index()
+    return {name: index.get_is_running(name, case_sensitive) for name in app_names}
 
 # 获取进程 ID 对应的应用名称
 def __get_app_name_from_pid(pid: int) -> str:
-    name = psutil.Process(pid).name()
+    name = get_process_index().get_process_name(pid)
+    if name is None:
+        name = psutil.Process(pid).name()
     if name == 'ApplicationFrameHost.exe':
         # print(f'UWP应用，pid={pid}')
         pass
@@ -76,13 +188,20 @@ def get_app_name_from_hwnd(hwnd: int) -> str:
             pass
     return name
 
-# 获取窗口句柄对应的窗口标题
+# 获取窗口句柄对应的窗口标题，直接调用一次 GetWindowText，已经刷新过的窗口优先使用 VirtualDesktopEnhancerCore.get_window_titles
 def get_window_title_from_hwnd(hwnd: int) -> str:
-    app = Application().connect(handle=hwnd)
-    return app.top_window().window_text()
+    try:
+        return win32gui.GetWindowText(hwnd)
+    except Exception as excep:
+        print(f'{hwnd} - 获取窗口标题失败，{excep}')
+        return ''
+
+# 批量获取窗口标题，用于日志
+def get_window_titles_from_hwnds(hwnds: List[int]) -> Dict[int, str]:
+    return {hwnd: get_window_title_from_hwnd(hwnd) for hwnd in hwnds}
                 
 # 获取句柄的 exe 文件路径
-# @lp_wrapper
+@lp_wrapper
 def get_exe_path_from_hwnd(hwnd: int) -> str:
     pid = win32process.GetWindowThreadProcessId(hwnd)[1]
     if pid is None or pid <= 0:
@@ -100,8 +219,11 @@ def get_exe_path_from_hwnd(hwnd: int) -> str:
     # return None
 
 # 从 exe 文件中提取最大 32x32 的图标，返回 QImage
-# @lp_wrapper
+# PIL 和 win32ui 只在第一次从 exe 提取图标时导入，图标在图集中时不需要
+@lp_wrapper
 def get_icon_from_exe(exe_path: str, icon_resize: int = 32) -> QImage:
+    import win32ui
+    from PIL import Image, ImageQt
     large_icons, small_icons = win32gui.ExtractIconEx(exe_path, 0, 1)
     icons = large_icons if len(large_icons) > 0 else small_icons
     img = None
@@ -170,56 +292,78 @@ def get_icon_size(icon_info) -> tuple[int, int, int]:
                     return (Width, Height, BitDepth)
     return (0, 0, 0)
 
-# 从窗口句柄中提取图标，返回 QImage
-# Todo 
-# # if hwnd.class_name == "TaskManagerWindow": deal with Taskmgr
-#   get_icon_from_exe("C:\\Windows\\System32\\Taskmgr.exe").save('Taskmgr-new.png')
-# @lp_wrapper
-def get_icon_from_hwnd(hwnd: int, icon_resize: int = 32) -> QImage:
+# 获取窗口图标在缓存中的键，同一个 exe 的窗口共用一个图标
+#   ('exe', exe 路径, exe 修改时间, 尺寸)，exe 中没有图标时会再尝试 UWP 包中的图标，结果同样只取决于 exe
+#   ('uwp', UWP 包全名, 应用 exe 名, 尺寸)，无法获取 exe 路径的 UWP 应用
+# 无法确定图标来源时返回 None
+def get_icon_key_from_hwnd(hwnd: int, icon_resize: int = 32) -> tuple:
+    if hwnd is None or hwnd <= 0:
+        return None
+    exe_path = get_exe_path_from_hwnd(hwnd)
+    if not exe_path:
+        exe_path = get_special_case_exe_path(hwnd)
+    if exe_path:
+        try:
+            mtime = os.path.getmtime(exe_path)
+        except OSError:
+            mtime = None
+        return ('exe', exe_path, mtime, icon_resize)
 
-    image = None
+    core_hwnd = get_UWP_core_hwnd(hwnd)
+    if core_hwnd:
+        full_name, app_name = get_UWP_package_identity(core_hwnd)
+        if full_name:
+            return ('uwp', full_name, app_name, icon_resize)
+    return None
 
-    module_name = ""
-    _, pid = win32process.GetWindowThreadProcessId(hwnd)
-    try:
-        handle = win32api.OpenProcess(win32con.PROCESS_QUERY_INFORMATION | win32con.PROCESS_VM_READ, False, pid)
-        if handle:
-            module_name = win32process.GetModuleFileNameEx(handle, 0)
-            win32api.CloseHandle(handle)
-    except Exception as e:
-        if module_name == "": # 无法获取模块名称
-            image = get_icon_special_case(hwnd, icon_resize)
-        if image is None:
-            # print(f"hwnd: {hwnd} 获取图标时无法打开进程: {e}")
-            pass
-    if image:
-        return image
+# 从窗口句柄中提取图标，返回 QImage，结果缓存在 IconCache 中
+@lp_wrapper
+def get_icon_from_hwnd(hwnd: int, icon_resize: int = 32) -> QImage:
+    return get_icon_and_key_from_hwnd(hwnd, icon_resize)[0]
+
+# 返回 (图标, 缓存键)，无法确定图标来源时返回 (None, None)
+def get_icon_and_key_from_hwnd(hwnd: int, icon_resize: int = 32) -> tuple:
+    key = get_icon_key_from_hwnd(hwnd, icon_resize)
+    if key is None:
+        return None, None
+    return get_icon_cache().get_or_load(key, lambda: load_icon_from_key(key, hwnd)), key
+
+# 按缓存键提取图标，hwnd 用于 exe 中没有图标时查找 UWP 包
+def load_icon_from_key(key: tuple, hwnd: int = None) -> QImage:
+    source, name, _version, icon_resize = key
+    image = None
 
     # 试图从 EXE 文件中获取图标
-    exe_path = get_exe_path_from_hwnd(hwnd)
-    if exe_path:
-        image = get_icon_from_exe(exe_path, icon_resize)
+    if source == 'exe':
+        image = get_icon_from_exe(name, icon_resize)
 
     # 试图从 UWP 包中获取图标
-    if image is None: 
+    if image is None and hwnd:
         core_hwnd = get_UWP_core_hwnd(hwnd)
         if core_hwnd:
             image = get_icon_from_UWP_hwnd(core_hwnd, icon_resize)
 
     return image
 
-def get_icon_special_case(hwnd: int, icon_resize: int = 32) -> QImage:
+# 无法打开进程获取 exe 路径的特殊窗口
+def get_special_case_exe_path(hwnd: int) -> str:
     if hwnd is None or hwnd <= 0:
         return None
     # 任务管理器
     try:
         class_name = win32gui.GetClassName(hwnd)
         if class_name == "TaskManagerWindow":
-            return get_icon_from_exe("C:\\Windows\\System32\\Taskmgr.exe", icon_resize)
+            return "C:\\Windows\\System32\\Taskmgr.exe"
     except Exception as e:
         pass
     return None
 
+def get_icon_special_case(hwnd: int, icon_resize: int = 32) -> QImage:
+    exe_path = get_special_case_exe_path(hwnd)
+    if exe_path:
+        return get_icon_from_exe(exe_path, icon_resize)
+    return None
+
 # 对一般exe和UWP都适用
 def get_exe_path_from_pid(pid: int) -> str:
     process = psutil.Process(pid)
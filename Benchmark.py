@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+
+# === 可复现的性能基准
+# 在 SimulatedWindowBackend 上无界面运行（Qt 使用 offscreen 平台），不需要 Windows，结果以 JSON 输出，方便比较不同提交之间的差异。
+# 测量的内容：
+#   refresh   VirtualDesktopEnhancerCore.refresh_all_windows，冷启动、无变化、部分窗口变化三种情况
+#   matching  WindowMatchIndex 的编译和匹配，规则是完全相等、通配符、正则表达式的混合，并检查索引和逐条匹配的结果一致，不一致时返回 1
+#   render    VirtualDesktopEnhancerWindow.refresh_window_list_content、启动时显示窗口快照，以及列表的一次完整绘制
+#   icons     图标解码路径：从图标文件解码、缩放、转换为图集格式，IconCache 和 IconAtlas 的存取
+#   config    匹配规则的保存、加载、单条规则的增量写入，以及修改一条规则后重新编译
+# 模拟窗口和规则都由固定的随机种子生成，同一台机器上多次运行的结果可以直接比较。
+# 程序数据目录会被替换为临时目录，不会读写真实的图标图集和配置。
+#
+# 用法：
+#   python Benchmark.py                              默认 100 / 1000 / 10000 个窗口，10 / 100 / 1000 条规则
+#   python Benchmark.py --quick                      只跑较小的规模
+#   python Benchmark.py --sizes 500 --rules 50 --repeat 10 --output result.json
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+
+BENCHMARK_SIZES = [100, 1000, 10000]
+BENCHMARK_RULE_COUNTS = [10, 100, 1000]
+BENCHMARK_QUICK_SIZES = [100, 1000]
+BENCHMARK_QUICK_RULE_COUNTS = [10, 100]
+BENCHMARK_REPEAT = 5
+BENCHMARK_SEED = 20240101
+BENCHMARK_DESKTOP_COUNT = 4
+BENCHMARK_UWP_RATIO = 0.15  # 真实环境中 UWP 窗口大约占一成多
+BENCHMARK_HIDDEN_RATIO = 0.05
+BENCHMARK_CHURN_RATIO = 0.05  # 两次刷新之间关闭、新开的窗口比例
+BENCHMARK_ICON_SIZES = [16, 24, 32, 48, 64, 128, 256]  # 生成的样本图标尺寸，覆盖 exe 图标和 UWP logo 的常见尺寸
+BENCHMARK_ICON_COUNT = 64
+BENCHMARK_ICON_RESIZE = 32
+
+
+# 调用 func repeat 次，返回耗时统计（毫秒）
+# setup 在每次调用前执行，不计入耗时，返回值作为 func 的参数
+def measure(func: Callable, repeat: int, setup: Callable = None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            func(args)
+        else:
+            func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'repeat': repeat,
+        'min_ms': min(samples),
+        'median_ms': statistics.median(samples),
+        'mean_ms': statistics.mean(samples),
+        'max_ms': max(samples),
+        'samples_ms': samples,
+    }
+
+
+# === 模拟桌面
+def create_backend(size: int, seed: int):
+    from WindowBackend import SimulatedWindowBackend, set_window_backend
+    backend = SimulatedWindowBackend(desktop_count=BENCHMARK_DESKTOP_COUNT)
+    backend.populate(size, uwp_ratio=BENCHMARK_UWP_RATIO, hidden_ratio=BENCHMARK_HIDDEN_RATIO, seed=seed)
+    set_window_backend(backend)
+    return backend
+
+def create_core(size: int, seed: int):
+    from VirtualDesktopEnhancerCore import VirtualDesktopEnhancerCore
+    create_backend(size, seed)
+    return VirtualDesktopEnhancerCore()
+
+# 关闭一部分窗口再新开同样数量的窗口，模拟两次刷新之间的变化
+def churn_windows(backend, rng: random.Random, ratio: float = BENCHMARK_CHURN_RATIO):
+    from WindowBackend import SIMULATED_APPS
+    hwnds = list(backend.windows)
+    count = max(1, int(len(hwnds) * ratio))
+    for hwnd in rng.sample(hwnds, min(count, len(hwnds))):
+        backend.remove_window(hwnd)
+    for i in range(count):
+        app_name, window_class, title_format = rng.choice(SIMULATED_APPS)
+        backend.add_window(title_format.format(f"New Document {rng.randrange(1 << 30)}"), window_class, app_name,
+                           rng.randrange(len(backend.desktop_names)))
+
+
+# === refresh
+def bench_refresh(sizes: List[int], repeat: int, seed: int) -> dict:
+    results = {}
+    for size in sizes:
+        cold = measure(lambda core: core.refresh_all_windows(), repeat, setup=lambda: create_core(size, seed))
+
+        core = create_core(size, seed)
+        backend = core.backend
+        core.refresh_all_windows()
+        backend.reset_call_counts()
+        warm = measure(core.refresh_all_windows, repeat)
+        warm_calls = {name: count // repeat for name, count in sorted(backend.call_counts.items())}
+
+        rng = random.Random(seed)
+        churn = measure(lambda _: core.refresh_all_windows(), repeat, setup=lambda: churn_windows(backend, rng))
+
+        results[str(size)] = {
+            'windows': len(core.window_infos),
+            'cold': cold,
+            'warm': warm,
+            'churn': churn,
+            'warm_backend_calls': warm_calls,
+            'window_table': core.window_table.get_stats(),
+        }
+        print(f"refresh {size:>6} 个窗口: 冷启动 {cold['median_ms']:.2f} ms, 无变化 {warm['median_ms']:.2f} ms, "
+              f"部分变化 {churn['median_ms']:.2f} ms", file=sys.stderr)
+    return results
+
+
+# === matching
+# 生成 count 条规则：一半左右是完全相等的规则（部分能匹配到模拟窗口），其余是通配符和正则表达式
+def create_match_configs(backend, count: int, seed: int) -> list:
+    from WindowMatch import WindowMatchConfig, WindowMatchMode, WindowMatchPatternType
+    rng = random.Random(seed)
+    windows = list(backend.windows.values())
+    exact_modes = [WindowMatchMode.TITLE, WindowMatchMode.APP, WindowMatchMode.CLASS_AND_APP, WindowMatchMode.ALL]
+    configs = []
+    for i in range(count):
+        window = rng.choice(windows)
+        is_UWP = window.package_name is not None
+        kind = rng.random()
+        if kind < 0.5:
+            # 完全相等，一半的规则改掉标题使其匹配不到
+            title = window.title if rng.random() < 0.5 else f"No Such Window {i}"
+            configs.append(WindowMatchConfig(True, title, window.window_class, window.app_name, is_UWP, window.package_name,
+                                             rng.choice(exact_modes)))
+        elif kind < 0.8:
+            title = f"*Document {rng.randrange(1000)}?*" if not is_UWP else window.title[:3] + '*'
+            configs.append(WindowMatchConfig(True, title, window.window_class, window.app_name, is_UWP, window.package_name,
+                                             WindowMatchMode.TITLE_AND_APP, WindowMatchPatternType.GLOB))
+        else:
+            title = rf".*Document {rng.randrange(1000)}\b.*" if not is_UWP else f"(?i:{window.title})"
+            configs.append(WindowMatchConfig(True, title, window.window_class, window.app_name, is_UWP, window.package_name,
+                                             WindowMatchMode.TITLE, WindowMatchPatternType.REGEX))
+    return configs
+
+# 含有位置断言（^ $ \A \Z \b 前后查找）或开头的全局内联标志（(?i) (?x)）的正则表达式规则，出现在不同字段中，
+# 用于检查合并匹配和逐条匹配的一致性
+def create_anchored_match_configs(backend) -> list:
+    from WindowMatch import WindowMatchConfig, WindowMatchMode, WindowMatchPatternType
+    regex = WindowMatchPatternType.REGEX
+    configs = [
+        WindowMatchConfig(True, r".* - Google Chrome$", 'Chrome_WidgetWin_1', None, False, None, WindowMatchMode.TITLE_AND_CLASS, regex),
+        WindowMatchConfig(True, r"^Document 1\d* - Notepad", None, r"^notepad\.exe$", False, None, WindowMatchMode.TITLE_AND_APP, regex),
+        WindowMatchConfig(True, None, r"\AXLMAIN\Z", r"(?=EXCEL)\w+\.EXE", False, None, WindowMatchMode.CLASS_AND_APP, regex),
+        WindowMatchConfig(True, r".*\bDocument 2\d\b.*", r"Cabinet.*", r"(?<!x)explorer\.exe", False, None, WindowMatchMode.ALL, regex),
+        WindowMatchConfig(True, r"(?!Mail).*", r"microsoft\.windowscommunicationsapps_.*$", None, True, None, WindowMatchMode.TITLE_AND_CLASS, regex),
+        WindowMatchConfig(True, r"(?i)document 3\d* - NOTEPAD", None, r"(?i)Notepad\.exe", False, None, WindowMatchMode.TITLE_AND_APP, regex),
+        WindowMatchConfig(True, None, r"(?x) Chrome_WidgetWin_ \d  # 注释", None, False, None, WindowMatchMode.CLASS, regex),
+    ]
+    for config in configs:
+        if config.is_UWP:
+            config.package_name, config.window_class = config.window_class, None
+    return configs
+
+# 索引的结果和逐条规则匹配的结果不一致的窗口数，应当为 0
+def count_match_mismatches(index, configs: list, window_infos: list) -> int:
+    return sum(1 for info in window_infos
+               if index.get_is_matched(info) != any(info.get_is_matched_for_config(config) for config in configs))
+
+def bench_matching(sizes: List[int], rule_counts: List[int], repeat: int, seed: int) -> dict:
+    from WindowMatch import WindowMatchIndex
+    results = {}
+    for size in sizes:
+        core = create_core(size, seed)
+        core.refresh_all_windows()
+        window_infos = core.window_infos
+        size_results = {}
+        for rule_count in rule_counts:
+            configs = create_match_configs(core.backend, rule_count, seed)
+            index = WindowMatchIndex()
+            # 规则字段没有变化时 compile_pattern 会复用上次的编译结果，所以每次都用新生成的规则测量编译
+            rebuild = measure(lambda configs: index.rebuild(configs), repeat,
+                              setup=lambda: create_match_configs(core.backend, rule_count, seed))
+            index.rebuild(configs)
+            matched_count = sum(1 for info in window_infos if index.get_is_matched(info))
+            match = measure(lambda: [index.get_is_matched(info) for info in window_infos], repeat)
+            # 生成的规则加上含有位置断言和内联标志的规则，检查一次合并匹配的正确性，不计入耗时
+            # 无法编译的规则两边都不会匹配，比较结果时看不出来，也计入不一致的数量，这些规则都是合法的正则表达式
+            parity_configs = configs + create_anchored_match_configs(core.backend)
+            mismatches = count_match_mismatches(WindowMatchIndex(parity_configs), parity_configs, window_infos)
+            mismatches += sum(1 for config in parity_configs if config.pattern_error is not None)
+            if mismatches:
+                print(f"matching {size} 个窗口 x {rule_count} 条规则: {mismatches} 个窗口或规则的索引匹配结果和逐条匹配不一致", file=sys.stderr)
+            size_results[str(rule_count)] = {
+                'windows': len(window_infos),
+                'matched': matched_count,
+                'mismatches': mismatches,
+                'rebuild': rebuild,
+                'match_all': match,
+                'match_per_window_us': match['median_ms'] * 1000 / max(len(window_infos), 1),
+            }
+            print(f"matching {size:>6} 个窗口 x {rule_count:>5} 条规则: 编译 {rebuild['median_ms']:.2f} ms, "
+                  f"匹配 {match['median_ms']:.2f} ms（匹配到 {matched_count} 个）", file=sys.stderr)
+        results[str(size)] = size_results
+    return results
+
+
+# === render
+# 等待窗口创建时发起的后台刷新完成，并处理完成信号
+def wait_background_refresh(app, window):
+    while window.background_refresher.running:
+        app.processEvents()
+        time.sleep(0.001)
+    app.processEvents()
+
+def bench_render(sizes: List[int], repeat: int, seed: int) -> dict:
+    from PyQt5.QtWidgets import QApplication
+    from VirtualDesktopEnhancerWindow import VirtualDesktopEnhancerWindow
+    app = QApplication.instance()
+    results = {}
+    for size in sizes:
+        core = create_core(size, seed)
+        core.refresh_all_windows()
+        window = VirtualDesktopEnhancerWindow(core)
+        window.resize(800, 600)
+        window.show()
+        wait_background_refresh(app, window)
+
+        # 清空列表之后重新填充，相当于启动后的第一次显示
+        def clear_list():
+            window.window_list_model.set_window_rows([])
+            app.processEvents()
+        initial = measure(lambda _: window.refresh_window_list_content(), repeat, setup=clear_list)
+        unchanged = measure(window.refresh_window_list_content, repeat)
+
+        rng = random.Random(seed)
+        def churn():
+            churn_windows(core.backend, rng)
+            core.refresh_all_windows()
+        changed = measure(lambda _: window.refresh_window_list_content(), repeat, setup=churn)
+
+        # 启动时显示上次保存的快照，不枚举窗口
+        window.window_list_changed = True
+        window.save_window_snapshot()
+        snapshot = measure(lambda _: window.show_window_snapshot(), repeat, setup=clear_list)
+        window.snapshot_identities = None
+
+        viewport = window.all_windows_list.viewport()
+        paint = measure(lambda: viewport.grab(), repeat)
+
+        results[str(size)] = {
+            'rows': window.window_list_model.rowCount(),
+            'initial': initial,
+            'unchanged': unchanged,
+            'changed': changed,
+            'snapshot': snapshot,
+            'paint_viewport': paint,
+        }
+        print(f"render {size:>6} 个窗口: 首次 {initial['median_ms']:.2f} ms, 无变化 {unchanged['median_ms']:.2f} ms, "
+              f"部分变化 {changed['median_ms']:.2f} ms, 快照 {snapshot['median_ms']:.2f} ms, 绘制 {paint['median_ms']:.2f} ms",
+              file=sys.stderr)
+
+        window.icon_loader.cancel_all()
+        window.desktop_switch_coalescer.shutdown()
+        window.background_refresher.shutdown()
+        window.hide()
+        window.deleteLater()
+        app.processEvents()
+    return results
+
+
+# === icons
+# 生成样本图标文件：不同尺寸的 PNG（UWP logo 的格式）和包含多个尺寸的 ICO（exe 图标的格式，需要 Qt 的 ico 插件）
+def create_sample_icons(dir_name: str, count: int, seed: int) -> Dict[str, List[str]]:
+    from PyQt5.QtGui import QImage, QPainter, QColor
+    from PyQt5.QtCore import Qt
+    rng = random.Random(seed)
+    files = {'png': [], 'ico': []}
+    for i in range(count):
+        size = BENCHMARK_ICON_SIZES[i % len(BENCHMARK_ICON_SIZES)]
+        image = QImage(size, size, QImage.Format_ARGB32)
+        image.fill(Qt.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setBrush(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+        painter.setPen(Qt.NoPen)
+        painter.drawRoundedRect(size // 8, size // 8, size * 3 // 4, size * 3 // 4, size / 6, size / 6)
+        painter.end()
+        png_path = os.path.join(dir_name, f"logo_{i}_{size}.png")
+        if image.save(png_path, 'PNG'):
+            files['png'].append(png_path)
+        ico_path = os.path.join(dir_name, f"app_{i}.ico")
+        if image.scaled(48, 48, Qt.IgnoreAspectRatio, Qt.SmoothTransformation).save(ico_path, 'ICO'):
+            files['ico'].append(ico_path)
+    return files
+
+# 和 UWP 图标、exe 图标的处理相同：读取图片，缩放为 icon_resize，转换为图集使用的格式
+def decode_icon_file(path: str, icon_resize: int = BENCHMARK_ICON_RESIZE):
+    from PyQt5.QtGui import QImage
+    from PyQt5.QtCore import Qt
+    from IconAtlas import ICON_ATLAS_FORMAT
+    image = QImage(path)
+    if image.isNull():
+        return None
+    if image.width() != icon_resize or image.height() != icon_resize:
+        image = image.scaled(icon_resize, icon_resize, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image.convertToFormat(ICON_ATLAS_FORMAT)
+
+# exe 图标的转换使用 PIL：BGRA 像素 -> Image -> LANCZOS 缩放 -> ImageQt，PIL 不可用时跳过
+def decode_icon_file_with_PIL(path: str, icon_resize: int = BENCHMARK_ICON_RESIZE):
+    from PIL import Image, ImageQt
+    with Image.open(path) as img:
+        img = img.convert('RGBA')
+        if img.size != (icon_resize, icon_resize):
+            img = img.resize((icon_resize, icon_resize), Image.LANCZOS)
+        return ImageQt.ImageQt(img)
+
+def bench_icons(repeat: int, seed: int, dir_name: str) -> dict:
+    from IconCache import IconCache
+    from IconAtlas import IconAtlas
+    icon_dir = os.path.join(dir_name, 'icons')
+    os.makedirs(icon_dir, exist_ok=True)
+    files = create_sample_icons(icon_dir, BENCHMARK_ICON_COUNT, seed)
+    results = {'files': {kind: len(paths) for kind, paths in files.items()}}
+
+    for kind, paths in files.items():
+        if not paths:
+            continue
+        decode = measure(lambda: [decode_icon_file(path) for path in paths], repeat)
+        decode['per_icon_us'] = decode['median_ms'] * 1000 / len(paths)
+        results[f'decode_{kind}'] = decode
+        print(f"icons 解码 {len(paths)} 个 {kind}: {decode['median_ms']:.2f} ms", file=sys.stderr)
+
+    try:
+        from PIL import ImageQt
+        pil_available = hasattr(ImageQt, 'ImageQt')  # 较新的 Pillow 不再支持 PyQt5
+    except ImportError:
+        pil_available = False
+    if not pil_available:
+        results['decode_pil'] = None
+    else:
+        paths = files['ico'] or files['png']
+        decode = measure(lambda: [decode_icon_file_with_PIL(path) for path in paths], repeat)
+        decode['per_icon_us'] = decode['median_ms'] * 1000 / len(paths)
+        results['decode_pil'] = decode
+        print(f"icons PIL 解码 {len(paths)} 个: {decode['median_ms']:.2f} ms", file=sys.stderr)
+
+    # 键的形式和 AppUtility.get_icon_key_from_hwnd 相同
+    images = {('exe', path, 0.0, BENCHMARK_ICON_RESIZE): decode_icon_file(path) for path in files['png']}
+
+    def fill_cache():
+        cache = IconCache()
+        for key, image in images.items():
+            cache.put(key, image)
+        return cache
+    cache = fill_cache()
+    results['cache_put'] = measure(fill_cache, repeat)
+    results['cache_lookup'] = measure(lambda: [cache.lookup(key) for key in images], repeat)
+
+    atlas_paths = [os.path.join(dir_name, 'icon_atlas.0.bin'), os.path.join(dir_name, 'icon_atlas.1.bin')]
+
+    def save_atlas():
+        atlas = IconAtlas(atlas_paths)
+        for key, image in images.items():
+            atlas.put(key, image)
+        atlas.save()
+    results['atlas_save'] = measure(save_atlas, repeat)
+
+    def load_atlas():
+        atlas = IconAtlas(atlas_paths)
+        atlas.load()
+        return atlas
+    results['atlas_load'] = measure(load_atlas, repeat)
+    results['atlas_lookup'] = measure(lambda atlas: [atlas.lookup(key) for key in images], repeat, setup=load_atlas)
+    print(f"icons 图集: 保存 {results['atlas_save']['median_ms']:.2f} ms, 加载 {results['atlas_load']['median_ms']:.2f} ms, "
+          f"首次查找 {results['atlas_lookup']['median_ms']:.2f} ms", file=sys.stderr)
+    return results
+
+
+# === config
+def bench_config(rule_counts: List[int], repeat: int, seed: int, dir_name: str) -> dict:
+    from MatchConfigStore import MatchConfigStore
+    from WindowMatch import WindowMatchIndex
+    backend = create_backend(1000, seed)
+    results = {}
+    for rule_count in rule_counts:
+        configs = create_match_configs(backend, rule_count, seed)
+        store = MatchConfigStore(os.path.join(dir_name, f'match_configs_{rule_count}.json'))
+        save = measure(lambda: store.save(configs), repeat)
+        load = measure(lambda: MatchConfigStore(store.path).load(), repeat)
+        rng = random.Random(seed)
+        def change_one():
+            config = rng.choice(configs)
+            config.active = not config.active
+            return config
+        put = measure(lambda config: store.put(config, configs), repeat, setup=change_one)
+        index = WindowMatchIndex(configs)
+        rebuild_one = measure(lambda config: index.rebuild(configs), repeat, setup=change_one)
+        results[str(rule_count)] = {
+            'file_bytes': os.path.getsize(store.path),
+            'save': save,
+            'load': load,
+            'put': put,
+            'rebuild_one': rebuild_one,
+        }
+        print(f"config {rule_count:>5} 条规则: 保存 {save['median_ms']:.2f} ms, 加载 {load['median_ms']:.2f} ms, "
+              f"增量写入 {put['median_ms']:.2f} ms, 修改一条后编译 {rebuild_one['median_ms']:.2f} ms", file=sys.stderr)
+    return results
+
+
+def get_metadata(args) -> dict:
+    from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+    return {
+        'timestamp': time.time(),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'qt': QT_VERSION_STR,
+        'pyqt': PYQT_VERSION_STR,
+        'qt_platform': os.environ.get('QT_QPA_PLATFORM'),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'sizes': args.sizes,
+        'rules': args.rules,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual Desktop Enhancer benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', help="模拟窗口数量")
+    parser.add_argument('--rules', type=int, nargs='+', help="匹配规则数量")
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument('--seed', type=int, default=BENCHMARK_SEED)
+    parser.add_argument('--only', nargs='+', choices=['refresh', 'matching', 'render', 'icons', 'config'], help="只运行指定的基准")
+    parser.add_argument('--quick', action='store_true', help="只运行较小的规模")
+    parser.add_argument('--output', help="JSON 输出文件，默认输出到 stdout")
+    args = parser.parse_args()
+    if args.sizes is None:
+        args.sizes = BENCHMARK_QUICK_SIZES if args.quick else BENCHMARK_SIZES
+    if args.rules is None:
+        args.rules = BENCHMARK_QUICK_RULE_COUNTS if args.quick else BENCHMARK_RULE_COUNTS
+    benchmarks = args.only or ['refresh', 'matching', 'render', 'icons', 'config']
+
+    # 必须在创建 QApplication 之前设置
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    # 程序中的 print 输出到 stderr，stdout 只输出 JSON
+    with tempfile.TemporaryDirectory(prefix='vde_benchmark_') as dir_name, contextlib.redirect_stdout(sys.stderr):
+        os.environ['LOCALAPPDATA'] = dir_name  # 不读写真实的程序数据
+
+        from PyQt5.QtWidgets import QApplication
+        from StageTimings import get_stage_timings
+        app = QApplication.instance() or QApplication(sys.argv)
+
+        result = {'metadata': get_metadata(args)}
+        get_stage_timings().reset()
+        if 'refresh' in benchmarks:
+            result['refresh'] = bench_refresh(args.sizes, args.repeat, args.seed)
+        if 'matching' in benchmarks:
+            result['matching'] = bench_matching(args.sizes, args.rules, args.repeat, args.seed)
+        if 'render' in benchmarks:
+            result['render'] = bench_render(args.sizes, args.repeat, args.seed)
+        if 'icons' in benchmarks:
+            result['icons'] = bench_icons(args.repeat, args.seed, dir_name)
+        if 'config' in benchmarks:
+            result['config'] = bench_config(args.rules, args.repeat, args.seed, dir_name)
+        result['stage_timings'] = get_stage_timings().to_dict()['stages']
+
+    mismatches = sum(size_result['mismatches'] for size_results in result.get('matching', {}).values()
+                     for size_result in size_results.values())
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        from AppData import atomic_write_text
+        atomic_write_text(args.output, text)
+        print(f"结果已保存到 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# === 虚拟桌面切换事件
+# 事件源只负责发出 desktop_changed 信号：
+#   ShellHookEventSource      真实的 Windows 环境，通过 ShellHook 接收 HSHELL_VIRTUAL_DESKTOP_CHANGED
+#   SyntheticDesktopEventSource 配合 SimulatedWindowBackend 使用，可以模拟连续快速切换桌面
+# DesktopSwitchCoalescer 对事件做防抖：空闲时收到的第一个事件立即处理，之后 debounce_ms 内的一连串事件只在最后一个事件之后再处理一次，
+# 处理在后台线程中进行，处理过程中又收到新事件时，正在进行的处理会在下一步检查时放弃。
+
+import ctypes
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from PyQt5.QtCore import QObject, QTimer, QAbstractNativeEventFilter, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+
+
+DESKTOP_SWITCH_DEBOUNCE_MS = 150  # 最后一个切换事件之后等待的时间，Ctrl+Win+方向键连续切换时只处理最终的桌面
+DESKTOP_SWITCH_LATENCY_HISTORY = 100  # 保留最近多少次切换的延迟
+
+
+class DesktopEventSource(QObject):
+    desktop_changed = pyqtSignal()
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+        self.running: bool = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+
+class _ShellHookEventFilter(QAbstractNativeEventFilter):
+    def __init__(self, source: 'ShellHookEventSource'):
+        super().__init__()
+        self.source = source
+
+    def nativeEventFilter(self, eventType, message):
+        if eventType == b'windows_generic_MSG' and self.source.running:
+            msg = self.source._MSG.from_address(int(message))
+            if msg.message == self.source._WM_SHELLHOOKMESSAGE and msg.wParam == self.source._HSHELL_VIRTUAL_DESKTOP_CHANGED:
+                self.source.desktop_changed.emit()
+        return False, 0
+
+
+# 通过 ShellHook 接收虚拟桌面切换消息，hwnd 是接收消息的窗口（主窗口的 winId）
+class ShellHookEventSource(DesktopEventSource):
+    def __init__(self, hwnd: int, parent: QObject = None):
+        super().__init__(parent)
+        self.hwnd: int = hwnd
+        self._event_filter: _ShellHookEventFilter = None
+
+    def start(self):
+        if self._event_filter is None:
+            # ShellHook 依赖 win32api，只在真正开始监听时导入
+            from ShellHook import WM_SHELLHOOKMESSAGE, HSHELL_VIRTUAL_DESKTOP_CHANGED, MSG, RegisterShellHook
+            self._WM_SHELLHOOKMESSAGE = WM_SHELLHOOKMESSAGE
+            self._HSHELL_VIRTUAL_DESKTOP_CHANGED = HSHELL_VIRTUAL_DESKTOP_CHANGED
+            self._MSG = MSG
+            RegisterShellHook(self.hwnd)
+            self._event_filter = _ShellHookEventFilter(self)
+            QApplication.instance().installNativeEventFilter(self._event_filter)
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self._event_filter is not None:
+            QApplication.instance().removeNativeEventFilter(self._event_filter)
+            ctypes.windll.user32.DeregisterShellHookWindow(ctypes.c_void_p(int(self.hwnd)))
+            self._event_filter = None
+
+
+# 模拟的事件源，切换 SimulatedWindowBackend 的当前桌面并发出事件
+class SyntheticDesktopEventSource(DesktopEventSource):
+    def __init__(self, backend, parent: QObject = None):
+        super().__init__(parent)
+        self.backend = backend
+        self.emitted: int = 0
+
+    def switch_to(self, desktop_number: int, duplicate_count: int = 1):
+        self.backend.set_current_desktop_number(desktop_number)
+        if self.running:
+            # 真实环境中一次切换可能收到多条重复的消息
+            for _ in range(duplicate_count):
+                self.emitted += 1
+                self.desktop_changed.emit()
+
+    # 按 interval_ms 的间隔依次切换到 desktop_numbers 中的桌面，模拟连续快速切换
+    def switch_burst(self, desktop_numbers: List[int], interval_ms: int = 30, duplicate_count: int = 1):
+        for i, desktop_number in enumerate(desktop_numbers):
+            QTimer.singleShot(i * interval_ms, lambda desktop_number=desktop_number: self.switch_to(desktop_number, duplicate_count))
+
+
+# 对切换事件做防抖和合并，handler 在后台线程中调用，参数是判断本次处理是否已经过时的函数
+# handler 返回 False 表示处理没有完成（例如因为过时而放弃）
+class DesktopSwitchCoalescer(QObject):
+    # generation, 是否完成, 从事件到处理完成（最后一个窗口移动完）的延迟毫秒数
+    switch_handled = pyqtSignal(int, bool, float)
+
+    def __init__(self, handler: Callable[[Callable[[], bool]], bool], debounce_ms: int = DESKTOP_SWITCH_DEBOUNCE_MS, parent: QObject = None):
+        super().__init__(parent)
+        self.handler = handler
+        self.generation: int = 0  # 每收到一个事件加一，处理开始时记下，之后不相等就说明已经过时
+        self.events_received: int = 0
+        self.switches_handled: int = 0
+        self.switches_dropped: int = 0
+        self.latencies_ms: deque = deque(maxlen=DESKTOP_SWITCH_LATENCY_HISTORY)  # 完成的切换从事件到处理完成的延迟
+        self._last_event_time: float = 0.0
+        self._trailing_pending: bool = False
+        self._source: DesktopEventSource = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._on_debounce_timeout)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='desktop_switch')
+        self._lock = threading.Lock()
+
+    def attach(self, source: DesktopEventSource):
+        if self._source is not None:
+            self._source.desktop_changed.disconnect(self.on_desktop_changed)
+        self._source = source
+        if source is not None:
+            source.desktop_changed.connect(self.on_desktop_changed)
+
+    def on_desktop_changed(self):
+        with self._lock:
+            self.generation += 1
+            self.events_received += 1
+            self._last_event_time = time.perf_counter()
+        if self._timer.isActive():
+            self._trailing_pending = True  # 连续的事件，等最后一个之后再处理
+        else:
+            self._submit()  # 空闲时立即处理，不等待防抖
+        self._timer.start()  # 重新计时
+
+    # 放弃尚未开始和正在进行的处理
+    def cancel(self):
+        self._timer.stop()
+        self._trailing_pending = False
+        with self._lock:
+            self.generation += 1
+
+    def _submit(self):
+        with self._lock:
+            generation = self.generation
+            event_time = self._last_event_time
+        self._executor.submit(self._run, generation, event_time)
+
+    def _on_debounce_timeout(self):
+        if self._trailing_pending:
+            self._trailing_pending = False
+            self._submit()
+
+    def _run(self, generation: int, event_time: float):
+        is_stale = lambda: generation != self.generation
+        if is_stale():
+            completed = False
+        else:
+            try:
+                completed = self.handler(is_stale)
+            except Exception as e:
+                print(f"处理虚拟桌面切换失败: {e}")
+                completed = False
+        latency_ms = (time.perf_counter() - event_time) * 1000
+        with self._lock:
+            if completed:
+                self.switches_handled += 1
+                self.latencies_ms.append(latency_ms)
+            else:
+                self.switches_dropped += 1
+        if completed:
+            print(f"虚拟桌面切换处理完成，从事件到最后一个窗口移动完用时 {latency_ms:.1f} ms")
+        self.switch_handled.emit(generation, completed, latency_ms)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+# === 磁盘上的图标图集
+# 把解码后的图标（32x32 以及高 DPI 尺寸）保存到用户目录下的图集文件中，下次启动时通过内存映射直接构造 QImage，
+# 不需要复制像素数据，也不需要再从 exe 或 UWP 包中提取图标。
+# 键和 IconCache 相同，exe 的键包含修改时间，exe 更新后旧的条目不会再被命中，保存时按最近使用淘汰。
+#
+# 文件格式（小端）：
+#   8 字节 ICON_ATLAS_MAGIC | 4 字节 generation | 4 字节 index 长度 | index (UTF-8 JSON) | 对齐填充 | 像素数据
+#   index 中每个条目为 {"key": [...], "w": 宽, "h": 高, "bpl": 每行字节数, "offset": 相对像素数据起始的偏移}
+#   w 为 0 表示这个键没有图标
+#
+# 正在被映射的文件在 Windows 上无法被替换，所以图集有两个槽位交替写入，加载时使用 generation 较大的一个。
+# 已经映射的槽位在进程退出前一直保持映射，从中构造的 QImage 始终有效。
+
+import ctypes
+import json
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from PyQt5 import sip
+from PyQt5.QtGui import QImage
+
+from AppData import get_app_data_path, atomic_write_bytes
+
+
+ICON_ATLAS_FILE_NAMES = ("icon_atlas.0.bin", "icon_atlas.1.bin")
+ICON_ATLAS_MAGIC = b'VDEICON1'
+ICON_ATLAS_MAX_ENTRIES = 4096
+ICON_ATLAS_FORMAT = QImage.Format_ARGB32_Premultiplied
+_HEADER = struct.Struct('<8sII')
+_ALIGNMENT = 16
+
+
+def _align(value: int) -> int:
+    return (value + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+# JSON 中的键是列表，转换回元组才能作为字典的键
+def _key_from_json(value) -> tuple:
+    return tuple(_key_from_json(item) if isinstance(item, list) else item for item in value)
+
+def _get_image_bytes(image: QImage) -> bytes:
+    pointer = image.constBits()
+    pointer.setsize(image.bytesPerLine() * image.height())
+    return bytes(pointer)
+
+
+class IconAtlas:
+    def __init__(self, paths: List[str] = None, max_entries: int = ICON_ATLAS_MAX_ENTRIES):
+        self.paths: List[str] = paths if paths is not None else [get_app_data_path(name) for name in ICON_ATLAS_FILE_NAMES]
+        self.max_entries: int = max_entries
+        self.generation: int = 0
+        self.loaded_slot: int = None  # 当前映射的槽位
+        self.hits: int = 0
+        self.misses: int = 0
+        self._mmap: mmap.mmap = None
+        self._base_address: int = 0
+        self._data_start: int = 0
+        self._entries: Dict[tuple, dict] = {}  # 映射文件中的条目
+        self._images: Dict[tuple, QImage] = {}  # 已经从映射文件中构造的 QImage
+        self._pending: 'OrderedDict[tuple, QImage]' = OrderedDict()  # 本次运行中新提取的图标，保存后仍然保留，供之后的查找使用
+        self._dirty: bool = False
+        self._used_keys: 'OrderedDict[tuple, None]' = OrderedDict()  # 本次运行中用到的键，保存时优先保留
+        self._lock = threading.RLock()
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def _mark_used(self, key: tuple):
+        self._used_keys[key] = None
+        self._used_keys.move_to_end(key)
+
+    def _read_header(self, path: str) -> tuple:
+        try:
+            with open(path, 'rb') as f:
+                magic, generation, index_length = _HEADER.unpack(f.read(_HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != ICON_ATLAS_MAGIC:
+            return None
+        return generation, index_length
+
+    # 加载 generation 最大的有效槽位，文件不存在或损坏时返回 False
+    def load(self) -> bool:
+        with self._lock:
+            candidates = []
+            for slot, path in enumerate(self.paths):
+                header = self._read_header(path)
+                if header is not None:
+                    candidates.append((header[0], slot))
+            for generation, slot in sorted(candidates, reverse=True):
+                if self._map_slot(slot):
+                    return True
+            return False
+
+    def _map_slot(self, slot: int) -> bool:
+        path = self.paths[slot]
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            return False
+        try:
+            magic, generation, index_length = _HEADER.unpack_from(mapped, 0)
+            index = json.loads(bytes(mapped[_HEADER.size:_HEADER.size + index_length]).decode('utf-8'))
+            data_start = _align(_HEADER.size + index_length)
+            entries = {}
+            for entry in index:
+                end = data_start + entry['offset'] + entry['bpl'] * entry['h']
+                if end > len(mapped):
+                    raise ValueError("图集条目超出文件范围")
+                entries[_key_from_json(entry['key'])] = entry
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            print(f"图标图集 {path} 无效: {e}")
+            mapped.close()
+            return False
+
+        self._mmap = mapped
+        # 映射在进程退出前不会关闭，QImage 直接引用其中的像素数据
+        self._base_address = ctypes.addressof(ctypes.c_char.from_buffer(mapped))
+        self._data_start = data_start
+        self._entries = entries
+        self._images = {}
+        self.generation = generation
+        self.loaded_slot = slot
+        return True
+
+    # 查找图标，找到时返回 (True, 图标)，图标可能是 None（这个键没有图标）
+    def lookup(self, key: tuple) -> tuple:
+        with self._lock:
+            if key in self._pending:
+                self._mark_used(key)
+                return True, self._pending[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            self._mark_used(key)
+            if entry['w'] == 0:
+                return True, None
+            image = self._images.get(key)
+            if image is None:
+                address = self._base_address + self._data_start + entry['offset']
+                image = QImage(sip.voidptr(address), entry['w'], entry['h'], entry['bpl'], ICON_ATLAS_FORMAT)
+                self._images[key] = image
+            return True, image
+
+    def put(self, key: tuple, image: QImage):
+        with self._lock:
+            if image is not None and image.format() != ICON_ATLAS_FORMAT:
+                image = image.convertToFormat(ICON_ATLAS_FORMAT)
+            self._pending[key] = image
+            self._mark_used(key)
+            self._dirty = True
+
+    # 写入未映射的槽位，本次用到的条目优先，其次是旧图集中的条目，总数不超过 max_entries
+    def save(self) -> bool:
+        with self._lock:
+            if not self.dirty:
+                return True
+            keys = list(reversed(self._used_keys))
+            keys += [key for key in self._entries if key not in self._used_keys]
+            keys = keys[:self.max_entries]
+
+            index = []
+            blocks = []
+            offset = 0
+            for key in keys:
+                if key in self._pending:
+                    image = self._pending[key]
+                    if image is None:
+                        width, height, bytes_per_line, data = 0, 0, 0, b''
+                    else:
+                        width, height, bytes_per_line = image.width(), image.height(), image.bytesPerLine()
+                        data = _get_image_bytes(image)
+                else:
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        continue
+                    width, height, bytes_per_line = entry['w'], entry['h'], entry['bpl']
+                    start = self._data_start + entry['offset']
+                    data = bytes(self._mmap[start:start + bytes_per_line * height])
+                index.append({'key': list(key), 'w': width, 'h': height, 'bpl': bytes_per_line, 'offset': offset})
+                padded_length = _align(len(data))
+                blocks.append(data + b'\0' * (padded_length - len(data)))
+                offset += padded_length
+
+            index_bytes = json.dumps(index, ensure_ascii=False).encode('utf-8')
+            generation = self.generation + 1
+            header = _HEADER.pack(ICON_ATLAS_MAGIC, generation, len(index_bytes)) + index_bytes
+            header += b'\0' * (_align(len(header)) - len(header))
+
+            slot = 0 if self.loaded_slot is None else 1 - self.loaded_slot
+            try:
+                atomic_write_bytes(self.paths[slot], header + b''.join(blocks))
+            except OSError as e:
+                print(f"保存图标图集失败: {e}")
+                return False
+            self.generation = generation
+            self._dirty = False
+            return True
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'slot': self.loaded_slot,
+                'generation': self.generation,
+                'entries': len(self._entries),
+                'pending': len(self._pending),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_icon_atlas: IconAtlas = None
+
+# 获取图标图集，第一次调用时从磁盘加载
+def get_icon_atlas() -> IconAtlas:
+    global _icon_atlas
+    if _icon_atlas is None:
+        _icon_atlas = IconAtlas()
+        _icon_atlas.load()
+    return _icon_atlas
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# === 进程内图标缓存
+# 键由 AppUtility.get_icon_key_from_hwnd 生成：
+#   ('exe', exe 路径, exe 修改时间, 尺寸)
+#   ('uwp', UWP 包全名, 应用 exe 名, 尺寸)
+# 同一个 exe 的所有窗口共用一个图标，exe 更新后修改时间变化，旧的条目会被自然淘汰
+# 可以设置一个 backing_store（例如 IconAtlas），内存中未命中时先查找它，新加载的图标也会写入它
+# IconLoader 的多个线程可能同时加载同一个键，get_or_load 对同一个键只调用一次 loader，其余的线程等待它的结果
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+
+ICON_CACHE_MAX_BYTES = 16 * 1024 * 1024  # 默认内存预算，32x32 的 ARGB 图标约 4KB
+
+
+# 正在加载的键，等待的线程通过 event 取得结果
+class _PendingLoad:
+    def __init__(self):
+        self.event = threading.Event()
+        self.image = None
+        self.failed: bool = False  # loader 抛出异常，等待的线程自己重新加载
+
+
+def _get_image_bytes(image) -> int:
+    if image is None:
+        return 0
+    try:
+        return image.sizeInBytes()
+    except AttributeError:
+        return image.byteCount()
+
+
+# 按内存预算做 LRU 淘汰的图标缓存，提取失败的结果（None）也会缓存，避免反复提取
+class IconCache:
+    def __init__(self, max_bytes: int = ICON_CACHE_MAX_BYTES):
+        self.max_bytes: int = max_bytes
+        self.total_bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.store_hits: int = 0  # 内存中未命中、但在 backing_store 中命中的次数
+        self.load_waits: int = 0  # 等待其他线程加载同一个键的次数
+        self.backing_store = None  # 需要提供 lookup(key) -> (found, image) 和 put(key, image)
+        self._entries: 'OrderedDict[Hashable, object]' = OrderedDict()
+        self._entry_bytes: Dict[Hashable, int] = {}
+        self._loading: Dict[Hashable, _PendingLoad] = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    # 查找图标，找到时返回 (True, 图标)，图标可能是缓存的 None
+    def lookup(self, key: Hashable) -> tuple:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def get(self, key: Hashable):
+        _found, image = self.lookup(key)
+        return image
+
+    def set_backing_store(self, backing_store):
+        self.backing_store = backing_store
+
+    def put(self, key: Hashable, image, persist: bool = True):
+        if persist and self.backing_store is not None:
+            self.backing_store.put(key, image)
+        size = _get_image_bytes(image)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entry_bytes.pop(key)
+                del self._entries[key]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = image
+            self._entry_bytes[key] = size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self._entries:
+                old_key, _old_image = self._entries.popitem(last=False)
+                self.total_bytes -= self._entry_bytes.pop(old_key)
+                self.evictions += 1
+
+    # 依次查找内存和 backing_store，不加载，找到时返回 (True, 图标)
+    def lookup_stored(self, key: Hashable) -> tuple:
+        found, image = self.lookup(key)
+        if found:
+            return True, image
+        if self.backing_store is not None:
+            found, image = self.backing_store.lookup(key)
+            if found:
+                with self._lock:
+                    self.store_hits += 1
+                self.put(key, image, persist=False)
+                return True, image
+        return False, None
+
+    # 缓存未命中时调用 loader 加载并放入缓存，同一个键同时只有一个线程加载
+    def get_or_load(self, key: Hashable, loader: Callable[[], object]):
+        while True:
+            found, image = self.lookup_stored(key)
+            if found:
+                return image
+            with self._lock:
+                if key in self._entries:  # 查找之后其他线程刚好加载完成
+                    continue
+                pending = self._loading.get(key)
+                is_owner = pending is None
+                if is_owner:
+                    pending = self._loading[key] = _PendingLoad()
+                else:
+                    self.load_waits += 1
+            if is_owner:
+                break
+            pending.event.wait()
+            if not pending.failed:
+                return pending.image
+
+        try:
+            image = loader()
+        except BaseException:
+            pending.failed = True
+            raise
+        else:
+            pending.image = image
+            self.put(key, image)
+            return image
+        finally:
+            with self._lock:
+                del self._loading[key]
+            pending.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._entry_bytes.clear()
+            self.total_bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'store_hits': self.store_hits,
+                'load_waits': self.load_waits,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_icon_cache: IconCache = None
+
+def get_icon_cache() -> IconCache:
+    global _icon_cache
+    if _icon_cache is None:
+        _icon_cache = IconCache()
+    return _icon_cache
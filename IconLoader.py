@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# === 后台图标加载
+# 图标提取在线程池中进行，结果通过信号回到 GUI 线程。
+# 每次刷新列表时调用 begin_generation，尚未开始的旧请求会被取消，已经在运行的旧请求的结果会被丢弃。
+
+import threading
+import time
+from typing import Dict, Iterable, List
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from WindowBackend import get_window_backend
+from StageTimings import get_stage_timings, STAGE_ICON
+
+
+ICON_LOADER_MAX_THREADS = 4
+ICON_PRIORITY_VISIBLE = 10  # 当前可见的行优先加载
+ICON_PRIORITY_NORMAL = 0
+
+
+class _IconLoadTask(QRunnable):
+    def __init__(self, loader: 'IconLoader', generation: int, hwnd: int, icon_resize: int):
+        super().__init__()
+        self.setAutoDelete(False)  # 任务对象由 IconLoader 持有，可以在开始前被取出重新排队
+        self.loader: 'IconLoader' = loader
+        self.generation: int = generation
+        self.hwnd: int = hwnd
+        self.icon_resize: int = icon_resize
+        self.finished: bool = False
+
+    def run(self):
+        try:
+            if not self.loader.is_current_generation(self.generation):
+                return
+            image = None
+            key = None
+            start = time.perf_counter()
+            try:
+                image, key = get_window_backend().get_window_icon_and_key(self.hwnd, self.icon_resize)
+            except Exception as e:
+                print(f"hwnd: {self.hwnd} 提取图标失败: {e}")
+            get_stage_timings().lap(STAGE_ICON, start)
+            self.loader.on_task_finished(self, image, key)
+        finally:
+            self.finished = True
+
+
+class IconLoader(QObject):
+    # generation, hwnd, 图标（没有图标时为空的 QImage）
+    icon_ready = pyqtSignal(int, int, QImage)
+
+    def __init__(self, parent: QObject = None, max_threads: int = ICON_LOADER_MAX_THREADS, icon_resize: int = 32):
+        super().__init__(parent)
+        self.icon_resize: int = icon_resize
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self._generation: int = 0
+        self._pending: Dict[int, _IconLoadTask] = {}  # hwnd -> 尚未完成的任务
+        self._tasks: List[_IconLoadTask] = []  # 交给线程池的任务，线程池不负责释放，运行结束后的下一轮再释放
+        self._images: Dict[int, QImage] = {}  # hwnd -> 已经加载的图标，窗口句柄不变时下次刷新直接使用
+        self._icon_keys: Dict[int, tuple] = {}  # hwnd -> 图标的缓存键，保存在窗口快照中
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def is_current_generation(self, generation: int) -> bool:
+        return generation == self._generation
+
+    # 开始新的一轮加载，取消尚未开始的请求，只保留 alive_hwnds 中窗口的图标
+    def begin_generation(self, alive_hwnds: Iterable[int] = None) -> int:
+        with self._lock:
+            self._generation += 1
+            cancelled = set()
+            for task in self._pending.values():
+                if self._pool.tryTake(task):
+                    cancelled.add(id(task))
+            self._pending = {}
+            self._tasks = [task for task in self._tasks if not task.finished and id(task) not in cancelled]
+            if alive_hwnds is not None:
+                alive_hwnds = set(alive_hwnds)
+                self._images = {hwnd: image for hwnd, image in self._images.items() if hwnd in alive_hwnds}
+                self._icon_keys = {hwnd: key for hwnd, key in self._icon_keys.items() if hwnd in alive_hwnds}
+            return self._generation
+
+    # 已经加载过的图标，没有时返回 None
+    def get_loaded_icon(self, hwnd: int) -> QImage:
+        with self._lock:
+            return self._images.get(hwnd)
+
+    def get_icon_key(self, hwnd: int) -> tuple:
+        with self._lock:
+            return self._icon_keys.get(hwnd)
+
+    # 从窗口快照中恢复的图标键，图标已经从图集中取出，不需要加载
+    def set_icon_key(self, hwnd: int, key: tuple):
+        with self._lock:
+            self._icon_keys[hwnd] = key
+
+    # 窗口句柄被新的窗口重新使用时丢弃旧的图标
+    def discard(self, hwnd: int):
+        with self._lock:
+            self._images.pop(hwnd, None)
+            self._icon_keys.pop(hwnd, None)
+
+    # 请求加载图标，已经在排队的请求会按新的优先级重新排队
+    def request(self, hwnd: int, priority: int = ICON_PRIORITY_NORMAL):
+        with self._lock:
+            if hwnd in self._images:
+                return
+            task = self._pending.get(hwnd)
+            if task is not None:
+                if not self._pool.tryTake(task):
+                    return  # 已经在运行
+            else:
+                task = _IconLoadTask(self, self._generation, hwnd, self.icon_resize)
+                self._pending[hwnd] = task
+                self._tasks.append(task)
+            self._pool.start(task, priority)
+
+    def cancel_all(self):
+        self.begin_generation()
+
+    def on_task_finished(self, task: _IconLoadTask, image: QImage, key: tuple = None):
+        with self._lock:
+            if task.generation != self._generation:
+                return
+            if self._pending.get(task.hwnd) is task:
+                del self._pending[task.hwnd]
+            if image is None:
+                image = QImage()
+            self._images[task.hwnd] = image
+            if key is not None:
+                self._icon_keys[task.hwnd] = key
+        self.icon_ready.emit(task.generation, task.hwnd, image)
@@ -1,22 +1,138 @@
 # -*- coding: utf-8 -*-
 
-import wrapt
-from line_profiler import LineProfiler
+# === 按需开启的逐行性能分析
+# 用 @lp_wrapper 标记的函数在导入时登记一次，默认不分析，调用时只多一次属性检查。
+# 开启方式：环境变量 VDE_PROFILE=1，或者托盘菜单中的 "Line Profiling"。
+# 开启后统计在多次调用之间累积，每隔 snapshot_interval 秒把完整统计写入程序数据目录下的 line_profile.txt，不输出到 stdout，
+# 关闭时再写一次。line_profiler 只在第一次开启时导入。
 
-lp = LineProfiler()
+import functools
+import io
+import os
+import threading
+from typing import Callable, List
 
-def _lp_wrapper():
-    @wrapt.decorator
-    def wrapper(func, instance, args, kwargs):
-        global lp
-        lp_wrapper = lp(func)
-        res = lp_wrapper(*args, **kwargs)
-        lp.print_stats()
-        return res
+from AppData import get_app_data_path, atomic_write_text
+
+
+PROFILE_ENV_VAR = 'VDE_PROFILE'  # 非空且不为 0 时启动即开启
+PROFILE_INTERVAL_ENV_VAR = 'VDE_PROFILE_INTERVAL'  # 快照间隔，单位秒
+PROFILE_SNAPSHOT_INTERVAL = 30.0
+PROFILE_FILE_NAME = "line_profile.txt"
+
+
+class LineProfilerController:
+    def __init__(self, snapshot_interval: float = PROFILE_SNAPSHOT_INTERVAL):
+        self.enabled: bool = False  # lp_wrapper 包装的函数每次调用只检查这个属性
+        self.functions: List[Callable] = []
+        self.snapshot_interval: float = snapshot_interval
+        self.snapshot_path: str = None  # None 时写入程序数据目录
+        self._profiler = None
+        self._timer: threading.Timer = None
+        self._lock = threading.RLock()
+
+    def register(self, func: Callable):
+        with self._lock:
+            self.functions.append(func)
+            if self._profiler is not None:
+                self._profiler.add_function(func)
+
+    # 开启分析，line_profiler 不可用时返回 False
+    def enable(self) -> bool:
+        with self._lock:
+            if self.enabled:
+                return True
+            if self._profiler is None:
+                try:
+                    from line_profiler import LineProfiler
+                except ImportError as e:
+                    print(f"无法开启逐行性能分析: {e}")
+                    return False
+                self._profiler = LineProfiler()
+                for func in self.functions:
+                    self._profiler.add_function(func)
+            self.enabled = True
+            self._schedule_snapshot()
+            return True
+
+    # 关闭分析并写入一次快照，返回快照路径
+    def disable(self) -> str:
+        with self._lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return self.write_snapshot()
+
+    def set_enabled(self, enabled: bool) -> bool:
+        if enabled:
+            return self.enable()
+        self.disable()
+        return True
+
+    def _schedule_snapshot(self):
+        self._timer = threading.Timer(self.snapshot_interval, self._on_snapshot_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_snapshot_timer(self):
+        self.write_snapshot()
+        with self._lock:
+            if self.enabled:
+                self._schedule_snapshot()
+
+    # 把目前累积的统计写入文件，返回文件路径，从未开启过时返回 None
+    def write_snapshot(self, path: str = None) -> str:
+        with self._lock:
+            if self._profiler is None:
+                return None
+            stream = io.StringIO()
+            self._profiler.print_stats(stream=stream)
+        if path is None:
+            path = self.snapshot_path if self.snapshot_path is not None else get_app_data_path(PROFILE_FILE_NAME)
+        try:
+            atomic_write_text(path, stream.getvalue())
+        except OSError as e:
+            print(f"保存逐行性能分析结果失败: {e}")
+            return None
+        return path
+
+    def call(self, func: Callable, args: tuple, kwargs: dict):
+        profiler = self._profiler
+        profiler.enable_by_count()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable_by_count()
+
+
+_controller = LineProfilerController()
+
+def get_line_profiler_controller() -> LineProfilerController:
+    return _controller
+
+def lp_wrapper(func: Callable) -> Callable:
+    _controller.register(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _controller.enabled:
+            return func(*args, **kwargs)
+        return _controller.call(func, args, kwargs)
 
     return wrapper
 
-lp_wrapper = _lp_wrapper()
+
+_interval = os.environ.get(PROFILE_INTERVAL_ENV_VAR)
+if _interval:
+    try:
+        _controller.snapshot_interval = float(_interval)
+    except ValueError:
+        print(f"{PROFILE_INTERVAL_ENV_VAR} 无效: {_interval}")
+if os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0'):
+    _controller.enable()
 
 # @lp_wrapper
 # def demo():
@@ -24,4 +140,4 @@ lp_wrapper = _lp_wrapper()
 #     i = 1
 #     print(i)
 
-# # demo()
\ No newline at end of file
+# # demo()
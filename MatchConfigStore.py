@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+# === 匹配规则的持久化存储
+# 规则保存在程序数据目录下的两个文件中：
+#   match_configs.json     完整快照，{"version": 1, "fields": [...], "next_id": n, "configs": [[...], ...]}，每条规则是按 fields 顺序排列的数组，
+#                          比每条规则一个对象小得多，几千条规则也只需要一次 json.loads
+#   match_configs.journal  增量日志，每行一条 JSON 记录：{"op": "put", "config": [...]} 或 {"op": "remove", "id": n}
+# 单条规则变化时只向日志追加一行，日志记录数超过快照规则数的一定比例时合并为新的快照并清空日志。
+# 快照通过临时文件加替换原子写入。日志按规则 id 覆盖或删除，重复回放结果不变，所以写完快照、清空日志之前中断也不会出错；
+# 日志中写了一半的行（写入时中断）会被忽略，下一次追加从新的一行开始。
+#
+# 其他进程（或用户手动）修改文件后，has_changed 根据两个文件的修改时间、大小和 inode 判断是否需要重新加载，
+# 本进程自己的写入会更新记录的文件状态，不会触发重新加载。
+
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from AppData import get_app_data_path, atomic_write_text
+from WindowMatch import WindowMatchConfig, WindowMatchMode, WindowMatchPatternType
+
+
+MATCH_CONFIG_FILE_NAME = "match_configs.json"
+MATCH_CONFIG_JOURNAL_SUFFIX = ".journal"
+MATCH_CONFIG_FORMAT_VERSION = 1
+MATCH_CONFIG_FIELDS = ['id', 'active', 'title', 'window_class', 'app_name', 'is_UWP', 'package_name', 'match_mode', 'pattern_type']
+MATCH_CONFIG_JOURNAL_MIN_ENTRIES = 64  # 日志记录数超过 max(这个值, 规则数 / 4) 时合并为快照
+
+
+# 文件状态 (修改时间, 大小, inode)，文件不存在时为 None
+def _get_file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def config_to_row(config: WindowMatchConfig) -> list:
+    return [config.config_id, bool(config.active), config.title, config.window_class, config.app_name, bool(config.is_UWP),
+            config.package_name, config.match_mode.name, config.pattern_type.name]
+
+# 字段无效时返回 None
+def row_to_config(row: list) -> Optional[WindowMatchConfig]:
+    try:
+        config_id, active, title, window_class, app_name, is_UWP, package_name, match_mode, pattern_type = row
+        return WindowMatchConfig(active, title, window_class, app_name, is_UWP, package_name,
+                                 WindowMatchMode[match_mode], WindowMatchPatternType[pattern_type], config_id=int(config_id))
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"忽略无效的匹配规则: {row}，{e!r}")
+        return None
+
+# 两组规则的内容是否相同，文件只是被重新保存过时不需要重新编译
+def get_is_same_configs(configs: List[WindowMatchConfig], other_configs: List[WindowMatchConfig]) -> bool:
+    return [config_to_row(config) for config in configs] == [config_to_row(config) for config in other_configs]
+
+
+class MatchConfigStore:
+    def __init__(self, path: str = None):
+        self.path: str = path if path is not None else get_app_data_path(MATCH_CONFIG_FILE_NAME)
+        self.journal_path: str = self.path + MATCH_CONFIG_JOURNAL_SUFFIX
+        self.read_only: bool = False  # 文件版本比程序新时不写入，避免覆盖
+        self.next_id: int = 1
+        self._rows: Dict[int, list] = {}  # id -> 规则数组，和磁盘上的内容一致，按插入顺序
+        self._journal_entries: int = 0
+        self._signature: tuple = None  # 最近一次读写后两个文件的状态
+
+    def _get_signature(self) -> tuple:
+        return (_get_file_signature(self.path), _get_file_signature(self.journal_path))
+
+    # 文件是否被其他程序修改过，只调用两次 stat
+    def has_changed(self) -> bool:
+        return self._get_signature() != self._signature
+
+    # 读取快照并回放日志，返回按保存顺序排列的规则，文件不存在时返回空列表
+    def load(self) -> List[WindowMatchConfig]:
+        signature = self._get_signature()
+        rows: Dict[int, list] = {}
+        next_id = 1
+        self.read_only = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            version = data.get('version')
+            if version != MATCH_CONFIG_FORMAT_VERSION:
+                print(f"不支持的匹配规则文件版本: {version}，不加载也不覆盖 {self.path}")
+                self.read_only = True
+                self._rows = {}
+                self._signature = signature
+                return []
+            fields = data.get('fields', MATCH_CONFIG_FIELDS)
+            if fields != MATCH_CONFIG_FIELDS:
+                # 字段顺序不同（手动编辑过），按名称重新排列
+                order = [fields.index(name) if name in fields else None for name in MATCH_CONFIG_FIELDS]
+                reorder = lambda row: [row[i] if i is not None and i < len(row) else None for i in order]
+            else:
+                reorder = None
+            for row in data.get('configs', []):
+                if reorder is not None:
+                    row = reorder(row)
+                if isinstance(row, list) and row and isinstance(row[0], int):
+                    rows[row[0]] = row
+            next_id = data.get('next_id', 1)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"读取匹配规则文件失败: {self.path}，{e!r}")
+
+        journal_entries = 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if entry['op'] == 'put':
+                            row = entry['config']
+                            rows[row[0]] = row  # 修改的规则保持原来的位置，和内存中的顺序一致
+                        elif entry['op'] == 'remove':
+                            rows.pop(entry['id'], None)
+                    except (ValueError, KeyError, TypeError, IndexError):
+                        continue  # 写了一半的行
+                    journal_entries += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"读取匹配规则日志失败: {self.journal_path}，{e!r}")
+
+        configs = []
+        for row in rows.values():
+            config = row_to_config(row)
+            if config is not None:
+                configs.append(config)
+        self._rows = {config.config_id: config_to_row(config) for config in configs}
+        self.next_id = max([next_id] + [config_id + 1 for config_id in self._rows])
+        self._journal_entries = journal_entries
+        self._signature = signature
+        return configs
+
+    def _assign_id(self, config: WindowMatchConfig):
+        if config.config_id is None:
+            config.config_id = self.next_id
+        self.next_id = max(self.next_id, config.config_id + 1)
+
+    # 把所有规则写入新的快照并清空日志，path 不为 None 时另存为其他文件，不影响当前的存储
+    def save(self, configs: List[WindowMatchConfig], path: str = None) -> bool:
+        if self.read_only and path is None:
+            print(f"匹配规则文件版本不受支持，不覆盖 {self.path}")
+            return False
+        for config in configs:
+            self._assign_id(config)
+        rows = [config_to_row(config) for config in configs]
+        text = json.dumps({'version': MATCH_CONFIG_FORMAT_VERSION, 'fields': MATCH_CONFIG_FIELDS, 'next_id': self.next_id,
+                           'configs': rows}, ensure_ascii=False, separators=(',', ':'))
+        try:
+            atomic_write_text(path if path is not None else self.path, text)
+            if path is None:
+                atomic_write_text(self.journal_path, '')
+        except OSError as e:
+            print(f"保存匹配规则失败: {e}")
+            return False
+        if path is None:
+            self._rows = {row[0]: row for row in rows}
+            self._journal_entries = 0
+            self._signature = self._get_signature()
+        return True
+
+    def _append_journal(self, entry: dict) -> bool:
+        if self.read_only:
+            print(f"匹配规则文件版本不受支持，不覆盖 {self.path}")
+            return False
+        try:
+            line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+            with open(self.journal_path, 'a+b') as f:
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        line = b'\n' + line  # 上一次写入中断，不能接在写了一半的行后面
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"写入匹配规则日志失败: {e}")
+            return False
+        self._journal_entries += 1
+        self._signature = self._get_signature()
+        return True
+
+    def _get_should_compact(self) -> bool:
+        return self._journal_entries > max(MATCH_CONFIG_JOURNAL_MIN_ENTRIES, len(self._rows) // 4)
+
+    # 新增或修改一条规则，configs 是修改后的全部规则，日志过长时用它写入新的快照
+    def put(self, config: WindowMatchConfig, configs: List[WindowMatchConfig]) -> bool:
+        self._assign_id(config)
+        row = config_to_row(config)
+        if self._rows.get(config.config_id) == row:
+            return True
+        if not self._append_journal({'op': 'put', 'config': row}):
+            return False
+        self._rows[config.config_id] = row
+        if self._get_should_compact():
+            return self.save(configs)
+        return True
+
+    def remove(self, config: WindowMatchConfig, configs: List[WindowMatchConfig]) -> bool:
+        if config.config_id is None or config.config_id not in self._rows:
+            return True
+        if not self._append_journal({'op': 'remove', 'id': config.config_id}):
+            return False
+        del self._rows[config.config_id]
+        if self._get_should_compact():
+            return self.save(configs)
+        return True
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# === 窗口解析流程各阶段的耗时统计
+# 一直开启，每次记录只需要一次 perf_counter 和一次二分查找，结果汇总到固定分桶的直方图中，可以估算 p50 / p95 / p99。
+# 单个窗口的阶段（class、title、pid、pin、desktop、app_name、icon）每个窗口记录一次，
+# 整体的阶段（enumerate、match、ui_apply、refresh）每次刷新记录一次。
+#
+# 用法：
+#   timings = get_stage_timings()
+#   start = time.perf_counter()
+#   ...
+#   start = timings.lap(STAGE_CLASS, start)  # 记录 STAGE_CLASS 的耗时，返回当前时间作为下一阶段的起点
+
+import bisect
+import json
+import threading
+import time
+from typing import Dict, List
+
+from AppData import get_app_data_path, atomic_write_text
+
+
+STAGE_ENUMERATE = 'enumerate'
+STAGE_CLASS = 'class'
+STAGE_TITLE = 'title'
+STAGE_PID = 'pid'
+STAGE_PIN = 'pin'
+STAGE_DESKTOP = 'desktop'
+STAGE_APP_NAME = 'app_name'
+STAGE_ICON = 'icon'
+STAGE_MATCH = 'match'
+STAGE_UI_APPLY = 'ui_apply'
+STAGE_REFRESH = 'refresh'
+
+STAGE_ORDER = [STAGE_ENUMERATE, STAGE_CLASS, STAGE_TITLE, STAGE_PID, STAGE_PIN, STAGE_DESKTOP,
+               STAGE_APP_NAME, STAGE_ICON, STAGE_MATCH, STAGE_UI_APPLY, STAGE_REFRESH]
+
+STAGE_TIMINGS_FILE_NAME = "stage_timings.json"
+
+# 分桶上界（秒）：1us 到约 17s，每个桶比上一个大 2^(1/4) 倍，百分位数的相对误差不超过约 19%
+HISTOGRAM_BUCKET_BOUNDS: List[float] = [1e-6 * 2 ** (i / 4) for i in range(97)]
+
+
+# 固定分桶的耗时直方图，超出最大上界的记录放在最后一个溢出桶中
+class TimingHistogram:
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(HISTOGRAM_BUCKET_BOUNDS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min: float = None
+        self.max: float = None
+        self._lock = threading.Lock()  # 虚拟桌面查询、图标加载在线程池中记录
+
+    def add(self, seconds: float):
+        bucket = bisect.bisect_left(HISTOGRAM_BUCKET_BOUNDS, seconds)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    # 估算百分位数（p 为 0 到 100），返回所在桶的上界，溢出桶返回最大值
+    def percentile(self, p: float) -> float:
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = max(1, int(self.count * p / 100 + 0.5))
+            seen = 0
+            for bucket, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    if bucket >= len(HISTOGRAM_BUCKET_BOUNDS):
+                        return self.max
+                    return min(HISTOGRAM_BUCKET_BOUNDS[bucket], self.max)
+            return self.max
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(HISTOGRAM_BUCKET_BOUNDS) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.min = None
+            self.max = None
+
+    def to_dict(self) -> dict:
+        p50, p95, p99 = self.percentile(50), self.percentile(95), self.percentile(99)
+        with self._lock:
+            return {
+                'count': self.count,
+                'total_ms': self.total * 1000,
+                'mean_ms': self.total / self.count * 1000 if self.count else None,
+                'min_ms': self.min * 1000 if self.min is not None else None,
+                'max_ms': self.max * 1000 if self.max is not None else None,
+                'p50_ms': p50 * 1000 if p50 is not None else None,
+                'p95_ms': p95 * 1000 if p95 is not None else None,
+                'p99_ms': p99 * 1000 if p99 is not None else None,
+                'buckets': {f"{HISTOGRAM_BUCKET_BOUNDS[i] * 1000:.6g}" if i < len(HISTOGRAM_BUCKET_BOUNDS) else "inf": count
+                            for i, count in enumerate(self.counts) if count},
+            }
+
+
+class StageTimings:
+    def __init__(self):
+        self.histograms: Dict[str, TimingHistogram] = {}
+        self.started_time: float = time.time()
+        self._lock = threading.Lock()
+
+    def get_histogram(self, stage: str) -> TimingHistogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, TimingHistogram())
+        return histogram
+
+    def add(self, stage: str, seconds: float):
+        self.get_histogram(stage).add(seconds)
+
+    # 记录从 start 到现在的耗时，返回现在的时间，方便连续记录多个阶段
+    def lap(self, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        self.get_histogram(stage).add(now - start)
+        return now
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.started_time = time.time()
+
+    def _get_ordered_stages(self) -> List[str]:
+        stages = [stage for stage in STAGE_ORDER if stage in self.histograms]
+        stages += sorted(stage for stage in self.histograms if stage not in STAGE_ORDER)
+        return stages
+
+    def to_dict(self) -> dict:
+        return {
+            'started_time': self.started_time,
+            'dumped_time': time.time(),
+            'stages': {stage: self.histograms[stage].to_dict() for stage in self._get_ordered_stages()},
+        }
+
+    def format_report(self) -> str:
+        def format_ms(value) -> str:
+            return f"{value:10.3f}" if value is not None else f"{'-':>10}"
+        lines = [f"{'stage':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'total ms':>12}"]
+        for stage in self._get_ordered_stages():
+            stats = self.histograms[stage].to_dict()
+            lines.append(f"{stage:<10}{stats['count']:>8}{format_ms(stats['p50_ms'])}{format_ms(stats['p95_ms'])}"
+                         f"{format_ms(stats['p99_ms'])}{format_ms(stats['max_ms'])}{stats['total_ms']:12.1f}")
+        return "\n".join(lines)
+
+    # 保存为 JSON 文件，path 为 None 时保存到程序数据目录，返回保存的路径
+    def dump(self, path: str = None) -> str:
+        if path is None:
+            path = get_app_data_path(STAGE_TIMINGS_FILE_NAME)
+        atomic_write_text(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+        return path
+
+
+_stage_timings: StageTimings = None
+
+def get_stage_timings() -> StageTimings:
+    global _stage_timings
+    if _stage_timings is None:
+        _stage_timings = StageTimings()
+    return _stage_timings
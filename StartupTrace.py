@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# === 启动耗时跟踪
+# main.py 最先导入本模块，从这时开始计时。记录两类数据：
+#   阶段  core 初始化、创建界面、初始化托盘等阶段的耗时，一直记录，每个阶段只多两次 perf_counter
+#   导入  每个第一次被导入的模块的耗时（包含它导入的其他模块）和自身耗时，只在环境变量 VDE_STARTUP_TRACE 非空且不为 0 时统计，
+#         通过替换 builtins.__import__ 实现，启动完成后恢复
+# 托盘图标显示时调用 mark(STARTUP_MILESTONE_TRAY)，超过 STARTUP_TRAY_TARGET_MS 时打印警告。
+# 启动完成时调用 finish，开启跟踪时打印报告，并把完整结果写入程序数据目录下的 startup_trace.json。
+#
+# 用法：
+#   with get_startup_trace().phase('load_config'):
+#       ...
+
+import builtins
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from AppData import get_app_data_path, atomic_write_text
+
+
+STARTUP_TRACE_ENV_VAR = 'VDE_STARTUP_TRACE'
+STARTUP_TRACE_FILE_NAME = "startup_trace.json"
+STARTUP_MILESTONE_TRAY = 'tray_icon'
+STARTUP_TRAY_TARGET_MS = 1000.0  # 从启动到托盘图标显示的目标时间
+STARTUP_REPORT_TOP_IMPORTS = 20
+
+
+class StartupTrace:
+    def __init__(self):
+        self.start_time: float = time.perf_counter()
+        self.phases: List[Tuple[str, float, float, int]] = []  # (名称, 开始时间, 耗时, 嵌套层数)，时间单位毫秒，从 start_time 算起
+        self.milestones: Dict[str, float] = {}  # 名称 -> 从 start_time 算起的毫秒数
+        self.imports: Dict[str, Tuple[float, float, float]] = {}  # 模块名 -> (开始时间, 耗时, 自身耗时)，单位毫秒
+        self.import_trace_enabled: bool = False
+        self.finished: bool = False
+        self._depth: int = 0
+        self._original_import = None
+        self._import_stack: List[float] = []  # 每层正在进行的导入中，已经完成的子模块导入的耗时
+        self._thread_id: int = threading.get_ident()
+
+    def get_elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start_time) * 1000
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        depth = self._depth
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            end = time.perf_counter()
+            self.phases.append((name, (start - self.start_time) * 1000, (end - start) * 1000, depth))
+
+    # 记录一个时间点，托盘图标显示时检查是否超过目标时间
+    def mark(self, name: str):
+        if name in self.milestones:
+            return
+        elapsed = self.get_elapsed_ms()
+        self.milestones[name] = elapsed
+        if name == STARTUP_MILESTONE_TRAY and elapsed > STARTUP_TRAY_TARGET_MS:
+            print(f"启动到显示托盘图标用时 {elapsed:.0f} ms，超过目标 {STARTUP_TRAY_TARGET_MS:.0f} ms")
+
+    def enable_import_trace(self):
+        if self.import_trace_enabled:
+            return
+        self.import_trace_enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._traced_import
+
+    def disable_import_trace(self):
+        if not self.import_trace_enabled:
+            return
+        self.import_trace_enabled = False
+        if builtins.__import__ == self._traced_import:
+            builtins.__import__ = self._original_import
+
+    # 只统计主线程中第一次导入的模块，已经导入过的模块和相对导入直接调用原来的 __import__
+    def _traced_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules or threading.get_ident() != self._thread_id:
+            return self._original_import(name, globals, locals, fromlist, level)
+        stack = self._import_stack
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if name in sys.modules and name not in self.imports:
+                self.imports[name] = ((start - self.start_time) * 1000, elapsed * 1000, (elapsed - children) * 1000)
+
+    def to_dict(self) -> dict:
+        return {
+            'target_tray_ms': STARTUP_TRAY_TARGET_MS,
+            'milestones': dict(self.milestones),
+            'phases': [{'name': name, 'start_ms': start, 'duration_ms': duration, 'depth': depth}
+                       for name, start, duration, depth in sorted(self.phases, key=lambda phase: phase[1])],
+            'imports': {name: {'start_ms': start, 'duration_ms': duration, 'self_ms': self_duration}
+                        for name, (start, duration, self_duration) in self.imports.items()},
+        }
+
+    def format_report(self) -> str:
+        lines = [f"{'phase':<32}{'start ms':>10}{'ms':>10}"]
+        for name, start, duration, depth in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"{'  ' * depth + name:<32}{start:10.1f}{duration:10.1f}")
+        for name, elapsed in self.milestones.items():
+            lines.append(f"{'@ ' + name:<32}{elapsed:10.1f}")
+        if self.imports:
+            lines.append("")
+            lines.append(f"{'import (slowest by self time)':<40}{'ms':>10}{'self ms':>10}")
+            slowest = sorted(self.imports.items(), key=lambda item: item[1][2], reverse=True)[:STARTUP_REPORT_TOP_IMPORTS]
+            for name, (_start, duration, self_duration) in slowest:
+                lines.append(f"{name:<40}{duration:10.1f}{self_duration:10.1f}")
+        return "\n".join(lines)
+
+    def dump(self, path: str = None) -> str:
+        if path is None:
+            path = get_app_data_path(STARTUP_TRACE_FILE_NAME)
+        atomic_write_text(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+        return path
+
+    # 启动完成，停止统计导入，开启跟踪时输出报告
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.mark('startup_finished')
+        if not self.import_trace_enabled:
+            return
+        self.disable_import_trace()
+        print(self.format_report())
+        try:
+            print(f"启动耗时已保存到 {self.dump()}")
+        except OSError as e:
+            print(f"保存启动耗时失败: {e}")
+
+
+_startup_trace = StartupTrace()
+
+def get_startup_trace() -> StartupTrace:
+    return _startup_trace
+
+
+if os.environ.get(STARTUP_TRACE_ENV_VAR, '') not in ('', '0'):
+    _startup_trace.enable_import_trace()
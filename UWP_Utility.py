@@ -3,13 +3,16 @@
 # https://stackoverflow.com/questions/56861198/how-to-create-python-ctypes-structures-for-ms-windows-package-id-and-package-inf/56892039#56892039
 import ctypes
 import ctypes.wintypes
+import json
 import os
-import xml.etree.ElementTree as ET
+import re
+import threading
+from typing import Dict, List, Set
 from PyQt5.QtGui import QImage
 import win32gui
 import win32process
 import psutil
-from lxml import etree
+from AppData import get_app_data_path, atomic_write_text
 
 
 # from AppUtility import get_app_name_from_hwnd
@@ -312,9 +315,9 @@ def get_windows():
     return hwnds
 
 
-# 从窗口句柄获取UWP应用的图标
-# hwnd: Core Window 的句柄，这样才能获取正确的包路径进而获取图标
-def get_icon_from_UWP_hwnd(hwnd: int, image_resize: int = 32) -> QImage:
+# 获取 UWP 应用的包全名和应用 exe 名
+# hwnd: Core Window 的句柄，不是 UWP 应用时包全名为 None
+def get_UWP_package_identity(hwnd: int) -> tuple:
     pid = ctypes.wintypes.DWORD()
     _get_windows_thread_process_id(
         hwnd,
@@ -322,12 +325,24 @@ def get_icon_from_UWP_hwnd(hwnd: int, image_resize: int = 32) -> QImage:
     )
 
     app_name = ""
-    process = psutil.Process(pid.value)
-    if process is not None:
-        app_name = process.name()
+    try:
+        app_name = psutil.Process(pid.value).name()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        pass
 
     hprocess = _open_process(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
-    full_name = package_full_name_from_handle(hprocess)
+    if not hprocess:
+        return None, app_name
+    try:
+        full_name = package_full_name_from_handle(hprocess)
+    finally:
+        _close_handle(hprocess)
+    return (full_name.value if full_name else None), app_name
+
+# 从窗口句柄获取UWP应用的图标
+# hwnd: Core Window 的句柄，这样才能获取正确的包路径进而获取图标
+def get_icon_from_UWP_hwnd(hwnd: int, image_resize: int = 32) -> QImage:
+    full_name, app_name = get_UWP_package_identity(hwnd)
     if not full_name:
         return None
 
@@ -336,77 +351,219 @@ def get_icon_from_UWP_hwnd(hwnd: int, image_resize: int = 32) -> QImage:
         image = image.scaled(image_resize, image_resize)
     return image
 
-# 通过 UWP 的包名称获取图标，返回 QImage 对象，优先匹配应用图标，其次包图标，因为一个包可能有多个应用，例如 Mail 和 Calendar
-def get_icon_from_UWP_package(package_name: str, app_name: str = None) -> QImage:
-    package_path = package_path_from_full_name(package_name)
-    if package_path is None:
-        raise FileNotFoundError("Package not found")
-    package_path = str(package_path.value)
-    if package_path is None:
-        raise FileNotFoundError("Package not found")
-    # Load the AppxManifest.xml file
+# === UWP 包清单索引
+# 每个包全名只解析一次 AppxManifest.xml，记录各应用的 exe 和已经选好的图标文件，并保存到用户目录下，下次启动直接使用
+# 包全名中含有版本号，包更新后会得到新的条目；包路径或清单文件修改时间变化时重新解析
+
+UWP_MANIFEST_INDEX_FILE_NAME = "uwp_manifest_index.json"
+UWP_MANIFEST_INDEX_VERSION = 1
+UWP_LOGO_ATTRIBUTES = ['Square44x44Logo', 'Square150x150Logo']  # Win 10 的标准是 150 和 44，最好用 44 的，150 的有边框
+UWP_LOGO_TARGET_SIZE = 32
+
+_logo_target_size_re = re.compile(r'targetsize-(\d+)', re.IGNORECASE)
+_logo_scale_re = re.compile(r'scale-(\d+)', re.IGNORECASE)
+_logo_base_size_re = re.compile(r'(\d+)x\d+')
+
+# 一个 UWP 包的清单信息
+class UWPPackageManifest:
+    def __init__(self, full_name: str, package_path: str, manifest_mtime: float):
+        self.full_name: str = full_name
+        self.package_path: str = package_path
+        self.manifest_mtime: float = manifest_mtime
+        self.app_logo_files: Dict[str, str] = {}  # 应用 exe 名（小写） -> 图标文件，没有可用图标时为 None
+        self.package_logo_file: str = None
+
+    # 优先使用应用图标，其次包图标，因为一个包可能有多个应用，例如 Mail 和 Calendar
+    def get_logo_file(self, app_name: str = None) -> str:
+        if app_name:
+            logo_file = self.app_logo_files.get(app_name.lower())
+            if logo_file:
+                return logo_file
+        return self.package_logo_file
+
+    def to_json(self) -> dict:
+        return {
+            'full_name': self.full_name,
+            'package_path': self.package_path,
+            'manifest_mtime': self.manifest_mtime,
+            'app_logo_files': self.app_logo_files,
+            'package_logo_file': self.package_logo_file,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'UWPPackageManifest':
+        manifest = cls(data['full_name'], data['package_path'], data['manifest_mtime'])
+        manifest.app_logo_files = dict(data.get('app_logo_files', {}))
+        manifest.package_logo_file = data.get('package_logo_file')
+        return manifest
+
+# 图标文件的实际尺寸，用来在多个缩放版本中挑选
+def _get_logo_variant_size(file_name: str, base_size: int) -> int:
+    match = _logo_target_size_re.search(file_name)
+    if match:
+        return int(match.group(1))
+    match = _logo_scale_re.search(file_name)
+    if match and base_size:
+        return base_size * int(match.group(1)) // 100
+    return base_size
+
+# 把清单中的相对路径解析为实际存在的图标文件
+# 清单中写的文件通常不存在，实际文件是带 scale-xxx 或 targetsize-xx 的版本，选择不小于目标尺寸的最小版本
+def _resolve_logo_file(package_path: str, relative_path: str, listdir_cache: Dict[str, List[str]],
+                       target_size: int = UWP_LOGO_TARGET_SIZE) -> str:
+    relative_path = relative_path.replace('\\', os.sep)
+    logo_file = os.path.join(package_path, relative_path)
+    if os.path.isfile(logo_file):
+        return logo_file
+
+    logo_dir = os.path.dirname(logo_file)
+    stem = os.path.splitext(os.path.basename(relative_path))[0]
+    if logo_dir not in listdir_cache:
+        try:
+            listdir_cache[logo_dir] = os.listdir(logo_dir)
+        except OSError:
+            listdir_cache[logo_dir] = []
+    base_size_match = _logo_base_size_re.search(stem)
+    base_size = int(base_size_match.group(1)) if base_size_match else None
+
+    candidates = []
+    for file_name in listdir_cache[logo_dir]:
+        if not file_name.startswith(stem) or not file_name.lower().endswith('.png'):
+            continue
+        if 'contrast-' in file_name.lower():  # 高对比度主题的版本
+            continue
+        size = _get_logo_variant_size(file_name, base_size) or 0
+        candidates.append((size < target_size, abs(size - target_size), file_name))
+    if not candidates:
+        return None
+    return os.path.join(logo_dir, min(candidates)[2])
+
+def _get_manifest_mtime(manifest_file: str) -> float:
+    try:
+        return os.path.getmtime(manifest_file)
+    except OSError:
+        return None
+
+# 解析 AppxManifest.xml
+def build_UWP_package_manifest(full_name: str, package_path: str) -> UWPPackageManifest:
     manifest_file = os.path.join(package_path, "AppxManifest.xml")
-    if manifest_file is None or not os.path.exists(manifest_file) or not os.access(manifest_file, os.R_OK):
+    manifest_mtime = _get_manifest_mtime(manifest_file)
+    if manifest_mtime is None or not os.access(manifest_file, os.R_OK):
         raise FileNotFoundError("AppxManifest.xml not found")
-                                
-    # XML 解析
+    manifest = UWPPackageManifest(full_name, package_path, manifest_mtime)
+
+    # XML 解析，lxml 只在清单不在缓存中时导入
+    from lxml import etree
     tree = etree.parse(manifest_file)
     root = tree.getroot()
 
     namespace = root.nsmap[None]
-    uap_namespace = root.nsmap['uap']
+    uap_namespace = root.nsmap.get('uap', namespace)
+    listdir_cache = {}
 
     apps = root.findall('{{{}}}Applications/{{{}}}Application'.format(namespace, namespace))
-    logo_file = None
     for app in apps:
         app_exe = app.get('Executable')
-        if app_exe and app_name and app_exe.lower() == app_name.lower():
-            logo_element = app.find('{{{}}}VisualElements'.format(uap_namespace))
-
-            if logo_element is None:
-                continue
-            # 获取最大的图标
-            # Win 10 的标准是 150 和 44，最好用 44 的，150 的有边框
-            icon_sizes = ['44', '150']
-            for size in icon_sizes:
-                if logo_element.get('Square' + size + 'x' + size + 'Logo'):
-                    relative_path = logo_element.get('Square' + size + 'x' + size + 'Logo').replace('\\', os.sep)
-                    logo_file = os.path.join(package_path, relative_path)
-                    if os.path.exists(logo_file) and os.access(logo_file, os.R_OK):
+        if not app_exe:
+            continue
+        app_exe = os.path.basename(app_exe.replace('\\', os.sep)).lower()
+        logo_file = None
+        logo_element = app.find('{{{}}}VisualElements'.format(uap_namespace))
+        if logo_element is not None:
+            for attribute in UWP_LOGO_ATTRIBUTES:
+                relative_path = logo_element.get(attribute)
+                if relative_path:
+                    logo_file = _resolve_logo_file(package_path, relative_path, listdir_cache)
+                    if logo_file:
                         break
-                    if not os.path.exists(logo_file) or not os.access(logo_file, os.R_OK):
-                        # If the exact logo file doesn't exist, try to find a matching file
-                        logo_basename = os.path.basename(relative_path)
-                        logo_dirname = os.path.dirname(relative_path)
-                        for filename in os.listdir(os.path.join(package_path, logo_dirname)):
-                            if filename.startswith(logo_basename.split('.')[0]) and filename.endswith('.png'):
-                                logo_file = os.path.join(package_path, logo_dirname, filename)
-                                if logo_file and os.path.exists(logo_file) and os.access(logo_file, os.R_OK):
-                                    break
-                    if logo_file and os.path.exists(logo_file) and os.access(logo_file, os.R_OK):
-                        break
-        if logo_file and os.path.exists(logo_file) and os.access(logo_file, os.R_OK):
-            break
-    
-    if logo_file is None:
-        logo_element = root.find(namespace + 'Properties').find(namespace + 'Logo')
-        # Get the relative path to the logo file
-        relative_path = logo_element.text.replace('\\', os.sep)
-        # Try to find the exact logo file
-        logo_file = os.path.join(package_path, relative_path)
-        if not os.path.exists(logo_file) or not os.access(logo_file, os.R_OK):
-            # If the exact logo file doesn't exist, try to find a matching file
-            logo_basename = os.path.basename(relative_path)
-            logo_dirname = os.path.dirname(relative_path)
-            for filename in os.listdir(os.path.join(package_path, logo_dirname)):
-                if filename.startswith(logo_basename.split('.')[0]) and filename.endswith('.png'):
-                    logo_file = os.path.join(package_path, logo_dirname, filename)
-                    if os.path.exists(logo_file) and os.access(logo_file, os.R_OK):
-                        break
-    
-    if logo_file and os.path.exists(logo_file) and os.access(logo_file, os.R_OK):
+        if logo_file or app_exe not in manifest.app_logo_files:
+            manifest.app_logo_files[app_exe] = logo_file
+
+    properties = root.find('{{{}}}Properties'.format(namespace))
+    logo_element = properties.find('{{{}}}Logo'.format(namespace)) if properties is not None else None
+    if logo_element is not None and logo_element.text:
+        manifest.package_logo_file = _resolve_logo_file(package_path, logo_element.text, listdir_cache)
+    return manifest
+
+class UWPManifestIndex:
+    def __init__(self, path: str = None):
+        self.path: str = path if path is not None else get_app_data_path(UWP_MANIFEST_INDEX_FILE_NAME)
+        self._manifests: Dict[str, UWPPackageManifest] = {}
+        self._validated: Set[str] = set()  # 本次运行中已经确认过包路径和清单修改时间的包
+        self._lock = threading.RLock()
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != UWP_MANIFEST_INDEX_VERSION:
+            return False
+        with self._lock:
+            for item in data.get('packages', []):
+                try:
+                    manifest = UWPPackageManifest.from_json(item)
+                except (KeyError, TypeError):
+                    continue
+                self._manifests[manifest.full_name] = manifest
+        return True
+
+    def save(self) -> bool:
+        with self._lock:
+            data = {
+                'version': UWP_MANIFEST_INDEX_VERSION,
+                'packages': [manifest.to_json() for manifest in self._manifests.values()],
+            }
+        try:
+            atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, indent=1))
+        except OSError as e:
+            print(f"保存 UWP 包清单索引失败: {e}")
+            return False
+        return True
+
+    # 获取包的清单信息，同一个包在本次运行中只检查一次
+    def get(self, full_name: str) -> UWPPackageManifest:
+        with self._lock:
+            manifest = self._manifests.get(full_name)
+            if manifest is not None and full_name in self._validated:
+                return manifest
+
+        package_path = package_path_from_full_name(full_name)
+        if package_path is None:
+            raise FileNotFoundError("Package not found")
+        package_path = str(package_path.value)
+
+        if manifest is not None:
+            manifest_mtime = _get_manifest_mtime(os.path.join(package_path, "AppxManifest.xml"))
+            if manifest.package_path != package_path or manifest.manifest_mtime != manifest_mtime:
+                manifest = None
+
+        changed = manifest is None
+        if manifest is None:
+            manifest = build_UWP_package_manifest(full_name, package_path)
+        with self._lock:
+            self._manifests[full_name] = manifest
+            self._validated.add(full_name)
+        if changed:
+            self.save()
+        return manifest
+
+_UWP_manifest_index: UWPManifestIndex = None
+
+def get_UWP_manifest_index() -> UWPManifestIndex:
+    global _UWP_manifest_index
+    if _UWP_manifest_index is None:
+        _UWP_manifest_index = UWPManifestIndex()
+        _UWP_manifest_index.load()
+    return _UWP_manifest_index
+
+# 通过 UWP 的包名称获取图标，返回 QImage 对象，优先匹配应用图标，其次包图标，因为一个包可能有多个应用，例如 Mail 和 Calendar
+def get_icon_from_UWP_package(package_name: str, app_name: str = None) -> QImage:
+    manifest = get_UWP_manifest_index().get(str(package_name))
+    logo_file = manifest.get_logo_file(app_name)
+    if logo_file:
         image = QImage(logo_file)
-        return image
-    
+        if not image.isNull():
+            return image
     return None
-
@@ -3,77 +3,99 @@
 # 载入第三方 Windows 虚拟桌面接口
 import os
 import ctypes
+import threading
 from ctypes import wintypes
+from typing import Callable, Dict, List
+from WindowBackend import WindowDesktopState, WindowMoveResult, DesktopMetadataCache, query_windows_desktop_states, move_windows_to_desktop as _move_windows_to_desktop, DESKTOP_QUERY_MAX_WORKERS
 from LP_Wrapper import lp_wrapper
 
 # 载入第三方 Windows 虚拟桌面接口变量的类封装
+# dll 在第一次调用时才载入（见 get_accessor），导入本模块不需要 dll
 class VirtualDesktopAccessor:
     _script_dir = os.path.dirname(os.path.abspath(__file__))
     _dll_path = os.path.join(_script_dir, "dll\\VirtualDesktopAccessor.dll")
-    _vda_dll = ctypes.CDLL(_dll_path)
 
-    # 原始移动窗口到虚拟桌面的函数
-    _move_window_to_desktop = _vda_dll.MoveWindowToDesktopNumber
-    _move_window_to_desktop.argtypes = [wintypes.HWND, wintypes.INT]  # move_window_to_desktop(hwnd, 0)
+    def __init__(self):
+        self._vda_dll = ctypes.CDLL(self._dll_path)
+        _vda_dll = self._vda_dll
 
-    # 原始获取当前虚拟桌面序号的函数
-    _get_current_destop_number = _vda_dll.GetCurrentDesktopNumber
+        # 原始移动窗口到虚拟桌面的函数
+        self._move_window_to_desktop = _vda_dll.MoveWindowToDesktopNumber
+        self._move_window_to_desktop.argtypes = [wintypes.HWND, wintypes.INT]  # move_window_to_desktop(hwnd, 0)
 
-    # 原始获取虚拟桌面名称的函数
-    _get_desktop_name = _vda_dll.GetDesktopName
-    _get_desktop_name.argtypes = [wintypes.INT, ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t]
-    _get_desktop_name.restype = wintypes.INT
+        # 原始获取当前虚拟桌面序号的函数
+        self._get_current_destop_number = _vda_dll.GetCurrentDesktopNumber
 
-    # 原始获取窗口所在虚拟桌面序号的函数
-    _get_window_desktop_number = _vda_dll.GetWindowDesktopNumber
-    _get_window_desktop_number.argtypes = [wintypes.HWND]
-    _get_window_desktop_number.restype = wintypes.INT
+        # 原始获取虚拟桌面数量的函数
+        self._get_desktop_count = _vda_dll.GetDesktopCount
+        self._get_desktop_count.restype = wintypes.INT
 
+        # 原始获取虚拟桌面名称的函数
+        self._get_desktop_name = _vda_dll.GetDesktopName
+        self._get_desktop_name.argtypes = [wintypes.INT, ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t]
+        self._get_desktop_name.restype = wintypes.INT
 
-    # Pin 的窗口获取不到虚拟桌面序号，但是也不需要监视事件了
+        # 原始获取窗口所在虚拟桌面序号的函数
+        self._get_window_desktop_number = _vda_dll.GetWindowDesktopNumber
+        self._get_window_desktop_number.argtypes = [wintypes.HWND]
+        self._get_window_desktop_number.restype = wintypes.INT
+
+
+        # Pin 的窗口获取不到虚拟桌面序号，但是也不需要监视事件了
     
-    # fn IsPinnedWindow(hwnd: HWND) -> i32
-    # fn PinWindow(hwnd: HWND) -> i32
-    # fn UnPinWindow(hwnd: HWND) -> i32
-    # fn IsPinnedApp(hwnd: HWND) -> i32
-    # fn PinApp(hwnd: HWND) -> i32
-    # fn UnPinApp(hwnd: HWND) -> i32 
+        # fn IsPinnedWindow(hwnd: HWND) -> i32
+        # fn PinWindow(hwnd: HWND) -> i32
+        # fn UnPinWindow(hwnd: HWND) -> i32
+        # fn IsPinnedApp(hwnd: HWND) -> i32
+        # fn PinApp(hwnd: HWND) -> i32
+        # fn UnPinApp(hwnd: HWND) -> i32 
 
-    _get_window_is_pinned = _vda_dll.IsPinnedWindow
-    _get_window_is_pinned.argtypes = [wintypes.HWND]
-    _get_window_is_pinned.restype = wintypes.INT
+        self._get_window_is_pinned = _vda_dll.IsPinnedWindow
+        self._get_window_is_pinned.argtypes = [wintypes.HWND]
+        self._get_window_is_pinned.restype = wintypes.INT
 
-    _get_window_is_pinned_app = _vda_dll.IsPinnedApp
-    _get_window_is_pinned_app.argtypes = [wintypes.HWND]
-    _get_window_is_pinned_app.restype = wintypes.INT
+        self._get_window_is_pinned_app = _vda_dll.IsPinnedApp
+        self._get_window_is_pinned_app.argtypes = [wintypes.HWND]
+        self._get_window_is_pinned_app.restype = wintypes.INT
 
-    _set_window_pin = _vda_dll.PinWindow
-    _set_window_pin.argtypes = [wintypes.HWND]
-    _set_window_pin.restype = wintypes.INT
+        self._set_window_pin = _vda_dll.PinWindow
+        self._set_window_pin.argtypes = [wintypes.HWND]
+        self._set_window_pin.restype = wintypes.INT
 
-    _set_window_pin_app = _vda_dll.PinApp
-    _set_window_pin_app.argtypes = [wintypes.HWND]
-    _set_window_pin_app.restype = wintypes.INT
+        self._set_window_pin_app = _vda_dll.PinApp
+        self._set_window_pin_app.argtypes = [wintypes.HWND]
+        self._set_window_pin_app.restype = wintypes.INT
 
-    _set_window_unpin = _vda_dll.UnPinWindow
-    _set_window_unpin.argtypes = [wintypes.HWND]
-    _set_window_unpin.restype = wintypes.INT
+        self._set_window_unpin = _vda_dll.UnPinWindow
+        self._set_window_unpin.argtypes = [wintypes.HWND]
+        self._set_window_unpin.restype = wintypes.INT
 
-    _set_window_unpin_app = _vda_dll.UnPinApp
-    _set_window_unpin_app.argtypes = [wintypes.HWND]
-    _set_window_unpin_app.restype = wintypes.INT
+        self._set_window_unpin_app = _vda_dll.UnPinApp
+        self._set_window_unpin_app.argtypes = [wintypes.HWND]
+        self._set_window_unpin_app.restype = wintypes.INT
 
-    
 
-# 获取虚拟桌面名称的函数
-def get_desktop_name(desktop_number: int) -> str:
+_accessor: VirtualDesktopAccessor = None
+_accessor_lock = threading.Lock()  # 虚拟桌面查询在线程池中并行调用，避免重复载入
+
+def get_accessor() -> VirtualDesktopAccessor:
+    global _accessor
+    if _accessor is None:
+        with _accessor_lock:
+            if _accessor is None:
+                _accessor = VirtualDesktopAccessor()
+    return _accessor
+
+
+# 直接从 dll 读取虚拟桌面名称
+def _read_desktop_name(desktop_number: int) -> str:
     # 转换参数类型
     buffer_size = 256
     buffer = ctypes.create_string_buffer(buffer_size)
     buffer_pointer = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_ubyte))
 
     # 调用函数，并将结果存储在 Python 变量中
-    get_result = VirtualDesktopAccessor._get_desktop_name(desktop_number, buffer_pointer, buffer_size)
+    get_result = get_accessor()._get_desktop_name(desktop_number, buffer_pointer, buffer_size)
 
     # 输出结果
     result = ''
@@ -83,39 +105,70 @@ def get_desktop_name(desktop_number: int) -> str:
         result = "Error: " + str(desktop_number)
     return result
 
+def _read_desktop_count() -> int:
+    return get_accessor()._get_desktop_count()
+
+def _read_current_desktop_number() -> int:
+    return get_accessor()._get_current_destop_number()
+
+# 虚拟桌面数量、名称和当前序号的缓存，绘制窗口列表时不再逐行调用 dll
+_desktop_metadata = DesktopMetadataCache(_read_desktop_count, _read_desktop_name, _read_current_desktop_number)
+
+# 虚拟桌面切换、新增、删除或重命名后调用，下一次读取时重新从 dll 加载
+def invalidate_desktop_metadata(current_only: bool = False):
+    _desktop_metadata.invalidate(current_only)
+
+# 获取虚拟桌面名称的函数
+def get_desktop_name(desktop_number: int) -> str:
+    return _desktop_metadata.get_desktop_name(desktop_number)
+
+# 获取虚拟桌面数量的函数
+def get_desktop_count() -> int:
+    return _desktop_metadata.get_desktop_count()
+
 # 获取当前虚拟桌面序号的函数
 def get_current_desktop_number() -> int:
-    return VirtualDesktopAccessor._get_current_destop_number()
+    return _desktop_metadata.get_current_desktop_number()
 
 # 获取窗口所在虚拟桌面序号的函数
 # 很慢
-# @lp_wrapper
+@lp_wrapper
 def get_window_desktop_number(hwnd: wintypes.HWND) -> int:
-    return VirtualDesktopAccessor._get_window_desktop_number(hwnd)
+    return get_accessor()._get_window_desktop_number(hwnd)
+
+# 批量获取窗口的 Pin 状态和虚拟桌面序号的函数，在线程池中并行调用 dll
+# 单个窗口查询失败时不抛出异常，结果中对应的 error 不为 None
+def get_windows_desktop_states(hwnds: List[wintypes.HWND], max_workers: int = DESKTOP_QUERY_MAX_WORKERS) -> Dict[int, WindowDesktopState]:
+    return query_windows_desktop_states(hwnds, get_window_is_pinned, get_window_desktop_number, max_workers)
 
 # # 移动窗口到虚拟桌面的函数
 def move_window_to_desktop(hwnd: wintypes.HWND, desktop_number: int):
-    VirtualDesktopAccessor._move_window_to_desktop(hwnd, desktop_number)
+    get_accessor()._move_window_to_desktop(hwnd, desktop_number)
+
+# 批量移动窗口到虚拟桌面的函数，在线程池中并行调用 dll，should_stop 返回 True 时放弃剩下的窗口
+def move_windows_to_desktop(hwnds: List[wintypes.HWND], desktop_number: int, should_stop: Callable[[], bool] = None,
+                            max_workers: int = DESKTOP_QUERY_MAX_WORKERS) -> WindowMoveResult:
+    return _move_windows_to_desktop(hwnds, desktop_number, move_window_to_desktop, should_stop, max_workers)
 
 # Pin 相关函数
 
 def get_window_is_pinned(hwnd: wintypes.HWND) -> bool:
-    return VirtualDesktopAccessor._get_window_is_pinned(hwnd) == 1
+    return get_accessor()._get_window_is_pinned(hwnd) == 1
 
 def get_window_is_pinned_app(hwnd: wintypes.HWND) -> bool:
-    return VirtualDesktopAccessor._get_window_is_pinned_app(hwnd) == 1
+    return get_accessor()._get_window_is_pinned_app(hwnd) == 1
 
 def set_window_pin(hwnd: wintypes.HWND):
-    VirtualDesktopAccessor._set_window_pin(hwnd)
+    get_accessor()._set_window_pin(hwnd)
 
 def set_window_pin_app(hwnd: wintypes.HWND):
-    VirtualDesktopAccessor._set_window_pin_app(hwnd)
+    get_accessor()._set_window_pin_app(hwnd)
 
 def set_window_unpin(hwnd: wintypes.HWND):
-    VirtualDesktopAccessor._set_window_unpin(hwnd)
+    get_accessor()._set_window_unpin(hwnd)
 
 def set_window_unpin_app(hwnd: wintypes.HWND):
-    VirtualDesktopAccessor._set_window_unpin_app(hwnd)
+    get_accessor()._set_window_unpin_app(hwnd)
 
 
 
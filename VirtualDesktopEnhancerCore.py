@@ -1,77 +1,286 @@
 # -*- coding: utf-8 -*-
 
-from VirtualDesktopAccessor import *
-from typing import List
-from AppUtility import get_window_title_from_hwnd
-from WindowMatch import WindowMatchConfig, WindowInfo, WindowMatchMode, GLOBAL_MATCH_CONFIG_ENABLED_ONLY, GLOBAL_MATCH_CONFIG_VISIBLE_ONLY, GLOBAL_MATCH_CONFIG_TOP_LEVEL_ONLY
-import VirtualDesktopEnhancerWindow as VDE_Window
+import threading
+import time
+from typing import Callable, List, Dict, Optional, Set
+from WindowBackend import WindowBackend, get_window_backend
+from WindowMatch import WindowMatchConfig, WindowInfo, WindowMatchMode, WindowMatchIndex, GLOBAL_MATCH_CONFIG_ENABLED_ONLY, GLOBAL_MATCH_CONFIG_VISIBLE_ONLY, GLOBAL_MATCH_CONFIG_TOP_LEVEL_ONLY
 import sys
-from PyQt5.QtWidgets import QApplication
-import pywinauto.findwindows as findwindows
-from UWP_Utility import get_windows
 from LP_Wrapper import lp_wrapper
+from StageTimings import get_stage_timings, STAGE_ENUMERATE, STAGE_MATCH, STAGE_REFRESH
+from WindowTable import WindowTable, WindowRowSnapshot
+from MatchConfigStore import MatchConfigStore, get_is_same_configs
+from StartupTrace import get_startup_trace
+
+
+SWITCH_RECHECK_INTERVAL = 0.02  # 移动过程中收到新的切换事件后，重新确认当前桌面的最小间隔，单位秒
+WINDOW_TITLE_MAX_AGE = 2.0  # 最近一次完整刷新在这个时间内时，日志中的窗口标题直接使用窗口表中的值，单位秒
 
 
 class VirtualDesktopEnhancerCore:
     def __init__(self):
-        self.last_desktop_idx : int = get_current_desktop_number()
+        trace = get_startup_trace()
+        with trace.phase('backend'):
+            self.backend: WindowBackend = get_window_backend()
+        self.last_desktop_idx : int = self.backend.get_current_desktop_number()
         self.match_configs: List[WindowMatchConfig] = []
+        self.match_index: WindowMatchIndex = WindowMatchIndex()  # 由 match_configs 编译而来，规则变化时调用 rebuild_match_index
+        self.config_store: MatchConfigStore = MatchConfigStore()  # match_configs 在磁盘上的存储，单条规则的修改写入增量日志
+        self.window_table: WindowTable = WindowTable()  # 所有已知窗口的字段按列存放，WindowInfo 是其中一行的视图
         self.window_infos: List[WindowInfo] = []
+        self.window_info_cache: Dict[int, WindowInfo] = {}  # 以枚举得到的顶层窗口句柄为键，刷新时只完整解析新出现的窗口
         self.pinned_windows: List[WindowInfo] = []
+        self.titles_refresh_time: float = None  # 最近一次刷新了全部窗口标题的时间，perf_counter
+        self.reused_hwnds: Set[int] = set()  # 被系统回收后分配给了新窗口的句柄，界面据此丢弃旧窗口的图标，见 pop_reused_hwnds
+        self._reused_hwnds_lock = threading.Lock()
         self.monitoring: bool = False
+        # 自动移动和后台刷新在其他线程中刷新窗口，window_table、window_infos、window_info_cache、pinned_windows 只在持有这个锁时读写
+        # 刷新会释放和整理 window_table 中的行，界面不持有 WindowInfo，只使用 get_window_row_snapshots 的结果
+        self.refresh_lock = threading.RLock()
 
         # App related
         self.last_edit_match_mode: WindowMatchMode = None
 
-        self.load_config_file() # 加载配置文件，记得加载 GUI 语言
+        with trace.phase('load_config'):
+            self.load_config_file() # 加载配置文件，记得加载 GUI 语言
 
-        self.vde_window: VDE_Window.VirtualDesktopEnhancerWindow = None
-        self.qapp: QApplication = None
+        self.vde_window: 'VDE_Window.VirtualDesktopEnhancerWindow' = None
+        self.qapp: 'QApplication' = None
 
-    def load_config_file(self):
-        self.match_configs = [] # ... To do 从磁盘加载配置文件
+    # 从磁盘加载匹配规则，规则内容没有变化时不重新编译，返回规则是否有变化
+    def load_config_file(self) -> bool:
+        configs = self.config_store.load()
+        with self.refresh_lock:
+            if get_is_same_configs(configs, self.match_configs):
+                return False
+            self.match_configs = configs
+            self.rebuild_match_index()
+            self.rematch_all_windows()
+        return True
 
-    def save_config_file(self, path: str) -> bool:
-        # ... 将配置文件保存到磁盘，返回是否成功。
-        # json 文件或者 xml 文件均可
-        success = True
-        return success
+    # 把全部规则写入新的快照，path 为 None 时保存到程序数据目录并清空增量日志，返回是否成功
+    def save_config_file(self, path: str = None) -> bool:
+        with self.refresh_lock:
+            return self.config_store.save(self.match_configs, path)
+
+    # 配置文件被其他程序修改过时重新加载，由界面定时调用，只检查文件状态，返回规则是否有变化
+    # 界面线程不等待刷新：后台刷新或移动窗口正占用 refresh_lock 时直接返回，文件状态没有更新，下次调用时重试
+    def reload_config_file_if_changed(self) -> bool:
+        if not self.config_store.has_changed():
+            return False
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            print("匹配规则文件已被修改，重新加载")
+            return self.load_config_file()
+        finally:
+            self.refresh_lock.release()
 
     def add_config(self, config: WindowMatchConfig):
-        self.match_configs.append(config)
+        with self.refresh_lock:
+            self.match_configs.append(config)
+            self.config_store.put(config, self.match_configs)
+            self.rebuild_match_index()
         self.refresh_all_windows()
 
-    # @lp_wrapper
+    # 修改规则的字段后调用，只向增量日志追加这一条规则
+    def update_config(self, config: WindowMatchConfig):
+        with self.refresh_lock:
+            self.config_store.put(config, self.match_configs)
+            self.rebuild_match_index()
+            self.rematch_all_windows()
+
+    def remove_config(self, config: WindowMatchConfig):
+        with self.refresh_lock:
+            if config not in self.match_configs:
+                return
+            self.match_configs.remove(config)
+            self.config_store.remove(config, self.match_configs)
+            self.rebuild_match_index()
+            self.rematch_all_windows()
+
+    def rebuild_match_index(self):
+        self.match_index.rebuild(self.match_configs)
+
+    # 规则变化后用上一次刷新得到的窗口信息重新判断匹配状态，不重新枚举窗口
+    def rematch_all_windows(self):
+        with self.refresh_lock:
+            for window in self.window_infos:
+                window.matched = self.match_index.get_is_matched(window)
+
     def refresh_all_windows(self):
+        with self.refresh_lock:
+            self._refresh_all_windows()
+
+    # refresh_known 为 False 时只解析新出现的窗口，已有的窗口沿用缓存的信息，用于切换桌面时尽快找到要移动的窗口
+    @lp_wrapper
+    def _refresh_all_windows(self, refresh_known: bool = True):
         kwargs = {}
         kwargs['enabled_only'] = GLOBAL_MATCH_CONFIG_ENABLED_ONLY
         kwargs['visible_only'] = GLOBAL_MATCH_CONFIG_VISIBLE_ONLY
         kwargs['top_level_only'] = GLOBAL_MATCH_CONFIG_TOP_LEVEL_ONLY
-        hwnds = findwindows.find_windows(**kwargs)
+        timings = get_stage_timings()
+        refresh_start = start = time.perf_counter()
+        if refresh_known:
+            self.backend.invalidate_desktop_metadata()  # 完整刷新时顺便重新读取虚拟桌面数量和名称
+        windows = self.backend.enumerate_windows(**kwargs)  # 窗口类、标题和进程 id 在枚举时一并取得
+        timings.lap(STAGE_ENUMERATE, start)
 
-        # 寻找所有窗口
-        # hwnds = get_windows()
+        # 新窗口完整解析，已有的窗口只刷新标题、Pin 状态和虚拟桌面序号，已经消失的窗口直接丢弃
+        # 枚举时已经取得了窗口类和进程 id，和缓存的不一致时说明句柄被分配给了新窗口，丢弃旧的信息重新解析
+        # 虚拟桌面信息很慢，先收集起来再批量查询
+        window_table = self.window_table
+        window_info_cache = {}
+        reused_hwnds = []
+        for hwnd, class_name, title, process_id in windows.iter_identities():
+            info = self.window_info_cache.get(hwnd)
+            if info is not None and not info.get_is_same_window(class_name, process_id):
+                reused_hwnds.append(info.hwnd)
+                info.release()
+                del self.window_info_cache[hwnd]
+                info = None
+            if info is None:
+                info = WindowInfo(hwnd, resolve_desktop=False, table=window_table,
+                                  class_name=class_name, title=title, process_id=process_id)
+            elif refresh_known:
+                info.refresh_volatile_info(resolve_desktop=False, title=title)
+            window_info_cache[hwnd] = info
+        for hwnd, info in self.window_info_cache.items():
+            if hwnd not in window_info_cache:
+                info.release()
+        if window_table.get_is_sparse():
+            window_table.compact()
+        self.window_info_cache = window_info_cache
+        if reused_hwnds:
+            print(f"{len(reused_hwnds)} 个窗口句柄被新的窗口使用，重新解析")
+            with self._reused_hwnds_lock:
+                self.reused_hwnds.update(reused_hwnds)
 
-        raw_window_infos = []
-        for hwnd in hwnds:
-            raw_window_infos.append(WindowInfo(hwnd))
-        self.window_infos = [info for info in raw_window_infos if info.valid]
+        # 等待虚拟桌面信息的窗口直接按标志位列筛选
+        pending_rows = window_table.get_rows(valid=None, pending_desktop_info=True)
+        pending_hwnds = window_table.get_source_hwnds(pending_rows)
+        desktop_states = self.backend.get_windows_desktop_states(pending_hwnds)
+        for info, hwnd in zip(window_table.get_views(pending_rows), pending_hwnds):
+            info.refresh_desktop_info(self.backend, desktop_states[hwnd])
+        self.window_infos = window_table.get_views()
 
         # 设置窗口的匹配状态
+        start = time.perf_counter()
         for window in self.window_infos:
-            window.matched = False
-            for config in self.match_configs:
-                if window.get_is_matched_for_config(config):
-                    window.matched = True
-                    break
+            window.matched = self.match_index.get_is_matched(window)
+        timings.lap(STAGE_MATCH, start)
+
+        self.pinned_windows = window_table.get_views(pinned=True)
+        if refresh_known:
+            self.titles_refresh_time = refresh_start
+        timings.lap(STAGE_REFRESH, refresh_start)
+
+    # 所有窗口当前的值，结果不随之后的刷新变化，界面和其他线程只通过它读取窗口信息
+    # timeout 秒内没有取得 refresh_lock 时返回 None，默认一直等待
+    def get_window_row_snapshots(self, timeout: float = -1) -> Optional[List[WindowRowSnapshot]]:
+        if not self.refresh_lock.acquire(timeout=timeout):
+            return None
+        try:
+            return self.window_table.get_row_snapshots()
+        finally:
+            self.refresh_lock.release()
 
-        self.pinned_windows = [info for info in self.window_infos if info.pinned]
+    # 取出上次调用之后被新窗口使用的句柄（UWP 窗口是 Core Window 的句柄），界面线程调用，不等待刷新
+    def pop_reused_hwnds(self) -> Set[int]:
+        with self._reused_hwnds_lock:
+            reused_hwnds, self.reused_hwnds = self.reused_hwnds, set()
+        return reused_hwnds
+
+    # 批量获取窗口标题，用于日志
+    # 窗口表足够新时直接读取缓存的标题，其余的窗口（或者后台刷新正占用窗口表时）每个窗口只调用一次 get_window_text
+    def get_window_titles(self, hwnds: List[int], max_age: float = WINDOW_TITLE_MAX_AGE) -> Dict[int, str]:
+        titles = {}
+        if self.refresh_lock.acquire(blocking=False):
+            try:
+                refresh_time = self.titles_refresh_time
+                if refresh_time is not None and time.perf_counter() - refresh_time <= max_age:
+                    cache = self.window_info_cache
+                    for hwnd in hwnds:
+                        info = cache.get(hwnd)
+                        if info is not None and info.valid:
+                            titles[hwnd] = info.title
+            finally:
+                self.refresh_lock.release()
+        for hwnd in hwnds:
+            if hwnd not in titles:
+                titles[hwnd] = self.backend.get_window_text(hwnd)
+        return titles
+
+    def get_window_title(self, hwnd: int, max_age: float = WINDOW_TITLE_MAX_AGE) -> str:
+        return self.get_window_titles([hwnd], max_age)[hwnd]
 
     def on_desktop_changed(self):
-        current_desktop_idx = get_current_desktop_number()
+        self.backend.invalidate_desktop_metadata(current_only=True)
+        current_desktop_idx = self.backend.get_current_desktop_number()
         if current_desktop_idx != self.last_desktop_idx:
-            self.last_desktop_idx = current_desktop_idx
-            self.move_matched_windows_to_desktop(current_desktop_idx)
+            if self.move_matched_windows_to_desktop(current_desktop_idx):
+                self.last_desktop_idx = current_desktop_idx
+
+    # 把匹配的窗口移动到指定桌面，is_stale 返回 True 时说明有更新的切换事件，放弃剩下的移动并返回 False
+    # 已经在目标桌面上的窗口（按缓存的虚拟桌面序号）直接跳过，其余的并行移动
+    def move_matched_windows_to_desktop(self, desktop_idx: int, is_stale: Callable[[], bool] = None) -> bool:
+        backend = self.backend
+        start_time = time.perf_counter()
+        # 窗口信息只在持有 refresh_lock 时读写，移动期间后台刷新可能释放或整理表中的行
+        with self.refresh_lock:
+            self._refresh_all_windows(refresh_known=False)
+            rows = self.window_table.get_rows(matched=True, pinned=False)
+            matched_count = len(rows)
+            desktop_idxs = self.window_table.desktop_idxs
+            hwnds_to_move = self.window_table.get_source_hwnds(row for row in rows if desktop_idxs[row] != desktop_idx)
+
+        should_stop = None
+        if is_stale is not None:
+            should_stop = self.get_switch_superseded_checker(desktop_idx, is_stale)
+        result = backend.move_windows_to_desktop(hwnds_to_move, desktop_idx, should_stop)
+
+        # 移动完成后按句柄重新查找，移动期间消失的窗口直接跳过
+        with self.refresh_lock:
+            for hwnd in result.moved:
+                info = self.window_info_cache.get(hwnd)
+                if info is not None:
+                    info.current_desktop_idx = desktop_idx
+        if result.failed:
+            titles = self.get_window_titles(list(result.failed))
+            for hwnd, error in result.failed.items():
+                print(f"移动句柄{hwnd} {titles[hwnd]} 到虚拟桌面 {desktop_idx} 失败: {error}")
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"移动 {len(result.moved)} 个窗口到虚拟桌面 {desktop_idx} {backend.get_desktop_name(desktop_idx)}，"
+              f"跳过 {matched_count - len(hwnds_to_move)} 个已在目标桌面的窗口，用时 {elapsed_ms:.1f} ms")
+        if result.cancelled:
+            print(f"有更新的虚拟桌面切换事件，放弃移动到虚拟桌面 {desktop_idx}")
+            return False
+        return True
+
+    # 收到了新的切换事件，但可能只是同一次切换的重复消息，重新读取当前桌面序号确认
+    def get_is_switch_superseded(self, desktop_idx: int, is_stale: Callable[[], bool]) -> bool:
+        if not is_stale():
+            return False
+        self.backend.invalidate_desktop_metadata(current_only=True)
+        return self.backend.get_current_desktop_number() != desktop_idx
+
+    # 给并行移动用的检查函数：多个线程共用一次确认结果，至多每 SWITCH_RECHECK_INTERVAL 秒重新读取一次当前桌面
+    def get_switch_superseded_checker(self, desktop_idx: int, is_stale: Callable[[], bool]) -> Callable[[], bool]:
+        lock = threading.Lock()
+        state = {'superseded': False, 'checked_time': None}
+
+        def should_stop() -> bool:
+            if state['superseded']:
+                return True
+            if not is_stale():
+                return False
+            with lock:
+                now = time.perf_counter()
+                if state['checked_time'] is None or now - state['checked_time'] >= SWITCH_RECHECK_INTERVAL:
+                    state['superseded'] = self.get_is_switch_superseded(desktop_idx, is_stale)
+                    state['checked_time'] = now
+                return state['superseded']
+        return should_stop
 
     def on_add_window(self):
         print("on_add_window")
@@ -83,11 +292,11 @@ class VirtualDesktopEnhancerCore:
 
     def on_save_config(self):
         print("on_save_config")
-        # ... 保存配置文件。
+        self.save_config_file()
 
     def on_load_config(self):
         print("on_load_config")
-        # ... 从磁盘加载配置文件。
+        self.load_config_file()
 
     def on_start_auto_move(self):
         print("on_start_auto_move")
@@ -109,54 +318,74 @@ class VirtualDesktopEnhancerCore:
         print("on_language_changed")
         # ... 更改界面语言。
 
+    # 根据配置文件中的所有条目，返回所有匹配的窗口，Pin 的窗口在所有桌面上都可见，不需要移动
+    # 使用上一次 refresh_all_windows 的结果
     def get_windows_to_move(self) -> List[int]:
-        print("get_windows_to_move")
-        return []
-        # ... 根据配置文件中的所有条目，返回一个列表，列表中包含了所有匹配的窗口。
+        with self.refresh_lock:
+            return self.window_table.get_source_hwnds(matched=True, pinned=False)
 
-    def on_virtual_desktop_changed(self) -> bool:
+    # 在 DesktopSwitchCoalescer 的后台线程中调用，is_stale 判断是否已经有更新的切换事件
+    def on_virtual_desktop_changed(self, is_stale: Callable[[], bool] = None) -> bool:
         if not self.monitoring:
             print("不在监听虚拟桌面切换事件")
             return False
-        index = get_current_desktop_number()
+        backend = self.backend
+        backend.invalidate_desktop_metadata(current_only=True)
+        index = backend.get_current_desktop_number()
         if self.last_desktop_idx == index: # 事实上这个条件可能在不是切换虚拟桌面的时候也会满足，所以需要进一步判断当前的虚拟桌面序号是否真的发生变动
-            print(f"同一桌面{index} {get_desktop_name(index)}的重复回调")
+            print(f"同一桌面{index} {backend.get_desktop_name(index)}的重复回调")
             pass # 不做操作
         else:
-            print(f"切换到虚拟桌面 {index} {get_desktop_name(index)}")
-            for hwnd in self.get_windows_to_move():
-                print(f"移动句柄{hwnd} {get_window_title_from_hwnd(hwnd)} 到虚拟桌面 {index} {get_desktop_name(index)}")
-                move_window_to_desktop(hwnd, index)
+            print(f"切换到虚拟桌面 {index} {backend.get_desktop_name(index)}")
+            if not self.move_matched_windows_to_desktop(index, is_stale):
+                return False
             self.last_desktop_idx = index
         return True
     
-    def toggle_pin_window(self, window_info: WindowInfo):
-        pinned = get_window_is_pinned(window_info.hwnd)
-        if pinned:
-            set_window_unpin(window_info.hwnd)
-            window_info.pinned = False
-            self.pinned_windows.remove(window_info)
-        else:
-            set_window_pin(window_info.hwnd)
-            window_info.pinned = True
-            self.pinned_windows.append(window_info)
-        window_info.refresh_window_info_from_hwnd(window_info.hwnd)
+    # 和后台刷新互斥，刷新会重建 pinned_windows
+    # source_hwnd 是枚举得到的顶层窗口句柄，界面只持有行快照，在锁内重新找到窗口，窗口已经消失时忽略
+    def toggle_pin_window(self, source_hwnd: int):
+        with self.refresh_lock:
+            window_info = self.window_info_cache.get(source_hwnd)
+            if window_info is None or not window_info.valid:
+                return
+            pinned = self.backend.get_window_is_pinned(window_info.hwnd)
+            if pinned:
+                self.backend.set_window_unpin(window_info.hwnd)
+                window_info.pinned = False
+                if window_info in self.pinned_windows:
+                    self.pinned_windows.remove(window_info)
+            else:
+                self.backend.set_window_pin(window_info.hwnd)
+                window_info.pinned = True
+                self.pinned_windows.append(window_info)
+            window_info.refresh_volatile_info()
 
 
     def run(self):
-        if(self.qapp is None):
-            self.qapp = QApplication(sys.argv)
-        self.qapp.setQuitOnLastWindowClosed(False)
+        trace = get_startup_trace()
+        with trace.phase('import_ui'):
+            from PyQt5.QtWidgets import QApplication
+            import VirtualDesktopEnhancerWindow as VDE_Window
+
+        with trace.phase('qapp'):
+            if(self.qapp is None):
+                self.qapp = QApplication(sys.argv)
+            self.qapp.setQuitOnLastWindowClosed(False)
 
-        if(self.vde_window is None):
-            self.vde_window = VDE_Window.VirtualDesktopEnhancerWindow(self)
-        self.vde_window.show()
+        with trace.phase('window'):
+            if(self.vde_window is None):
+                self.vde_window = VDE_Window.VirtualDesktopEnhancerWindow(self)
+        with trace.phase('show'):
+            self.vde_window.show()
+        trace.finish()
 
         sys.exit(self.qapp.exec_())
 
     def unpin_all_windows(self):
-        for window in self.pinned_windows:
-            set_window_unpin(window.hwnd)
-            window.pinned = False
-            window.refresh_window_info_from_hwnd(window.hwnd)
-        self.pinned_windows = []
+        with self.refresh_lock:
+            for window in self.pinned_windows:
+                self.backend.set_window_unpin(window.hwnd)
+                window.pinned = False
+                window.refresh_volatile_info()
+            self.pinned_windows = []
@@ -1,17 +1,27 @@
 # -*- coding: utf-8 -*-
 
 import ctypes
-from PyQt5.QtCore import Qt, QTimer, QSize, QLocale, QRect
-from PyQt5.QtGui import QImage, QFont, QPainter, QPen, QPixmap, QIcon
+from PyQt5.QtCore import Qt, QObject, QTimer, QSize, QLocale, QRect, QAbstractListModel, QModelIndex, pyqtSignal
+from PyQt5.QtGui import QImage, QFont, QPainter, QPen, QPixmap, QIcon, QBrush
 from PyQt5.QtWidgets import *
-from VirtualDesktopAccessor import get_current_desktop_number, get_desktop_name, move_window_to_desktop
+from WindowBackend import get_window_backend
+from IconCache import get_icon_cache
+from IconAtlas import get_icon_atlas
+from IconLoader import IconLoader, ICON_PRIORITY_VISIBLE, ICON_PRIORITY_NORMAL
 import sys
-from ShellHook import WM_SHELLHOOKMESSAGE, HSHELL_VIRTUAL_DESKTOP_CHANGED, MSG, RegisterShellHook
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from DesktopEvents import DesktopEventSource, ShellHookEventSource, DesktopSwitchCoalescer
 import VirtualDesktopEnhancerCore as VDE_Core
-from AppUtility import get_icon_from_hwnd
-from UWP_Utility import package_full_name_from_handle
-from WindowMatch import WindowInfo, WindowMatchConfig, WindowMatchMode
-from LP_Wrapper import lp_wrapper
+from WindowMatch import WindowMatchConfig, WindowMatchMode
+from LP_Wrapper import lp_wrapper, get_line_profiler_controller
+from StageTimings import get_stage_timings, STAGE_UI_APPLY
+from StartupTrace import get_startup_trace, STARTUP_MILESTONE_TRAY
+from WindowSnapshot import WindowSnapshotStore
+from WindowTable import WindowRowSnapshot
 
 SHOW_MATCHED_STATE = True
 SHOW_DESKTOP_NAME = True
@@ -20,82 +30,369 @@ SHOW_PID = True
 SHOW_HWND = True
 SHOW_HEX = False
 
-class CurrentWindowItem(QListWidgetItem):
-    @classmethod
-    def from_WindowInfo(self, window_info: WindowInfo):
-        # self.icon_img = get_icon_from_hwnd(window_info.hwnd)
-        item = CurrentWindowItem(window_info.matched, window_info.hwnd, window_info.title, window_info)
-        return item
+ICON_ATLAS_SAVE_INTERVAL_MS = 5 * 60 * 1000
+CONFIG_WATCH_INTERVAL_MS = 2000  # 检查匹配规则文件是否被其他程序修改的间隔
+WINDOW_SNAPSHOT_SAVE_INTERVAL_MS = 60 * 1000  # 列表有变化时保存窗口快照的间隔
+WINDOW_SNAPSHOT_EXIT_TIMEOUT = 1.0  # 退出时等待正在进行的后台刷新的最长时间，单位秒
 
-    def __init__(self, matched: bool, hwnd: int, title: str, window_info: WindowInfo = None):
-        super().__init__()
-        self.window_info = window_info
-        self.icon_img = None
-        self.refresh()
-    
-    def refresh(self):
-        self.matched = self.window_info.matched
-        self.pinned = self.window_info.pinned
-        self.hwnd = self.window_info.hwnd
-        self.title = self.window_info.title
-        self.current_desktop_idx = self.window_info.current_desktop_idx
-        self.app_name = self.window_info.app_name
-        self.pid = self.window_info.process_id
-        self.is_UWP = self.window_info.is_UWP
-
-        self.icon_img = get_icon_from_hwnd(self.hwnd)
-        
-        icon = QIcon(QPixmap.fromImage(self.icon_img)) if self.icon_img is not None else None
-        if icon is not None:
-            self.setIcon(icon)
-        else:
-            print(f"hwnd: {self.hwnd} 未找到图标： {self.title} - {self.app_name}")
-            app = QApplication.instance()
-            app_icon = app.style().standardPixmap(app.style().SP_DesktopIcon)
-            fallback_icon = QIcon()
-            fallback_icon.addPixmap(app_icon, QIcon.Normal, QIcon.Off)
-            self.setIcon(fallback_icon)
-        self.set_current_window_text()
+_placeholder_icon: QIcon = None
 
+# 图标加载完成前以及没有图标时使用的默认图标
+def get_placeholder_icon() -> QIcon:
+    global _placeholder_icon
+    if _placeholder_icon is None:
+        app = QApplication.instance()
+        app_icon = app.style().standardPixmap(app.style().SP_DesktopIcon)
+        _placeholder_icon = QIcon()
+        _placeholder_icon.addPixmap(app_icon, QIcon.Normal, QIcon.Off)
+    return _placeholder_icon
 
-    def set_current_window_text(self):
+# 窗口列表的显示设置，由 WindowItemDelegate 在绘制时读取，修改后只需要重绘可见的行
+class WindowListViewSettings:
+    def __init__(self):
         # TODO: get from config
-        show_desktop_name = SHOW_DESKTOP_NAME
-        show_matched_state = SHOW_MATCHED_STATE
-        show_hwnd = SHOW_HWND
-        show_pid = SHOW_PID
-        show_hex = SHOW_HEX
-        show_app_name = SHOW_APP_NAME
-
-        if show_matched_state:
-            if self.matched and self.pinned:
-                check_mark = "[✓] "
-            elif self.matched and not self.pinned:
-                check_mark = "[▲] "
-            elif not self.matched and self.pinned:
-                check_mark = "[▼] "
-            else:
-                check_mark = "     "
+        self.show_matched_state: bool = SHOW_MATCHED_STATE
+        self.show_desktop_name: bool = SHOW_DESKTOP_NAME
+        self.show_app_name: bool = SHOW_APP_NAME
+        self.show_pid: bool = SHOW_PID
+        self.show_hwnd: bool = SHOW_HWND
+        self.show_hex: bool = SHOW_HEX
+
+# 列表中每一行显示的文字
+def get_window_item_text(window_info: WindowRowSnapshot, settings: WindowListViewSettings) -> str:
+    show_desktop_name = settings.show_desktop_name
+    show_matched_state = settings.show_matched_state
+    show_hwnd = settings.show_hwnd
+    show_pid = settings.show_pid
+    show_hex = settings.show_hex
+    show_app_name = settings.show_app_name
+
+    matched = window_info.matched
+    pinned = window_info.pinned
+    if show_matched_state:
+        if matched and pinned:
+            check_mark = "[✓] "
+        elif matched and not pinned:
+            check_mark = "[▲] "
+        elif not matched and pinned:
+            check_mark = "[▼] "
         else:
             check_mark = "     "
-        desktop_name = (f"{self.current_desktop_idx}<{get_desktop_name(self.current_desktop_idx)}> - " if not self.pinned else "<Pinned> - ") if show_desktop_name else ""
-        app_name_text = f"[{self.app_name}] - " if show_app_name else ""
-        hwnd_text = f" - HWND: {self.hwnd if not show_hex else hex(self.hwnd)}" if show_hwnd else ""
-        pid_text = f" - PID: {self.pid if not show_hex else hex(self.pid)}" if show_pid else ""
-        is_UWP_text = " - (UWP)" if self.is_UWP else ""
-        self.setText(f"{check_mark}{desktop_name}{app_name_text}{self.title}{pid_text}{hwnd_text}{is_UWP_text}")
-
-        color = Qt.black
-        if self.matched:
-            if self.pinned:
-                color = Qt.darkGreen
+    else:
+        check_mark = "     "
+    desktop_idx = window_info.current_desktop_idx
+    desktop_name = (f"{desktop_idx}<{get_window_backend().get_desktop_name(desktop_idx)}> - " if not pinned else "<Pinned> - ") if show_desktop_name else ""
+    app_name_text = f"[{window_info.app_name}] - " if show_app_name else ""
+    hwnd_text = f" - HWND: {window_info.hwnd if not show_hex else hex(window_info.hwnd)}" if show_hwnd else ""
+    pid_text = f" - PID: {window_info.process_id if not show_hex else hex(window_info.process_id)}" if show_pid else ""
+    is_UWP_text = " - (UWP)" if window_info.is_UWP else ""
+    return f"{check_mark}{desktop_name}{app_name_text}{window_info.title}{pid_text}{hwnd_text}{is_UWP_text}"
+
+def get_window_item_color(window_info: WindowRowSnapshot):
+    color = Qt.black
+    if window_info.matched:
+        if window_info.pinned:
+            color = Qt.darkGreen
+        else:
+            color = Qt.yellow
+    else:
+        if window_info.pinned:
+            color = Qt.darkRed
+    return color
+
+class WindowSortColumn(Enum):
+    DEFAULT = 0  # 匹配和 pinned 的窗口在前，然后按桌面、应用名、标题
+    DESKTOP = 1
+    APP_NAME = 2
+    TITLE = 3
+    PID = 4
+    HWND = 5
+
+WINDOW_SORT_COLUMN_NAMES = {
+    WindowSortColumn.DEFAULT: "Pinned / Matched",
+    WindowSortColumn.DESKTOP: "Desktop",
+    WindowSortColumn.APP_NAME: "App Name",
+    WindowSortColumn.TITLE: "Title",
+    WindowSortColumn.PID: "PID",
+    WindowSortColumn.HWND: "HWND",
+}
+
+# 排序键，选择的列在最前，其余按默认顺序，最后是 hwnd，保证任意两个窗口的键都不相同
+def get_window_sort_key(window_info: WindowRowSnapshot, sort_column: WindowSortColumn = WindowSortColumn.DEFAULT) -> tuple:
+    desktop_idx = window_info.current_desktop_idx
+    if desktop_idx is None:
+        desktop_idx = -1
+    app_name = (window_info.app_name or "").casefold()
+    title = (window_info.title or "").casefold()
+    hwnd = window_info.hwnd
+    default_key = (not window_info.pinned, not window_info.matched, desktop_idx, app_name, title, hwnd)
+    if sort_column == WindowSortColumn.DESKTOP:
+        return (desktop_idx,) + default_key
+    elif sort_column == WindowSortColumn.APP_NAME:
+        return (app_name,) + default_key
+    elif sort_column == WindowSortColumn.TITLE:
+        return (title,) + default_key
+    elif sort_column == WindowSortColumn.PID:
+        return (window_info.process_id if window_info.process_id is not None else -1,) + default_key
+    elif sort_column == WindowSortColumn.HWND:
+        return (hwnd,) + default_key
+    return default_key
+
+
+WINDOW_ROW_ROLE = Qt.UserRole + 1
+WINDOW_LIST_RESORT_RATIO = 8  # 键变化的行超过总行数的 1/8 时整体重新排序，否则逐行二分移动
+
+# 窗口列表的数据模型，每一行是核心在锁内取出的 WindowRowSnapshot，不引用核心中会被后台刷新修改的 WindowInfo
+# 视图只为可见的行取数据，只有在界面线程中调用 set_window_rows 时才会替换
+# 行始终按 sort_column 的排序键有序，刷新时和上一次的内容比较，只发出删除、插入、移动和 dataChanged，不重建整个列表
+class WindowListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: list[WindowRowSnapshot] = []
+        self._hwnds: list[int] = []  # 每一行的 hwnd，和 _rows 对应
+        self._sort_keys: list[tuple] = []
+        self.sort_column: WindowSortColumn = WindowSortColumn.DEFAULT
+        self._rows_by_hwnd: dict[int, int] = {}
+        self._icons: dict[int, QIcon] = {}  # hwnd -> 已经加载的图标
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        window_info = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return window_info.title  # 完整的显示文字由 WindowItemDelegate 按显示设置生成
+        if role == WINDOW_ROW_ROLE:
+            return window_info
+        if role == Qt.DecorationRole:
+            return self._icons.get(window_info.hwnd, get_placeholder_icon())
+        if role == Qt.ForegroundRole:
+            return QBrush(get_window_item_color(window_info))
+        return None
+
+    def get_window_row(self, row: int) -> WindowRowSnapshot:
+        return self._rows[row]
+
+    def get_hwnd(self, row: int) -> int:
+        return self._hwnds[row]
+
+    def get_row(self, hwnd: int) -> int:
+        return self._rows_by_hwnd.get(hwnd, -1)
+
+    def _update_rows_by_hwnd(self):
+        self._rows_by_hwnd = {hwnd: row for row, hwnd in enumerate(self._hwnds)}
+
+    def set_sort_column(self, sort_column: WindowSortColumn):
+        if sort_column == self.sort_column:
+            return
+        self.sort_column = sort_column
+        self._sort_keys = [get_window_sort_key(window_info, sort_column) for window_info in self._rows]
+        self._resort_all()
+
+    # 按 _sort_keys 整体重新排序
+    def _resort_all(self):
+        self.layoutAboutToBeChanged.emit()
+        order = sorted(range(len(self._rows)), key=self._sort_keys.__getitem__)
+        new_rows = [0] * len(order)
+        for new_row, old_row in enumerate(order):
+            new_rows[old_row] = new_row
+        self._rows = [self._rows[row] for row in order]
+        self._hwnds = [self._hwnds[row] for row in order]
+        self._sort_keys = [self._sort_keys[row] for row in order]
+        for index in self.persistentIndexList():
+            self.changePersistentIndex(index, self.index(new_rows[index.row()], 0))
+        self.layoutChanged.emit()
+        self._update_rows_by_hwnd()
+
+    # 把一行移动到 new_row（移动后的行号）
+    def _move_row(self, row: int, new_row: int):
+        if new_row == row:
+            return
+        # beginMoveRows 的目标位置是移动前的行号
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), new_row if new_row < row else new_row + 1)
+        for values in (self._sort_keys, self._rows, self._hwnds):
+            values.insert(new_row, values.pop(row))
+        self.endMoveRows()
+
+    # 排序键变化的行先移到末尾，前面剩下的行仍然有序，再把它们逐个二分插入回去
+    def _move_rows_to_sorted_positions(self, window_infos: list[WindowRowSnapshot]):
+        rows = sorted((self._rows_by_hwnd[window_info.hwnd] for window_info in window_infos), reverse=True)
+        last_row = len(self._rows) - 1
+        for row in rows:
+            self._move_row(row, last_row)
+        sorted_count = len(self._rows) - len(rows)
+        while sorted_count < len(self._rows):
+            new_row = bisect.bisect_left(self._sort_keys, self._sort_keys[sorted_count], 0, sorted_count)
+            self._move_row(sorted_count, new_row)
+            sorted_count += 1
+
+    # rows 是 VirtualDesktopEnhancerCore.get_window_row_snapshots 的结果，只能在界面线程中调用
+    def set_window_rows(self, rows: list[WindowRowSnapshot]):
+        new_rows_by_hwnd = {window_info.hwnd: window_info for window_info in rows}
+
+        # 删除已经不存在的窗口，从后往前按连续的区间删除
+        row = len(self._rows) - 1
+        while row >= 0:
+            if self._hwnds[row] in new_rows_by_hwnd:
+                row -= 1
+                continue
+            last = row
+            while row > 0 and self._hwnds[row - 1] not in new_rows_by_hwnd:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row, last)
+            del self._rows[row:last + 1]
+            del self._hwnds[row:last + 1]
+            del self._sort_keys[row:last + 1]
+            self.endRemoveRows()
+            row -= 1
+
+        # 保留下来的窗口：快照和上一次相同的行不需要处理，不同的行替换快照、重新计算排序键，找出排序键变化的行
+        # 内容变化的行记在 changed_hwnds 中，排序完成后再发出 dataChanged
+        moved_infos = []
+        changed_hwnds = set()
+        for row, hwnd in enumerate(self._hwnds):
+            window_info = new_rows_by_hwnd[hwnd]
+            if window_info == self._rows[row]:
+                continue
+            self._rows[row] = window_info
+            changed_hwnds.add(hwnd)
+            key = get_window_sort_key(window_info, self.sort_column)
+            if key != self._sort_keys[row]:
+                self._sort_keys[row] = key
+                moved_infos.append(window_info)
+        if len(moved_infos) * WINDOW_LIST_RESORT_RATIO > len(self._rows):
+            self._resort_all()
+        elif moved_infos:
+            self._update_rows_by_hwnd()
+            self._move_rows_to_sorted_positions(moved_infos)
+
+        # 插入新的窗口：新窗口先排好序，再依次二分查找插入位置，落在同一个位置的连续插入
+        kept_hwnds = set(self._hwnds)
+        added = sorted(((get_window_sort_key(window_info, self.sort_column), hwnd, window_info)
+                        for hwnd, window_info in new_rows_by_hwnd.items() if hwnd not in kept_hwnds),
+                       key=lambda item: item[0])
+        i = 0
+        lo = 0
+        while i < len(added):
+            row = bisect.bisect_left(self._sort_keys, added[i][0], lo)
+            j = i + 1
+            if row < len(self._sort_keys):
+                while j < len(added) and added[j][0] < self._sort_keys[row]:
+                    j += 1
             else:
-                color = Qt.yellow
+                j = len(added)
+            self.beginInsertRows(QModelIndex(), row, row + j - i - 1)
+            self._sort_keys[row:row] = [key for key, _hwnd, _window_info in added[i:j]]
+            self._hwnds[row:row] = [hwnd for _key, hwnd, _window_info in added[i:j]]
+            self._rows[row:row] = [window_info for _key, _hwnd, window_info in added[i:j]]
+            self.endInsertRows()
+            changed_hwnds.update(hwnd for _key, hwnd, _window_info in added[i:j])
+            lo = row + j - i
+            i = j
+
+        # 内容变化的行和新插入的行按连续的区间发出 dataChanged
+        if changed_hwnds:
+            changed_first = -1
+            for row, hwnd in enumerate(self._hwnds):
+                if hwnd in changed_hwnds:
+                    if changed_first < 0:
+                        changed_first = row
+                elif changed_first >= 0:
+                    self.dataChanged.emit(self.index(changed_first, 0), self.index(row - 1, 0))
+                    changed_first = -1
+            if changed_first >= 0:
+                self.dataChanged.emit(self.index(changed_first, 0), self.index(len(self._rows) - 1, 0))
+
+        self._update_rows_by_hwnd()
+        self._icons = {hwnd: icon for hwnd, icon in self._icons.items() if hwnd in new_rows_by_hwnd}
+
+    # 图标由 IconLoader 在后台加载，加载完成后设置，空的 QImage 表示没有图标
+    def set_icon_image(self, hwnd: int, image: QImage):
+        row = self.get_row(hwnd)
+        if row < 0:
+            return
+        if image is None or image.isNull():
+            window_info = self._rows[row]
+            print(f"hwnd: {hwnd} 未找到图标： {window_info.title} - {window_info.app_name}")
+            self._icons[hwnd] = get_placeholder_icon()
         else:
-            if self.pinned:
-                color = Qt.darkRed
+            self._icons[hwnd] = QIcon(QPixmap.fromImage(image))
+        index = self.index(row, 0)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def has_icon(self, hwnd: int) -> bool:
+        return hwnd in self._icons
+
+    def remove_icon(self, hwnd: int):
+        if self._icons.pop(hwnd, None) is None:
+            return
+        row = self.get_row(hwnd)
+        if row >= 0:
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+
+# 绘制时按显示设置生成每一行的文字，显示设置变化时不需要修改模型
+class WindowItemDelegate(QStyledItemDelegate):
+    def __init__(self, settings: WindowListViewSettings, parent=None):
+        super().__init__(parent)
+        self.settings: WindowListViewSettings = settings
+
+    def initStyleOption(self, option, index: QModelIndex):
+        super().initStyleOption(option, index)
+        window_info = index.data(WINDOW_ROW_ROLE)
+        if window_info is not None:
+            option.text = get_window_item_text(window_info, self.settings)
+
+# 在后台线程中执行 core.refresh_all_windows，并在同一个线程中取出窗口的行快照，
+# 完成后通过 finished 把快照交给界面线程的槽函数，刷新失败时为 None
+# 刷新进行中再次请求时，结束后再刷新一次，期间的多次请求合并为一次
+class BackgroundWindowRefresher(QObject):
+    finished = pyqtSignal(object)
+
+    def __init__(self, core: 'VDE_Core.VirtualDesktopEnhancerCore', parent: QObject = None):
+        super().__init__(parent)
+        self.core: VDE_Core.VirtualDesktopEnhancerCore = core
+        self._running: bool = False
+        self._pending: bool = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='window_refresh')
+        self._lock = threading.Lock()
+
+    # 是否有刷新正在进行或等待进行
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def request(self):
+        with self._lock:
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        self._executor.submit(self._run)
+
+    def _run(self):
+        while True:
+            rows = None
+            try:
+                self.core.refresh_all_windows()
+                rows = self.core.get_window_row_snapshots()
+            except Exception as e:
+                print(f"后台刷新窗口失败: {e}")
+            self.finished.emit(rows)
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-        self.setForeground(color)
 
 class MatchedWindowItem(QListWidgetItem):
     def __init__(self, hwnd: int, title: str, icon: QImage):
@@ -118,23 +415,60 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
 
         self.core: VDE_Core.VirtualDesktopEnhancerCore = core
         self.locale = QLocale()
+        trace = get_startup_trace()
+
+        # 图标优先从上次保存的图集中读取，第一次绘制列表时不需要提取图标
+        with trace.phase('icon_atlas'):
+            get_icon_cache().set_backing_store(get_icon_atlas())
+
+        # 图标在后台线程中加载，列表先显示默认图标
+        self.view_settings = WindowListViewSettings()
+        self.window_list_model = WindowListModel(self)
+        self.icon_loader = IconLoader(self)
+        self.icon_loader.icon_ready.connect(self.on_icon_ready)
+
+        # 启动和从托盘恢复时先显示已有的列表（启动时是上次保存的快照），窗口信息在后台刷新
+        self.window_snapshot_store = WindowSnapshotStore()
+        self.snapshot_identities: dict[int, tuple] = None  # 快照中窗口的 (进程, 窗口类)，第一次后台刷新完成后用于核对
+        self.window_list_changed: bool = False  # 上次保存快照之后列表是否刷新过
+        self.background_refresher = BackgroundWindowRefresher(self.core, self)
+        self.background_refresher.finished.connect(self.on_background_refresh_finished)
 
         # 初始化UI
-        self.init_ui()
+        with trace.phase('init_ui'):
+            self.init_ui()
 
         # 加载配置文件
         self.load_config()
 
+        # 定期保存新提取的图标
+        self.icon_atlas_save_timer = QTimer(self)
+        self.icon_atlas_save_timer.timeout.connect(self.save_icon_atlas)
+        self.icon_atlas_save_timer.start(ICON_ATLAS_SAVE_INTERVAL_MS)
+
+        # 匹配规则文件被修改后重新加载，不需要重启
+        self.config_watch_timer = QTimer(self)
+        self.config_watch_timer.timeout.connect(self.on_config_watch_timer)
+        self.config_watch_timer.start(CONFIG_WATCH_INTERVAL_MS)
+
+        # 定期保存窗口快照
+        self.window_snapshot_save_timer = QTimer(self)
+        self.window_snapshot_save_timer.timeout.connect(self.save_window_snapshot)
+        self.window_snapshot_save_timer.start(WINDOW_SNAPSHOT_SAVE_INTERVAL_MS)
+
         # 设置定时器
         # self.refresh_timer = QTimer(self)
         # self.refresh_timer.timeout.connect(self.refresh_all_windows)
         # self.refresh_timer.start(5000)
 
-        # 注册ShellHook
-        # RegisterShellHook(self.winId())
+        # 虚拟桌面切换事件，开始自动移动时才注册 ShellHook
+        self.desktop_event_source: DesktopEventSource = None
+        self.desktop_switch_coalescer = DesktopSwitchCoalescer(self.core.on_virtual_desktop_changed, parent=self)
+        self.desktop_switch_coalescer.switch_handled.connect(self.on_desktop_switch_handled)
 
         # 初始化系统托盘
-        self.init_system_tray()
+        with trace.phase('tray'):
+            self.init_system_tray()
 
 
     def init_ui(self):
@@ -161,7 +495,7 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         vbox_main.addLayout(vbox_current_desktop_label)
         
         self.current_vd_label = QLabel(self)
-        self.current_vd_label.setText(f"Current Virtual Desktop: {get_current_desktop_number()} {get_desktop_name(get_current_desktop_number())}")
+        self.refresh_current_desktop_label()
         vbox_current_desktop_label.addWidget(self.current_vd_label)
 
         # 窗口列表和分割器
@@ -187,11 +521,26 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         all_windows_list_vbox = QVBoxLayout()
         all_window_vbox.addLayout(all_windows_list_vbox)
 
-        self.all_windows_label = QLabel("All Windows:", self)
-        all_windows_list_vbox.addWidget(self.all_windows_label)
+        all_windows_label_hbox = QHBoxLayout()
+        all_windows_list_vbox.addLayout(all_windows_label_hbox)
 
-        self.all_windows_list = QListWidget(self)
+        self.all_windows_label = QLabel("All Windows:", self)
+        all_windows_label_hbox.addWidget(self.all_windows_label)
+        all_windows_label_hbox.addStretch(1)
+
+        all_windows_label_hbox.addWidget(QLabel("Sort by:", self))
+        self.sort_column_combo = QComboBox(self)
+        for sort_column, name in WINDOW_SORT_COLUMN_NAMES.items():
+            self.sort_column_combo.addItem(name, sort_column)
+        self.sort_column_combo.currentIndexChanged.connect(self.on_sort_column_changed)
+        all_windows_label_hbox.addWidget(self.sort_column_combo)
+
+        self.all_windows_list = QListView(self)
+        self.all_windows_list.setModel(self.window_list_model)
+        self.all_windows_list.setItemDelegate(WindowItemDelegate(self.view_settings, self.all_windows_list))
+        self.all_windows_list.setUniformItemSizes(True)
         self.all_windows_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.all_windows_list.verticalScrollBar().valueChanged.connect(self.request_visible_icons)
         all_windows_list_vbox.addWidget(self.all_windows_list)
 
         refresh_all_windows_btn_Hbox = QHBoxLayout()
@@ -221,32 +570,32 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         all_window_vbox.addLayout(self.display_config_checkboxes_vbox)
 
         self.show_matched_state_checkbox = QCheckBox("Show Pinned State", self)
-        self.show_matched_state_checkbox.setChecked(SHOW_MATCHED_STATE)
+        self.show_matched_state_checkbox.setChecked(self.view_settings.show_matched_state)
         self.show_matched_state_checkbox.stateChanged.connect(self.on_show_matched_state_checkbox_state_changed)
         self.display_config_checkboxes_vbox.addWidget(self.show_matched_state_checkbox)
         
         self.show_desktop_name_checkbox = QCheckBox("Show Desktop Name", self)
-        self.show_desktop_name_checkbox.setChecked(SHOW_DESKTOP_NAME)
+        self.show_desktop_name_checkbox.setChecked(self.view_settings.show_desktop_name)
         self.show_desktop_name_checkbox.stateChanged.connect(self.on_show_desktop_name_checkbox_state_changed)
         self.display_config_checkboxes_vbox.addWidget(self.show_desktop_name_checkbox)
 
         self.show_app_name_checkbox = QCheckBox("Show App Name", self)
-        self.show_app_name_checkbox.setChecked(SHOW_APP_NAME)
+        self.show_app_name_checkbox.setChecked(self.view_settings.show_app_name)
         self.show_app_name_checkbox.stateChanged.connect(self.on_show_app_name_checkbox_state_changed)
         self.display_config_checkboxes_vbox.addWidget(self.show_app_name_checkbox)
         
         self.show_pid_checkbox = QCheckBox("Show PID", self)
-        self.show_pid_checkbox.setChecked(SHOW_PID)
+        self.show_pid_checkbox.setChecked(self.view_settings.show_pid)
         self.show_pid_checkbox.stateChanged.connect(self.on_show_pid_checkbox_state_changed)
         self.display_config_checkboxes_vbox.addWidget(self.show_pid_checkbox)
 
         self.show_hwnd_checkbox = QCheckBox("Show HWND", self)
-        self.show_hwnd_checkbox.setChecked(SHOW_HWND)
+        self.show_hwnd_checkbox.setChecked(self.view_settings.show_hwnd)
         self.show_hwnd_checkbox.stateChanged.connect(self.on_show_hwnd_checkbox_state_changed)
         self.display_config_checkboxes_vbox.addWidget(self.show_hwnd_checkbox)
 
         self.show_hex_checkbox = QCheckBox("Show PID and HWND in hexadecimal", self)
-        self.show_hex_checkbox.setChecked(SHOW_HEX)
+        self.show_hex_checkbox.setChecked(self.view_settings.show_hex)
         self.show_hex_checkbox.stateChanged.connect(self.on_show_hex_checkbox_state_changed)
         self.display_config_checkboxes_vbox.addWidget(self.show_hex_checkbox)
 
@@ -323,8 +672,10 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         # running_control_vbox.addWidget(self.test_text_box)
         
         # 其他初始化
-        self.core.refresh_all_windows() 
-        self.refresh_window_list_content()
+        # 先显示上次保存的快照，不等待枚举窗口
+        with get_startup_trace().phase('window_snapshot'):
+            self.show_window_snapshot()
+        self.background_refresher.request()
         self.setWindowTitle("Virtual Desktop Enhancer")
 
         self.setGeometry(0, 0, 800, 960)
@@ -334,28 +685,108 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         self.move((screen.width() - window.width()) // 2, (screen.height() - window.height()) // 4)
 
 
-    def refresh_window_list_content(self):
-        self.all_windows_list.clear()
-        for window_info in self.core.window_infos:
-            item = CurrentWindowItem.from_WindowInfo(window_info)
-            self.all_windows_list.addItem(item)
-        self.all_windows_label.setText(f"All Windows ({self.all_windows_list.count()}):")
-            
-        # 把匹配和 pinned 的窗口放到最前面
-        for i in range(self.all_windows_list.count()):
-            item = self.all_windows_list.item(i)
-            if item.matched is True:
-                self.all_windows_list.takeItem(i)
-                self.all_windows_list.insertItem(0, item)
-        
-        for i in range(self.all_windows_list.count()):
-            item = self.all_windows_list.item(i)
-            if item.pinned is True:
-                self.all_windows_list.takeItem(i)
-                self.all_windows_list.insertItem(0, item)
+    # rows 是 core.get_window_row_snapshots 的结果，为 None 时在这里取，不读取核心中的 WindowInfo
+    # 其他线程正在刷新时不等待，交给后台刷新，完成后会带着新的快照再调用这里
+    def refresh_window_list_content(self, rows: list[WindowRowSnapshot] = None):
+        start = time.perf_counter()
+        if rows is None:
+            rows = self.core.get_window_row_snapshots(timeout=0)
+            if rows is None:
+                self.background_refresher.request()
+                return
+        self.window_list_changed = True
+        # 被新窗口使用的句柄，丢弃旧窗口的图标
+        for hwnd in self.core.pop_reused_hwnds():
+            self.window_list_model.remove_icon(hwnd)
+            self.icon_loader.discard(hwnd)
+        self.icon_loader.begin_generation(window_info.hwnd for window_info in rows)
+        self.window_list_model.set_window_rows(rows)
+        self.all_windows_label.setText(f"All Windows ({self.window_list_model.rowCount()}):")
+
+        # 先请求当前可见行的图标，再请求其余的
+        self.request_visible_icons()
+        for row in range(self.window_list_model.rowCount()):
+            hwnd = self.window_list_model.get_hwnd(row)
+            if not self.window_list_model.has_icon(hwnd):
+                self.icon_loader.request(hwnd, ICON_PRIORITY_NORMAL)
+        get_stage_timings().lap(STAGE_UI_APPLY, start)
+
+    # 显示上次保存的窗口快照，图标直接从图集中取出，不查询窗口
+    def show_window_snapshot(self) -> bool:
+        rows = self.window_snapshot_store.load()
+        if not rows:
+            return False
+        window_infos = [WindowRowSnapshot.from_row_values(values) for values, _icon_key in rows]
+        self.window_list_model.set_window_rows(window_infos)
+        self.all_windows_label.setText(f"All Windows ({self.window_list_model.rowCount()}):")
+        icon_cache = get_icon_cache()
+        self.snapshot_identities = {}
+        for window_info, (_values, icon_key) in zip(window_infos, rows):
+            self.snapshot_identities[window_info.hwnd] = (window_info.process_id, window_info.window_class)
+            if icon_key is None:
+                continue
+            found, image = icon_cache.lookup_stored(icon_key)
+            if found and image is not None:
+                self.window_list_model.set_icon_image(window_info.hwnd, image)
+                self.icon_loader.set_icon_key(window_info.hwnd, icon_key)
+        print(f"显示窗口快照: {len(window_infos)} 个窗口")
+        return True
+
+    # 后台刷新完成，用后台线程取出的行快照更新列表
+    def on_background_refresh_finished(self, rows: list[WindowRowSnapshot]):
+        if rows is None:
+            return
+        if self.snapshot_identities is not None:
+            # 快照中的窗口句柄可能已经被新的窗口使用，进程或窗口类不同时丢弃快照中的图标
+            for window_info in rows:
+                identity = self.snapshot_identities.get(window_info.hwnd)
+                if identity is not None and identity != (window_info.process_id, window_info.window_class):
+                    self.window_list_model.remove_icon(window_info.hwnd)
+                    self.icon_loader.discard(window_info.hwnd)
+            self.snapshot_identities = None
+        self.refresh_window_list_content(rows)
+        self.refresh_current_desktop_label()
+
+    # 保存窗口快照，列表在上次保存之后没有刷新过时不保存
+    # 后台正在刷新时最多等待 timeout 秒，超时则跳过这一次
+    def save_window_snapshot(self, timeout: float = 0):
+        if not self.window_list_changed:
+            return
+        window_infos = self.core.get_window_row_snapshots(timeout=timeout)
+        if window_infos is None:
+            return
+        icon_loader = self.icon_loader
+        rows = [(window_info.to_row_values(), icon_loader.get_icon_key(window_info.hwnd)) for window_info in window_infos]
+        if self.window_snapshot_store.save(rows):
+            self.window_list_changed = False
+
+    # 当前可见的行的范围 [first, last)
+    def get_visible_rows(self) -> tuple:
+        count = self.window_list_model.rowCount()
+        if count == 0:
+            return 0, 0
+        viewport = self.all_windows_list.viewport()
+        first = self.all_windows_list.indexAt(viewport.rect().topLeft()).row()
+        if first < 0:
+            first = 0
+        row_height = max(self.all_windows_list.sizeHintForRow(first), 1)
+        return first, min(count, first + viewport.height() // row_height + 2)
+
+    # 滚动后可见的行变化，把它们的图标调到队列前面
+    def request_visible_icons(self, *_args):
+        first, last = self.get_visible_rows()
+        for row in range(first, last):
+            hwnd = self.window_list_model.get_hwnd(row)
+            if not self.window_list_model.has_icon(hwnd):
+                self.icon_loader.request(hwnd, ICON_PRIORITY_VISIBLE)
+
+    def on_icon_ready(self, generation: int, hwnd: int, image: QImage):
+        if not self.icon_loader.is_current_generation(generation):
+            return
+        self.window_list_model.set_icon_image(hwnd, image)
         
     def on_test(self):
-        move_window_to_desktop(int(self.test_text_box.text(), 16), 1)
+        self.core.backend.move_window_to_desktop(int(self.test_text_box.text(), 16), 1)
 
     def load_config(self):
         print("load_config")
@@ -365,7 +796,7 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         print("save_config")
         # ... 将配置文件保存到磁盘。
 
-    # @lp_wrapper
+    @lp_wrapper
     def refresh_all_windows(self):
         self.core.refresh_all_windows()
         self.refresh_window_list_content()
@@ -375,9 +806,10 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         # ... 将选中的窗口添加到“Match Window”列表框。
 
     def on_toggle_pin_window(self):
-        for item in self.all_windows_list.selectedItems():
-            self.core.toggle_pin_window(item.window_info)
-            item.refresh()
+        selected_rows = self.all_windows_list.selectionModel().selectedRows()
+        source_hwnds = [self.window_list_model.get_window_row(index.row()).source_hwnd for index in selected_rows]
+        for source_hwnd in source_hwnds:
+            self.core.toggle_pin_window(source_hwnd)
         self.refresh_window_list_content()
         print("on_toggle_pin_window")
         # ... 切换选中的窗口的“Pin”状态。
@@ -388,19 +820,51 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
 
     def on_save_config(self):
         print("on_save_config")
-        # ... 保存配置文件。
+        self.core.save_config_file()
 
     def on_load_config(self):
         print("on_load_config")
-        # ... 从磁盘加载配置文件。
+        if self.core.load_config_file():
+            self.refresh_window_list_content()
+
+    def on_config_watch_timer(self):
+        if self.core.reload_config_file_if_changed():
+            self.refresh_window_list_content()
+
+    # 默认使用 ShellHook，测试时可以换成 SyntheticDesktopEventSource
+    def set_desktop_event_source(self, source: DesktopEventSource):
+        if self.desktop_event_source is not None:
+            self.desktop_event_source.stop()
+        self.desktop_event_source = source
+        self.desktop_switch_coalescer.attach(source)
 
     def on_start_auto_move(self):
         print("on_start_auto_move")
-        # ... 开始监听虚拟桌面切换事件。
+        if self.desktop_event_source is None:
+            self.set_desktop_event_source(ShellHookEventSource(int(self.winId()), self))
+        self.core.last_desktop_idx = self.core.backend.get_current_desktop_number()
+        self.core.monitoring = True
+        self.desktop_event_source.start()
 
     def on_stop_auto_move(self):
         print("on_stop_auto_move")
-        # ... 停止监听虚拟桌面切换事件。
+        if self.desktop_event_source is not None:
+            self.desktop_event_source.stop()
+        self.desktop_switch_coalescer.cancel()
+        self.core.monitoring = False
+
+    def on_auto_move_toggled(self, checked: bool):
+        if checked:
+            self.on_start_auto_move()
+        else:
+            self.on_stop_auto_move()
+
+    # 后台线程处理完一次切换后，在界面线程中更新列表
+    def on_desktop_switch_handled(self, generation: int, completed: bool, latency_ms: float):
+        if completed:
+            self.core.backend.invalidate_desktop_metadata()  # 切换时只重新读取了当前桌面序号，这里顺便更新桌面名称
+            self.refresh_window_list_content()
+            self.refresh_current_desktop_label()
 
     def on_exit(self):
         print("on_exit")
@@ -415,30 +879,25 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         # ... 更改界面语言。
 
     def get_windows_to_move(self) -> list[int]:
-        print("get_windows_to_move")
-        return []
-        # ... 根据配置文件中的所有条目，返回一个列表，列表中包含了所有匹配的窗口。
+        return self.core.get_windows_to_move()
 
+    # 将窗口移动到当前虚拟桌面
     def move_windows(self, hwnds: list[int]):
         print("move_windows")
-        # ... 将匹配的窗口移动到当前虚拟桌面。
+        backend = self.core.backend
+        current_desktop_number = backend.get_current_desktop_number()
+        for hwnd in hwnds:
+            backend.move_window_to_desktop(hwnd, current_desktop_number)
 
     def on_move_window_to_me(self):
         print("on_move_window_to_me")
-        # ... 将所有匹配的窗口移动到当前虚拟桌面。
+        self.core.refresh_all_windows()
+        self.move_windows(self.get_windows_to_move())
+        self.on_refresh_button_clicked()
 
     def tr(self, text: str) -> str:
         return text
 
-    # def nativeEvent(self, eventType, message):
-    #     msg = ctypes.wintypes.MSG.from_address(message.__int__())
-    #     if msg.message == WM_SHELLHOOKMESSAGE and msg.wParam == HSHELL_VIRTUAL_DESKTOP_CHANGED:
-    #         success = self.core.on_virtual_desktop_changed()
-    #         if success:
-    #             # self.label.setText(f"当前虚拟桌面: {get_current_destop_number()} {get_desktop_name(get_current_destop_number())}")
-    #             self.update()
-    #     return super(VirtualDesktopEnhancerWindow, self).nativeEvent(eventType, message)
-
     def init_system_tray(self):
         self.tray_icon = QSystemTrayIcon(self)
         app = QApplication.instance()
@@ -448,6 +907,7 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         self.tray_icon.setIcon(fallback_icon)
         self.tray_icon.setToolTip("Virtual Desktop Enhancer")
         self.tray_icon.show()
+        get_startup_trace().mark(STARTUP_MILESTONE_TRAY)
         
 
         # 创建右键菜单
@@ -457,6 +917,25 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         unpin_all_action.triggered.connect(self.on_unpin_all_windows)
         tray_menu.addAction(unpin_all_action)
 
+        self.auto_move_action = QAction("Auto Move", self)
+        self.auto_move_action.setCheckable(True)
+        self.auto_move_action.toggled.connect(self.on_auto_move_toggled)
+        tray_menu.addAction(self.auto_move_action)
+
+        show_timings_action = QAction("Show Timings", self)
+        show_timings_action.triggered.connect(self.on_show_timings)
+        tray_menu.addAction(show_timings_action)
+
+        dump_timings_action = QAction("Dump Timings", self)
+        dump_timings_action.triggered.connect(self.on_dump_timings)
+        tray_menu.addAction(dump_timings_action)
+
+        self.line_profiling_action = QAction("Line Profiling", self)
+        self.line_profiling_action.setCheckable(True)
+        self.line_profiling_action.setChecked(get_line_profiler_controller().enabled)
+        self.line_profiling_action.toggled.connect(self.on_line_profiling_toggled)
+        tray_menu.addAction(self.line_profiling_action)
+
         tray_menu.addSeparator()
         
         # 创建恢复窗口的操作
@@ -488,12 +967,58 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
 
     def restore_window(self):
         self.show()
-        move_window_to_desktop(int(self.winId()), get_current_desktop_number())
+        backend = self.core.backend
+        backend.invalidate_desktop_metadata()  # 窗口隐藏期间可能切换过虚拟桌面
+        backend.move_window_to_desktop(int(self.winId()), backend.get_current_desktop_number())
         self.showNormal()
-        self.on_refresh_button_clicked()
+        # 先显示隐藏前的列表，后台刷新完成后再更新
+        self.refresh_current_desktop_label()
+        self.background_refresher.request()
+
+    # 显示各阶段耗时的 p50 / p95 / p99
+    def on_show_timings(self):
+        message_box = QMessageBox(self)
+        message_box.setWindowTitle("Timings")
+        message_box.setText(get_stage_timings().format_report())
+        message_box.setFont(QFont("Consolas"))
+        message_box.exec_()
+
+    def on_dump_timings(self):
+        try:
+            path = get_stage_timings().dump()
+        except OSError as e:
+            self.tray_icon.showMessage("Virtual Desktop Enhancer", f"Failed to dump timings: {e}")
+            return
+        print(f"耗时统计已保存到 {path}")
+        self.tray_icon.showMessage("Virtual Desktop Enhancer", f"Timings saved to {path}")
+
+    # 开启或关闭逐行性能分析，关闭时把结果写入文件
+    def on_line_profiling_toggled(self, checked: bool):
+        controller = get_line_profiler_controller()
+        if checked:
+            if not controller.enable():
+                self.line_profiling_action.setChecked(False)
+                self.tray_icon.showMessage("Virtual Desktop Enhancer", "line_profiler is not available")
+        else:
+            path = controller.disable()
+            if path is not None:
+                self.tray_icon.showMessage("Virtual Desktop Enhancer", f"Line profile saved to {path}")
+
+    def save_icon_atlas(self):
+        atlas = get_icon_atlas()
+        if atlas.dirty:
+            atlas.save()
 
     def exit_app(self):
         print("exit_app")
+        self.icon_loader.cancel_all()
+        if self.desktop_event_source is not None:
+            self.desktop_event_source.stop()
+        self.desktop_switch_coalescer.shutdown()
+        self.background_refresher.shutdown()
+        self.save_icon_atlas()
+        self.save_window_snapshot(WINDOW_SNAPSHOT_EXIT_TIMEOUT)
+        get_line_profiler_controller().disable()
         self.tray_icon.hide()
         QApplication.quit()
 
@@ -502,54 +1027,43 @@ class VirtualDesktopEnhancerWindow(QMainWindow):
         self.refresh_window_list_content()
 
     def on_show_matched_state_checkbox_state_changed(self, state):
-        global SHOW_MATCHED_STATE
-        if state == Qt.Checked:
-            SHOW_MATCHED_STATE = True
-        else:
-            SHOW_MATCHED_STATE = False
-        self.refresh_window_list_content()
+        self.view_settings.show_matched_state = state == Qt.Checked
+        self.on_view_settings_changed()
 
     def on_show_desktop_name_checkbox_state_changed(self, state):
-        global SHOW_DESKTOP_NAME
-        if state == Qt.Checked:
-            SHOW_DESKTOP_NAME = True
-        else:
-            SHOW_DESKTOP_NAME = False
-        self.refresh_window_list_content()
+        self.view_settings.show_desktop_name = state == Qt.Checked
+        self.on_view_settings_changed()
 
     def on_show_app_name_checkbox_state_changed(self, state):
-        global SHOW_APP_NAME
-        if state == Qt.Checked:
-            SHOW_APP_NAME = True
-        else:
-            SHOW_APP_NAME = False
-        self.refresh_window_list_content()
+        self.view_settings.show_app_name = state == Qt.Checked
+        self.on_view_settings_changed()
 
     def on_show_pid_checkbox_state_changed(self, state):
-        global SHOW_PID
-        if state == Qt.Checked:
-            SHOW_PID = True
-        else:
-            SHOW_PID = False
-        self.refresh_window_list_content()
+        self.view_settings.show_pid = state == Qt.Checked
+        self.on_view_settings_changed()
 
     def on_show_hwnd_checkbox_state_changed(self, state):
-        global SHOW_HWND
-        if state == Qt.Checked:
-            SHOW_HWND = True
-        else:
-            SHOW_HWND = False
-        self.refresh_window_list_content()
+        self.view_settings.show_hwnd = state == Qt.Checked
+        self.on_view_settings_changed()
 
     def on_show_hex_checkbox_state_changed(self, state):
-        global SHOW_HEX
-        if state == Qt.Checked:
-            SHOW_HEX = True
-        else:
-            SHOW_HEX = False
-        self.refresh_window_list_content()
+        self.view_settings.show_hex = state == Qt.Checked
+        self.on_view_settings_changed()
+
+    # 显示设置只影响绘制，重绘可见的行即可
+    def on_view_settings_changed(self):
+        self.all_windows_list.viewport().update()
+
+    def on_sort_column_changed(self, index: int):
+        self.window_list_model.set_sort_column(self.sort_column_combo.itemData(index))
+        self.request_visible_icons()
 
     def on_refresh_button_clicked(self):
         self.core.refresh_all_windows() 
         self.refresh_window_list_content()
-        self.current_vd_label.setText(f"Current Virtual Desktop: {get_current_desktop_number()} {get_desktop_name(get_current_desktop_number())}")
\ No newline at end of file
+        self.refresh_current_desktop_label()
+
+    def refresh_current_desktop_label(self):
+        backend = self.core.backend
+        current_desktop_number = backend.get_current_desktop_number()
+        self.current_vd_label.setText(f"Current Virtual Desktop: {current_desktop_number} {backend.get_desktop_name(current_desktop_number)}")
\ No newline at end of file
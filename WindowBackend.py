@@ -0,0 +1,677 @@
+# -*- coding: utf-8 -*-
+
+# === 窗口系统后端接口
+# 核心的刷新、匹配、移动流程只通过这里访问窗口系统：
+#   Win32WindowBackend     真实的 Windows 环境（win32gui / win32process / VDA dll）
+#   SimulatedWindowBackend 内存中的模拟桌面，可以在 Linux 上做性能分析和压力测试
+
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from StageTimings import get_stage_timings, STAGE_PIN, STAGE_DESKTOP
+from WindowEnumerator import WindowEnumeration
+
+
+UWP_FRAME_WINDOW_CLASS = 'ApplicationFrameWindow'
+UWP_CORE_WINDOW_CLASS = 'Windows.UI.Core.CoreWindow'
+
+DESKTOP_QUERY_MAX_WORKERS = 8  # 批量查询虚拟桌面信息的线程数上限
+DESKTOP_QUERY_MIN_BATCH = 16  # 窗口数少于这个值时直接串行查询，不值得调度线程
+DESKTOP_MOVE_MIN_BATCH = 4  # 移动的窗口数少于这个值时直接串行移动
+
+
+# 单个窗口的 Pin 状态和虚拟桌面序号，查询失败的字段为 None，异常记录在 error 中
+class WindowDesktopState:
+    def __init__(self, hwnd: int, pinned: bool = None, desktop_number: int = None, error: Exception = None):
+        self.hwnd: int = hwnd
+        self.pinned: bool = pinned
+        self.desktop_number: int = desktop_number
+        self.error: Exception = error
+
+
+_desktop_query_executor: ThreadPoolExecutor = None
+_desktop_query_executor_lock = threading.Lock()
+
+def _get_desktop_query_executor() -> ThreadPoolExecutor:
+    global _desktop_query_executor
+    with _desktop_query_executor_lock:
+        if _desktop_query_executor is None:
+            _desktop_query_executor = ThreadPoolExecutor(max_workers=DESKTOP_QUERY_MAX_WORKERS, thread_name_prefix='desktop_query')
+    return _desktop_query_executor
+
+def _query_window_desktop_states(hwnds: List[int],
+                                 get_is_pinned: Callable[[int], bool],
+                                 get_desktop_number: Callable[[int], int]) -> List[WindowDesktopState]:
+    timings = get_stage_timings()
+    pin_histogram = timings.get_histogram(STAGE_PIN)
+    desktop_histogram = timings.get_histogram(STAGE_DESKTOP)
+    states = []
+    for hwnd in hwnds:
+        state = WindowDesktopState(hwnd)
+        try:
+            start = time.perf_counter()
+            state.pinned = get_is_pinned(hwnd)
+            middle = time.perf_counter()
+            pin_histogram.add(middle - start)
+            state.desktop_number = get_desktop_number(hwnd)
+            desktop_histogram.add(time.perf_counter() - middle)
+        except Exception as e:
+            state.error = e
+        states.append(state)
+    return states
+
+# 批量获取窗口的 Pin 状态和虚拟桌面序号，不抛出异常
+# ctypes 调用 dll 时会释放 GIL，所以把句柄分成若干批交给线程池并行查询，墙上时间约为串行的 1/max_workers
+def query_windows_desktop_states(hwnds: List[int],
+                                 get_is_pinned: Callable[[int], bool],
+                                 get_desktop_number: Callable[[int], int],
+                                 max_workers: int = DESKTOP_QUERY_MAX_WORKERS) -> Dict[int, WindowDesktopState]:
+    hwnds = list(hwnds)
+    max_workers = max(1, min(max_workers, DESKTOP_QUERY_MAX_WORKERS))
+    if len(hwnds) < DESKTOP_QUERY_MIN_BATCH or max_workers == 1:
+        states = _query_window_desktop_states(hwnds, get_is_pinned, get_desktop_number)
+    else:
+        batch_count = min(max_workers, len(hwnds))
+        batches = [hwnds[i::batch_count] for i in range(batch_count)]
+        executor = _get_desktop_query_executor()
+        futures = [executor.submit(_query_window_desktop_states, batch, get_is_pinned, get_desktop_number) for batch in batches]
+        states = []
+        for future in futures:
+            states.extend(future.result())
+    return {state.hwnd: state for state in states}
+
+
+# 批量移动窗口的结果，cancelled 表示因为 should_stop 返回 True 而没有移动完
+class WindowMoveResult:
+    def __init__(self):
+        self.moved: List[int] = []
+        self.failed: Dict[int, Exception] = {}
+        self.cancelled: bool = False
+
+def _move_windows_to_desktop(hwnds: List[int],
+                             desktop_number: int,
+                             move_window: Callable[[int, int], None],
+                             should_stop: Optional[Callable[[], bool]]) -> WindowMoveResult:
+    result = WindowMoveResult()
+    for hwnd in hwnds:
+        if should_stop is not None and should_stop():
+            result.cancelled = True
+            break
+        try:
+            move_window(hwnd, desktop_number)
+            result.moved.append(hwnd)
+        except Exception as e:
+            result.failed[hwnd] = e
+    return result
+
+# 批量移动窗口到虚拟桌面，和 query_windows_desktop_states 一样分批交给线程池并行调用
+# 每移动一个窗口前检查 should_stop，返回 True 时放弃剩下的窗口
+def move_windows_to_desktop(hwnds: List[int],
+                            desktop_number: int,
+                            move_window: Callable[[int, int], None],
+                            should_stop: Optional[Callable[[], bool]] = None,
+                            max_workers: int = DESKTOP_QUERY_MAX_WORKERS) -> WindowMoveResult:
+    hwnds = list(hwnds)
+    max_workers = max(1, min(max_workers, DESKTOP_QUERY_MAX_WORKERS))
+    if len(hwnds) < DESKTOP_MOVE_MIN_BATCH or max_workers == 1:
+        return _move_windows_to_desktop(hwnds, desktop_number, move_window, should_stop)
+    batch_count = min(max_workers, len(hwnds))
+    batches = [hwnds[i::batch_count] for i in range(batch_count)]
+    executor = _get_desktop_query_executor()
+    futures = [executor.submit(_move_windows_to_desktop, batch, desktop_number, move_window, should_stop) for batch in batches]
+    result = WindowMoveResult()
+    for future in futures:
+        batch_result = future.result()
+        result.moved.extend(batch_result.moved)
+        result.failed.update(batch_result.failed)
+        result.cancelled = result.cancelled or batch_result.cancelled
+    return result
+
+
+# 虚拟桌面元数据（数量、名称、当前桌面序号）的缓存
+# 第一次读取时一次性加载，之后直到 invalidate 前都不再调用底层接口，虚拟桌面切换、新增、重命名后需要调用 invalidate
+class DesktopMetadataCache:
+    def __init__(self,
+                 read_desktop_count: Callable[[], int],
+                 read_desktop_name: Callable[[int], str],
+                 read_current_desktop_number: Callable[[], int]):
+        self._read_desktop_count = read_desktop_count
+        self._read_desktop_name = read_desktop_name
+        self._read_current_desktop_number = read_current_desktop_number
+        self._desktop_names: List[str] = None  # None 表示需要重新加载
+        self._current_desktop_number: int = None
+        self._lock = threading.Lock()
+
+    # current_only 为 True 时只重新读取当前桌面序号，切换桌面时数量和名称不会变化
+    def invalidate(self, current_only: bool = False):
+        with self._lock:
+            if not current_only:
+                self._desktop_names = None
+            self._current_desktop_number = None
+
+    def _load(self):
+        if self._desktop_names is None:
+            self._desktop_names = [self._read_desktop_name(i) for i in range(self._read_desktop_count())]
+        if self._current_desktop_number is None:
+            self._current_desktop_number = self._read_current_desktop_number()
+
+    def get_desktop_count(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._desktop_names)
+
+    def get_desktop_names(self) -> List[str]:
+        with self._lock:
+            self._load()
+            return list(self._desktop_names)
+
+    def get_desktop_name(self, desktop_number: int) -> str:
+        with self._lock:
+            self._load()
+            if 0 <= desktop_number < len(self._desktop_names):
+                return self._desktop_names[desktop_number]
+        return "Error: " + str(desktop_number)
+
+    def get_current_desktop_number(self) -> int:
+        with self._lock:
+            self._load()
+            return self._current_desktop_number
+
+
+# 窗口系统后端的基础类，所有方法都需要子类实现
+class WindowBackend:
+    # 枚举顶层窗口句柄
+    def find_windows(self,
+                     title_re: str = None,
+                     class_name: str = None,
+                     process: int = None,
+                     enabled_only: bool = False,
+                     visible_only: bool = True,
+                     top_level_only: bool = True) -> List[int]:
+        raise NotImplementedError
+
+    # 枚举窗口并同时取得窗口类、标题和进程 id，解析窗口时直接使用，不再逐个查询
+    # 默认用 find_windows 和逐个窗口的查询实现，子类可以在一次遍历中完成
+    def enumerate_windows(self,
+                          enabled_only: bool = False,
+                          visible_only: bool = True,
+                          top_level_only: bool = True) -> WindowEnumeration:
+        hwnds = self.find_windows(enabled_only=enabled_only, visible_only=visible_only, top_level_only=top_level_only)
+        windows = WindowEnumeration(len(hwnds))
+        for hwnd in hwnds:
+            windows.append(hwnd, self.get_class_name(hwnd), self.get_window_text(hwnd), self.get_window_pid(hwnd))
+        return windows
+
+    def get_class_name(self, hwnd: int) -> str:
+        raise NotImplementedError
+
+    def get_window_text(self, hwnd: int) -> str:
+        raise NotImplementedError
+
+    def get_window_pid(self, hwnd: int) -> int:
+        raise NotImplementedError
+
+    # 获取 UWP 的 CoreWindow 句柄，不是 UWP 窗口时返回 0
+    def get_UWP_core_hwnd(self, hwnd: int) -> int:
+        raise NotImplementedError
+
+    def get_UWP_core_pid(self, hwnd: int) -> int:
+        core_hwnd = self.get_UWP_core_hwnd(hwnd)
+        return self.get_window_pid(core_hwnd) if core_hwnd else None
+
+    # 获取 UWP 窗口的包全名，不是 UWP 窗口时返回 None
+    def get_package_full_name(self, hwnd: int) -> str:
+        raise NotImplementedError
+
+    def get_app_name(self, hwnd: int) -> str:
+        raise NotImplementedError
+
+    def get_app_pid(self, app_name: str) -> int:
+        raise NotImplementedError
+
+    def get_window_icon(self, hwnd: int, icon_resize: int = 32):
+        raise NotImplementedError
+
+    # (图标, 图标在 IconCache / IconAtlas 中的键)，键保存在窗口快照中，下次启动时不查询窗口就能从图集中取出图标
+    # 图标没有缓存键时键为 None
+    def get_window_icon_and_key(self, hwnd: int, icon_resize: int = 32) -> tuple:
+        return self.get_window_icon(hwnd, icon_resize), None
+
+    # Pin 状态
+    def get_window_is_pinned(self, hwnd: int) -> bool:
+        raise NotImplementedError
+
+    def set_window_pin(self, hwnd: int):
+        raise NotImplementedError
+
+    def set_window_unpin(self, hwnd: int):
+        raise NotImplementedError
+
+    # 虚拟桌面
+    def get_window_desktop_number(self, hwnd: int) -> int:
+        raise NotImplementedError
+
+    # 批量获取 Pin 状态和虚拟桌面序号
+    def get_windows_desktop_states(self, hwnds: List[int]) -> Dict[int, WindowDesktopState]:
+        return query_windows_desktop_states(hwnds, self.get_window_is_pinned, self.get_window_desktop_number)
+
+    def move_window_to_desktop(self, hwnd: int, desktop_number: int):
+        raise NotImplementedError
+
+    # 并行移动多个窗口
+    def move_windows_to_desktop(self, hwnds: List[int], desktop_number: int, should_stop: Callable[[], bool] = None) -> WindowMoveResult:
+        return move_windows_to_desktop(hwnds, desktop_number, self.move_window_to_desktop, should_stop)
+
+    def get_current_desktop_number(self) -> int:
+        raise NotImplementedError
+
+    def get_desktop_count(self) -> int:
+        raise NotImplementedError
+
+    def get_desktop_name(self, desktop_number: int) -> str:
+        raise NotImplementedError
+
+    # 虚拟桌面数量、名称和当前桌面序号是缓存的，虚拟桌面切换或变化后调用
+    def invalidate_desktop_metadata(self, current_only: bool = False):
+        pass
+
+
+# 真实的 Windows 后端，依赖只在创建时才导入，这样非 Windows 环境也可以导入本模块
+# 枚举窗口使用 WindowEnumerator，一次 EnumWindows 遍历取得窗口类、标题和进程 id，不经过 pywinauto
+class Win32WindowBackend(WindowBackend):
+    def __init__(self):
+        import win32gui
+        import win32process
+        import AppUtility
+        import UWP_Utility
+        import VirtualDesktopAccessor
+        from WindowEnumerator import WindowEnumerator
+
+        self._win32gui = win32gui
+        self._win32process = win32process
+        self._enumerator = WindowEnumerator()
+        self._app_utility = AppUtility
+        self._uwp_utility = UWP_Utility
+        self._vda = VirtualDesktopAccessor
+
+    def find_windows(self,
+                     title_re: str = None,
+                     class_name: str = None,
+                     process: int = None,
+                     enabled_only: bool = False,
+                     visible_only: bool = True,
+                     top_level_only: bool = True) -> List[int]:
+        windows = self._enumerator.enumerate(enabled_only, visible_only, top_level_only)
+        return windows.filter_hwnds(title_re, class_name, process)
+
+    def enumerate_windows(self,
+                          enabled_only: bool = False,
+                          visible_only: bool = True,
+                          top_level_only: bool = True) -> WindowEnumeration:
+        return self._enumerator.enumerate(enabled_only, visible_only, top_level_only)
+
+    def get_class_name(self, hwnd: int) -> str:
+        return self._win32gui.GetClassName(hwnd)
+
+    def get_window_text(self, hwnd: int) -> str:
+        return self._win32gui.GetWindowText(hwnd)
+
+    def get_window_pid(self, hwnd: int) -> int:
+        _thread_id, pid = self._win32process.GetWindowThreadProcessId(hwnd)
+        return pid
+
+    def get_UWP_core_hwnd(self, hwnd: int) -> int:
+        return self._app_utility.get_UWP_core_hwnd(hwnd)
+
+    def get_UWP_core_pid(self, hwnd: int) -> int:
+        return self._app_utility.get_UWP_core_pid(hwnd)
+
+    def get_package_full_name(self, hwnd: int) -> str:
+        full_name = self._uwp_utility.package_full_name_from_handle(self.get_UWP_core_hwnd(hwnd))
+        return full_name.value if full_name else None
+
+    def get_app_name(self, hwnd: int) -> str:
+        return self._app_utility.get_app_name_from_hwnd(hwnd)
+
+    def get_app_pid(self, app_name: str) -> int:
+        return self._app_utility.get_app_pid(app_name)
+
+    def get_window_icon(self, hwnd: int, icon_resize: int = 32):
+        return self._app_utility.get_icon_from_hwnd(hwnd, icon_resize)
+
+    def get_window_icon_and_key(self, hwnd: int, icon_resize: int = 32) -> tuple:
+        return self._app_utility.get_icon_and_key_from_hwnd(hwnd, icon_resize)
+
+    def get_window_is_pinned(self, hwnd: int) -> bool:
+        return self._vda.get_window_is_pinned(hwnd)
+
+    def set_window_pin(self, hwnd: int):
+        self._vda.set_window_pin(hwnd)
+
+    def set_window_unpin(self, hwnd: int):
+        self._vda.set_window_unpin(hwnd)
+
+    def get_window_desktop_number(self, hwnd: int) -> int:
+        return self._vda.get_window_desktop_number(hwnd)
+
+    def get_windows_desktop_states(self, hwnds: List[int]) -> Dict[int, WindowDesktopState]:
+        return self._vda.get_windows_desktop_states(hwnds)
+
+    def move_window_to_desktop(self, hwnd: int, desktop_number: int):
+        self._vda.move_window_to_desktop(hwnd, desktop_number)
+
+    def move_windows_to_desktop(self, hwnds: List[int], desktop_number: int, should_stop: Callable[[], bool] = None) -> WindowMoveResult:
+        return self._vda.move_windows_to_desktop(hwnds, desktop_number, should_stop)
+
+    def get_current_desktop_number(self) -> int:
+        return self._vda.get_current_desktop_number()
+
+    def get_desktop_count(self) -> int:
+        return self._vda.get_desktop_count()
+
+    def get_desktop_name(self, desktop_number: int) -> str:
+        return self._vda.get_desktop_name(desktop_number)
+
+    def invalidate_desktop_metadata(self, current_only: bool = False):
+        self._vda.invalidate_desktop_metadata(current_only)
+
+
+# 模拟窗口
+class SimulatedWindow:
+    def __init__(self,
+                 hwnd: int,
+                 title: str,
+                 window_class: str,
+                 pid: int,
+                 app_name: str,
+                 desktop_number: int = 0,
+                 pinned: bool = False,
+                 package_name: str = None,
+                 visible: bool = True,
+                 enabled: bool = True,
+                 core_hwnd: int = 0):
+        self.hwnd: int = hwnd
+        self.title: str = title
+        self.window_class: str = window_class
+        self.pid: int = pid
+        self.app_name: str = app_name
+        self.desktop_number: int = desktop_number
+        self.pinned: bool = pinned
+        self.package_name: str = package_name  # 只有 UWP 窗口才有包全名
+        self.visible: bool = visible
+        self.enabled: bool = enabled
+        self.core_hwnd: int = core_hwnd  # ApplicationFrameWindow 里的 CoreWindow 句柄
+
+
+# 生成模拟窗口时使用的应用，(exe 名, 窗口类, 标题模板)
+SIMULATED_APPS = [
+    ('chrome.exe', 'Chrome_WidgetWin_1', '{} - Google Chrome'),
+    ('msedge.exe', 'Chrome_WidgetWin_1', '{} - Microsoft Edge'),
+    ('Code.exe', 'Chrome_WidgetWin_1', '{} - Visual Studio Code'),
+    ('explorer.exe', 'CabinetWClass', '{}'),
+    ('notepad.exe', 'Notepad', '{} - Notepad'),
+    ('WINWORD.EXE', 'OpusApp', '{} - Word'),
+    ('EXCEL.EXE', 'XLMAIN', '{} - Excel'),
+    ('Taskmgr.exe', 'TaskManagerWindow', 'Task Manager'),
+    ('WeChat.exe', 'WeChatMainWndForPC', 'WeChat'),
+    ('cmd.exe', 'ConsoleWindowClass', 'Command Prompt {}'),
+]
+
+# 生成模拟 UWP 窗口时使用的应用，(exe 名, 包全名, 标题)
+SIMULATED_UWP_APPS = [
+    ('HxOutlook.exe', 'microsoft.windowscommunicationsapps_16005.14326.21538.0_x64__8wekyb3d8bbwe', 'Mail'),
+    ('HxCalendarAppImm.exe', 'microsoft.windowscommunicationsapps_16005.14326.21538.0_x64__8wekyb3d8bbwe', 'Calendar'),
+    ('Calculator.exe', 'Microsoft.WindowsCalculator_11.2210.0.0_x64__8wekyb3d8bbwe', 'Calculator'),
+    ('WinStore.App.exe', 'Microsoft.WindowsStore_22306.1401.1.0_x64__8wekyb3d8bbwe', 'Microsoft Store'),
+    ('Microsoft.Photos.exe', 'Microsoft.Windows.Photos_2023.11050.16005.0_x64__8wekyb3d8bbwe', 'Photos'),
+]
+
+
+# 内存中的模拟桌面，每次调用可以附加固定延迟来模拟 Win32 / dll 调用的开销
+class SimulatedWindowBackend(WindowBackend):
+    def __init__(self, desktop_count: int = 4, call_latency: float = 0.0, desktop_latency: float = None):
+        self.windows: Dict[int, SimulatedWindow] = {}
+        self.desktop_names: List[str] = [f"Desktop {i + 1}" for i in range(desktop_count)]
+        self.current_desktop_number: int = 0
+        self.call_latency: float = call_latency  # 普通调用的延迟，单位秒
+        self.desktop_latency: float = desktop_latency if desktop_latency is not None else call_latency  # 虚拟桌面相关调用的延迟，真实环境下这类调用明显更慢
+        self.call_counts: Dict[str, int] = {}
+        self.desktop_metadata = DesktopMetadataCache(self._read_desktop_count, self._read_desktop_name, self._read_current_desktop_number)
+        self._next_hwnd: int = 0x10000
+        self._next_pid: int = 1000
+        self._lock = threading.Lock()
+
+    def _call(self, name: str, latency: float = None):
+        with self._lock:
+            self.call_counts[name] = self.call_counts.get(name, 0) + 1
+        latency = self.call_latency if latency is None else latency
+        if latency > 0:
+            time.sleep(latency)
+
+    def reset_call_counts(self):
+        with self._lock:
+            self.call_counts = {}
+
+    # === 模拟桌面的构造
+    def add_window(self,
+                   title: str,
+                   window_class: str,
+                   app_name: str,
+                   desktop_number: int = 0,
+                   pinned: bool = False,
+                   pid: int = None,
+                   package_name: str = None,
+                   visible: bool = True,
+                   enabled: bool = True) -> SimulatedWindow:
+        with self._lock:
+            hwnd = self._next_hwnd
+            self._next_hwnd += 2
+            if pid is None:
+                pid = self._next_pid
+                self._next_pid += 4
+        core_hwnd = 0
+        if package_name is not None:
+            # UWP 窗口：顶层是 ApplicationFrameWindow，CoreWindow 是其子窗口
+            core_hwnd = hwnd + 1
+            window_class = UWP_FRAME_WINDOW_CLASS
+        window = SimulatedWindow(hwnd, title, window_class, pid, app_name, desktop_number, pinned,
+                                 package_name, visible, enabled, core_hwnd)
+        self.windows[hwnd] = window
+        return window
+
+    def remove_window(self, hwnd: int):
+        self.windows.pop(hwnd, None)
+
+    def set_current_desktop_number(self, desktop_number: int):
+        self.current_desktop_number = desktop_number
+
+    # 生成 count 个模拟窗口，uwp_ratio 是 UWP 窗口的比例，hidden_ratio 是不可见窗口的比例
+    def populate(self, count: int, uwp_ratio: float = 0.1, hidden_ratio: float = 0.0, pinned_ratio: float = 0.02, seed: int = 0):
+        rng = random.Random(seed)
+        app_pids = {}
+        for i in range(count):
+            desktop_number = rng.randrange(len(self.desktop_names))
+            pinned = rng.random() < pinned_ratio
+            visible = rng.random() >= hidden_ratio
+            if rng.random() < uwp_ratio:
+                app_name, package_name, title = rng.choice(SIMULATED_UWP_APPS)
+                window_class = UWP_FRAME_WINDOW_CLASS
+            else:
+                app_name, window_class, title_format = rng.choice(SIMULATED_APPS)
+                package_name = None
+                title = title_format.format(f"Document {i}")
+            # 同一个应用的窗口大多共享一个进程
+            if app_name not in app_pids or rng.random() < 0.1:
+                with self._lock:
+                    app_pids[app_name] = self._next_pid
+                    self._next_pid += 4
+            self.add_window(title, window_class, app_name, desktop_number, pinned,
+                            app_pids[app_name], package_name, visible)
+
+    def _get_window(self, hwnd: int) -> Optional[SimulatedWindow]:
+        window = self.windows.get(hwnd)
+        if window is None and hwnd and hwnd % 2 == 1:
+            window = self.windows.get(hwnd - 1)  # CoreWindow 句柄
+        return window
+
+    # === WindowBackend 接口
+    def find_windows(self,
+                     title_re: str = None,
+                     class_name: str = None,
+                     process: int = None,
+                     enabled_only: bool = False,
+                     visible_only: bool = True,
+                     top_level_only: bool = True) -> List[int]:
+        self._call('find_windows')
+        title_pattern = re.compile(title_re) if title_re is not None else None
+        hwnds = []
+        for hwnd, window in list(self.windows.items()):
+            if visible_only and not window.visible:
+                continue
+            if enabled_only and not window.enabled:
+                continue
+            if class_name is not None and window.window_class != class_name:
+                continue
+            if process is not None and window.pid != process:
+                continue
+            if title_pattern is not None and not title_pattern.match(window.title):
+                continue
+            hwnds.append(hwnd)
+        return hwnds
+
+    # 和真实后端一样只算一次调用，模拟一次遍历取得所有信息
+    def enumerate_windows(self,
+                          enabled_only: bool = False,
+                          visible_only: bool = True,
+                          top_level_only: bool = True) -> WindowEnumeration:
+        self._call('enumerate_windows')
+        windows = WindowEnumeration(len(self.windows))
+        for hwnd, window in list(self.windows.items()):
+            if visible_only and not window.visible:
+                continue
+            if enabled_only and not window.enabled:
+                continue
+            windows.append(hwnd, window.window_class, window.title, window.pid, 0, window.visible)
+        return windows
+
+    def get_class_name(self, hwnd: int) -> str:
+        self._call('get_class_name')
+        window = self._get_window(hwnd)
+        if window is None:
+            return ''
+        if hwnd == window.core_hwnd:
+            return UWP_CORE_WINDOW_CLASS
+        return window.window_class
+
+    def get_window_text(self, hwnd: int) -> str:
+        self._call('get_window_text')
+        window = self._get_window(hwnd)
+        return window.title if window is not None else ''
+
+    def get_window_pid(self, hwnd: int) -> int:
+        self._call('get_window_pid')
+        window = self._get_window(hwnd)
+        return window.pid if window is not None else 0
+
+    def get_UWP_core_hwnd(self, hwnd: int) -> int:
+        self._call('get_UWP_core_hwnd')
+        window = self._get_window(hwnd)
+        return window.core_hwnd if window is not None else 0
+
+    def get_package_full_name(self, hwnd: int) -> str:
+        self._call('get_package_full_name')
+        window = self._get_window(hwnd)
+        return window.package_name if window is not None else None
+
+    def get_app_name(self, hwnd: int) -> str:
+        self._call('get_app_name')
+        window = self._get_window(hwnd)
+        return window.app_name if window is not None else None
+
+    def get_app_pid(self, app_name: str) -> int:
+        self._call('get_app_pid')
+        for window in list(self.windows.values()):
+            if window.app_name == app_name:
+                return window.pid
+        return None
+
+    def get_window_icon(self, hwnd: int, icon_resize: int = 32):
+        self._call('get_window_icon')
+        return None
+
+    def get_window_is_pinned(self, hwnd: int) -> bool:
+        self._call('get_window_is_pinned', self.desktop_latency)
+        window = self._get_window(hwnd)
+        return window.pinned if window is not None else False
+
+    def set_window_pin(self, hwnd: int):
+        self._call('set_window_pin', self.desktop_latency)
+        window = self._get_window(hwnd)
+        if window is not None:
+            window.pinned = True
+
+    def set_window_unpin(self, hwnd: int):
+        self._call('set_window_unpin', self.desktop_latency)
+        window = self._get_window(hwnd)
+        if window is not None:
+            window.pinned = False
+            window.desktop_number = self.current_desktop_number
+
+    # 和 VDA dll 一致：找不到窗口或者窗口已经 Pin 时返回 -1
+    def get_window_desktop_number(self, hwnd: int) -> int:
+        self._call('get_window_desktop_number', self.desktop_latency)
+        window = self._get_window(hwnd)
+        if window is None or window.pinned:
+            return -1
+        return window.desktop_number
+
+    def move_window_to_desktop(self, hwnd: int, desktop_number: int):
+        self._call('move_window_to_desktop', self.desktop_latency)
+        window = self._get_window(hwnd)
+        if window is not None and 0 <= desktop_number < len(self.desktop_names):
+            window.desktop_number = desktop_number
+
+    def _read_current_desktop_number(self) -> int:
+        self._call('get_current_desktop_number', self.desktop_latency)
+        return self.current_desktop_number
+
+    def _read_desktop_count(self) -> int:
+        self._call('get_desktop_count', self.desktop_latency)
+        return len(self.desktop_names)
+
+    def _read_desktop_name(self, desktop_number: int) -> str:
+        self._call('get_desktop_name', self.desktop_latency)
+        if 0 <= desktop_number < len(self.desktop_names):
+            return self.desktop_names[desktop_number]
+        return "Error: " + str(desktop_number)
+
+    def get_current_desktop_number(self) -> int:
+        return self.desktop_metadata.get_current_desktop_number()
+
+    def get_desktop_count(self) -> int:
+        return self.desktop_metadata.get_desktop_count()
+
+    def get_desktop_name(self, desktop_number: int) -> str:
+        return self.desktop_metadata.get_desktop_name(desktop_number)
+
+    def invalidate_desktop_metadata(self, current_only: bool = False):
+        self.desktop_metadata.invalidate(current_only)
+
+
+_window_backend: WindowBackend = None
+
+# 获取当前使用的窗口系统后端，默认是 Win32WindowBackend
+def get_window_backend() -> WindowBackend:
+    global _window_backend
+    if _window_backend is None:
+        _window_backend = Win32WindowBackend()
+    return _window_backend
+
+# 替换窗口系统后端，例如在性能测试中使用 SimulatedWindowBackend
+def set_window_backend(backend: WindowBackend):
+    global _window_backend
+    _window_backend = backend
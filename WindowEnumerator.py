@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# === 单次遍历的窗口枚举
+# 一次 EnumWindows 遍历中，在回调里直接取得窗口句柄、窗口类、标题、进程 id、线程 id、是否可见和所有者窗口，
+# 可见、启用的筛选也在回调中完成，不可见的窗口不会再查询类名和标题。
+# 结果写入预先分配好的 WindowEnumeration，解析窗口时不需要再逐个查询类名、标题和进程，也不经过 pywinauto 的元素包装。
+#   WindowEnumeration  一次枚举的结果，各列按枚举顺序一一对应，与平台无关，模拟后端也使用
+#   WindowEnumerator   Windows 上基于 ctypes 的实现，由 Win32WindowBackend 创建，回调和字符串缓冲区在多次枚举之间复用
+
+import ctypes
+import re
+import threading
+from array import array
+from typing import Iterator, List, Tuple
+
+
+WINDOW_ENUMERATION_MIN_CAPACITY = 256
+WINDOW_CLASS_BUFFER_LENGTH = 257  # 窗口类名最长 256 个字符
+WINDOW_TITLE_BUFFER_LENGTH = 512  # 更长的标题按实际长度重新分配缓冲区
+GW_OWNER = 4
+
+
+# 一次枚举得到的窗口，count 之后的位置是预留的空间
+class WindowEnumeration:
+    def __init__(self, capacity: int = WINDOW_ENUMERATION_MIN_CAPACITY):
+        capacity = max(capacity, 1)
+        self.count: int = 0
+        self.hwnds: array = array('q', bytes(8 * capacity))
+        self.class_names: List[str] = [None] * capacity
+        self.titles: List[str] = [None] * capacity
+        self.process_ids: array = array('q', bytes(8 * capacity))
+        self.thread_ids: array = array('q', bytes(8 * capacity))
+        self.visible: array = array('b', bytes(capacity))
+        self.owners: array = array('q', bytes(8 * capacity))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get_capacity(self) -> int:
+        return len(self.hwnds)
+
+    def _grow(self):
+        extra = self.get_capacity()
+        self.hwnds.extend(array('q', bytes(8 * extra)))
+        self.class_names.extend([None] * extra)
+        self.titles.extend([None] * extra)
+        self.process_ids.extend(array('q', bytes(8 * extra)))
+        self.thread_ids.extend(array('q', bytes(8 * extra)))
+        self.visible.extend(array('b', bytes(extra)))
+        self.owners.extend(array('q', bytes(8 * extra)))
+
+    def append(self, hwnd: int, class_name: str, title: str, process_id: int, thread_id: int = 0, visible: bool = True, owner: int = 0):
+        i = self.count
+        if i == len(self.hwnds):
+            self._grow()
+        self.hwnds[i] = hwnd
+        self.class_names[i] = class_name
+        self.titles[i] = title
+        self.process_ids[i] = process_id
+        self.thread_ids[i] = thread_id
+        self.visible[i] = visible
+        self.owners[i] = owner
+        self.count = i + 1
+
+    def get_hwnds(self) -> List[int]:
+        return self.hwnds[:self.count].tolist()
+
+    # 按枚举顺序返回 (句柄, 窗口类, 标题, 进程 id)
+    def iter_identities(self) -> Iterator[Tuple[int, str, str, int]]:
+        count = self.count
+        return zip(self.hwnds[:count], self.class_names[:count], self.titles[:count], self.process_ids[:count])
+
+    # 和 pywinauto.findwindows.find_windows 相同的筛选，title_re 从标题开头匹配
+    def filter_hwnds(self, title_re: str = None, class_name: str = None, process: int = None) -> List[int]:
+        if title_re is None and class_name is None and process is None:
+            return self.get_hwnds()
+        title_pattern = re.compile(title_re) if title_re is not None else None
+        hwnds = []
+        for hwnd, window_class, title, process_id in self.iter_identities():
+            if class_name is not None and window_class != class_name:
+                continue
+            if process is not None and process_id != process:
+                continue
+            if title_pattern is not None and not title_pattern.match(title):
+                continue
+            hwnds.append(hwnd)
+        return hwnds
+
+
+# 只能在 Windows 上创建
+class WindowEnumerator:
+    def __init__(self):
+        from ctypes import wintypes
+        user32 = ctypes.WinDLL("user32", use_last_error=True)
+        self._enum_proc_type = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+
+        self._enum_windows = user32.EnumWindows
+        self._enum_windows.argtypes = (self._enum_proc_type, wintypes.LPARAM)
+        self._enum_windows.restype = wintypes.BOOL
+        self._enum_child_windows = user32.EnumChildWindows
+        self._enum_child_windows.argtypes = (wintypes.HWND, self._enum_proc_type, wintypes.LPARAM)
+        self._enum_child_windows.restype = wintypes.BOOL
+        self._get_desktop_window = user32.GetDesktopWindow
+        self._get_desktop_window.argtypes = ()
+        self._get_desktop_window.restype = wintypes.HWND
+        self._is_window_visible = user32.IsWindowVisible
+        self._is_window_visible.argtypes = (wintypes.HWND, )
+        self._is_window_visible.restype = wintypes.BOOL
+        self._is_window_enabled = user32.IsWindowEnabled
+        self._is_window_enabled.argtypes = (wintypes.HWND, )
+        self._is_window_enabled.restype = wintypes.BOOL
+        self._get_class_name = user32.GetClassNameW
+        self._get_class_name.argtypes = (wintypes.HWND, wintypes.LPWSTR, ctypes.c_int)
+        self._get_class_name.restype = ctypes.c_int
+        self._get_window_text = user32.GetWindowTextW
+        self._get_window_text.argtypes = (wintypes.HWND, wintypes.LPWSTR, ctypes.c_int)
+        self._get_window_text.restype = ctypes.c_int
+        self._get_window_text_length = user32.GetWindowTextLengthW
+        self._get_window_text_length.argtypes = (wintypes.HWND, )
+        self._get_window_text_length.restype = ctypes.c_int
+        self._get_window_thread_process_id = user32.GetWindowThreadProcessId
+        self._get_window_thread_process_id.argtypes = (wintypes.HWND, ctypes.POINTER(wintypes.DWORD))
+        self._get_window_thread_process_id.restype = wintypes.DWORD
+        self._get_window = user32.GetWindow
+        self._get_window.argtypes = (wintypes.HWND, ctypes.c_uint)
+        self._get_window.restype = wintypes.HWND
+
+        self._class_buffer = ctypes.create_unicode_buffer(WINDOW_CLASS_BUFFER_LENGTH)
+        self._title_buffer = ctypes.create_unicode_buffer(WINDOW_TITLE_BUFFER_LENGTH)
+        self._pid = wintypes.DWORD()
+        self._pid_ref = ctypes.byref(self._pid)
+        self._callback = self._enum_proc_type(self._on_window)  # 保持引用，避免回调被回收
+        self._lock = threading.Lock()  # 缓冲区和当前结果只能同时被一次枚举使用
+        self._result: WindowEnumeration = None
+        self._enabled_only: bool = False
+        self._visible_only: bool = True
+        self._last_count: int = 0
+
+    # 返回 True 继续枚举，不符合筛选条件的窗口直接跳过
+    def _on_window(self, hwnd: int, _param: int) -> bool:
+        if not hwnd:
+            return True
+        visible = bool(self._is_window_visible(hwnd))
+        if self._visible_only and not visible:
+            return True
+        if self._enabled_only and not self._is_window_enabled(hwnd):
+            return True
+
+        class_buffer = self._class_buffer
+        class_name = class_buffer.value if self._get_class_name(hwnd, class_buffer, WINDOW_CLASS_BUFFER_LENGTH) > 0 else ''
+
+        title_buffer = self._title_buffer
+        length = self._get_window_text(hwnd, title_buffer, len(title_buffer))
+        if length >= len(title_buffer) - 1:
+            # 标题可能被截断，按实际长度重新读取
+            full_length = self._get_window_text_length(hwnd)
+            if full_length >= len(title_buffer):
+                title_buffer = self._title_buffer = ctypes.create_unicode_buffer(full_length + 1)
+                length = self._get_window_text(hwnd, title_buffer, len(title_buffer))
+        title = title_buffer.value if length > 0 else ''
+
+        thread_id = self._get_window_thread_process_id(hwnd, self._pid_ref)
+        owner = self._get_window(hwnd, GW_OWNER) or 0
+        self._result.append(hwnd, class_name, title, self._pid.value, thread_id, visible, owner)
+        return True
+
+    # top_level_only 为 False 时枚举桌面下的所有子孙窗口，与 pywinauto 一致
+    def enumerate(self, enabled_only: bool = False, visible_only: bool = True, top_level_only: bool = True) -> WindowEnumeration:
+        with self._lock:
+            # 按上次的窗口数量预留空间，枚举过程中基本不需要扩容
+            result = WindowEnumeration(max(WINDOW_ENUMERATION_MIN_CAPACITY, self._last_count + self._last_count // 4))
+            self._result = result
+            self._enabled_only = enabled_only
+            self._visible_only = visible_only
+            try:
+                if top_level_only:
+                    self._enum_windows(self._callback, 0)
+                else:
+                    self._enum_child_windows(self._get_desktop_window(), self._callback, 0)
+            finally:
+                self._result = None
+            self._last_count = result.count
+        return result
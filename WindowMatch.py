@@ -1,19 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import re
+import time
 from enum import Enum
-from AppUtility import *
-from UWP_Utility import *
-from typing import List
-import pywinauto
-from pywinauto import Application
-import pywinauto.findwindows as findwindows
-import pywinauto.win32structures as win32structures
-import win32gui
-import win32process
-import ctypes
-from VirtualDesktopAccessor import *
+from typing import List, Dict, Set, Tuple
+from WindowBackend import WindowBackend, WindowDesktopState, get_window_backend, UWP_FRAME_WINDOW_CLASS, UWP_CORE_WINDOW_CLASS
 from LP_Wrapper import lp_wrapper
-import line_profiler
+from StageTimings import get_stage_timings, STAGE_CLASS, STAGE_TITLE, STAGE_PID, STAGE_APP_NAME
+from WindowTable import WindowTable, WindowRow, WINDOW_FLAG_VALID, WINDOW_FLAG_PINNED, WINDOW_FLAG_IDENTITY_RESOLVED, WINDOW_FLAG_PENDING_DESKTOP
 
 GLOBAL_MATCH_CONFIG_TOP_LEVEL_ONLY = True # 不移动子窗口，好像也没啥问题？都会跟着顶级窗口移动？
 GLOBAL_MATCH_CONFIG_VISIBLE_ONLY = True # 不可见窗口没必要匹配
@@ -29,6 +23,83 @@ class WindowMatchMode(Enum):
     CLASS_AND_APP = 6
     ALL = 7
 
+# 标题、窗口类、应用名的匹配方式
+class WindowMatchPatternType(Enum):
+    EXACT = 1  # 完全相等
+    GLOB = 2  # 通配符，只支持 * 和 ?
+    REGEX = 3  # 正则表达式，和 pywinauto 的 title_re 一样从开头匹配
+
+# 合并匹配时字段之间的分隔符，窗口标题、类名、应用名中不会出现
+MATCH_FIELD_SEPARATOR = '\x1f'
+
+# 每种匹配模式用到的字段：(标题, 窗口类或 UWP 包名, 应用名)
+MATCH_MODE_FIELDS: Dict[WindowMatchMode, Tuple[bool, bool, bool]] = {
+    WindowMatchMode.TITLE: (True, False, False),
+    WindowMatchMode.CLASS: (False, True, False),
+    WindowMatchMode.APP: (False, False, True),
+    WindowMatchMode.TITLE_AND_CLASS: (True, True, False),
+    WindowMatchMode.TITLE_AND_APP: (True, False, True),
+    WindowMatchMode.CLASS_AND_APP: (False, True, True),
+    WindowMatchMode.ALL: (True, True, True),
+}
+
+# 生成匹配用的键，只包含匹配模式用到的字段，配置和窗口的键相等即为匹配
+def get_match_key(match_mode: WindowMatchMode, title: str, class_or_package: str, app_name: str) -> tuple:
+    use_title, use_class, use_app = MATCH_MODE_FIELDS[match_mode]
+    return (title if use_title else None,
+            class_or_package if use_class else None,
+            app_name if use_app else None)
+
+# 只取匹配模式用到的字段
+def get_match_fields(match_mode: WindowMatchMode, title: str, class_or_package: str, app_name: str) -> List[str]:
+    return [value for value, used in zip((title, class_or_package, app_name), MATCH_MODE_FIELDS[match_mode]) if used]
+
+def _translate_glob(pattern: str) -> str:
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append('[^\x1f]*')
+        elif char == '?':
+            parts.append('[^\x1f]')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+# 正则表达式中和位置有关的断言：^ $ \A \Z 以及前后查找
+# 合并匹配时字段以分隔符连接，这些断言看到的是相邻的字段而不是字段的开头结尾，结果和逐字段匹配不一致
+# \b \B 不受影响：分隔符不是单词字符，和字段的开头结尾一样
+_POSITION_ASSERTION_PATTERN = re.compile(r'[\^$]|\\[AZ]|\(\?(?:=|!|<)')
+
+# 字段的匹配条件是否含有位置断言，含有时不能参与合并匹配，字符类中的 ^ 等误判只会让规则单独匹配，不影响结果
+def get_has_position_assertion(pattern_type: WindowMatchPatternType, value: str) -> bool:
+    return pattern_type == WindowMatchPatternType.REGEX and value is not None and _POSITION_ASSERTION_PATTERN.search(value) is not None
+
+# 表达式开头的全局内联标志，例如 (?i)chrome，包进分组之后不再位于开头，Python 3.11 起无法编译
+_LEADING_GLOBAL_FLAGS_PATTERN = re.compile(r'\(\?([aiLmsux]+)\)')
+
+# 把用户的正则表达式包进分组，开头的全局标志改写为只作用于这个分组的 (?flags:...)，和单独编译这个表达式的结果相同
+def _group_regex(value: str) -> str:
+    flags = ''
+    match = _LEADING_GLOBAL_FLAGS_PATTERN.match(value)
+    while match is not None:
+        flags += match.group(1)
+        value = value[match.end():]
+        match = _LEADING_GLOBAL_FLAGS_PATTERN.match(value)
+    if not flags:
+        return f'(?:{value})'
+    flags = ''.join(dict.fromkeys(flags))
+    # x 标志下 # 之后到行尾是注释，右括号放在新的一行，不会被注释掉
+    return f'(?{flags}:{value}\n)' if 'x' in flags else f'(?{flags}:{value})'
+
+# 把单个字段的匹配条件转换为正则表达式，结果用 fullmatch 匹配，不会跨越字段分隔符（用户的正则表达式本身除外）
+def get_field_pattern_source(pattern_type: WindowMatchPatternType, value: str) -> str:
+    value = value if value is not None else ''
+    if pattern_type == WindowMatchPatternType.GLOB:
+        return _translate_glob(value)
+    elif pattern_type == WindowMatchPatternType.REGEX:
+        return _group_regex(value) + '[^\x1f]*'
+    return re.escape(value)
+
 # 窗口匹配配置
 class WindowMatchConfig:
     def __init__(self,
@@ -39,6 +110,8 @@ class WindowMatchConfig:
                  is_UWP: bool,
                  package_name: str,
                  match_mode: WindowMatchMode, 
+                 pattern_type: WindowMatchPatternType = WindowMatchPatternType.EXACT,
+                 config_id: int = None,
                  ):
         self.active: bool = active
         self.title: str = title
@@ -47,32 +120,89 @@ class WindowMatchConfig:
         self.is_UWP: bool = is_UWP  # 是否是 UWP 应用，如果是 UWP 应用，那么匹配时窗口类视为 UWP 应用的包名
         self. package_name: str = package_name
         self.match_mode: WindowMatchConfig = match_mode
+        self.pattern_type: WindowMatchPatternType = pattern_type  # 标题、窗口类、应用名的匹配方式
+        self.config_id: int = config_id  # 保存到磁盘时分配，用于增量修改单条规则，见 MatchConfigStore
+
+        # 编译后的匹配条件，字段变化后在下次使用时重新编译
+        self.pattern_source: str = None  # 用到的各字段的正则表达式，以 MATCH_FIELD_SEPARATOR 连接
+        self.pattern_error: re.error = None
+        self._field_patterns: List[re.Pattern] = None
+        self._compiled_from: tuple = None
     
     # 从当前配置获取匹配的窗口句柄
     def get_matched_hwnds(self) -> List[int]:
         if not self.active:
             return []
-        kwargs = {}
-        if not self.is_UWP: #匹配一般窗口
-            if self.match_mode in [WindowMatchMode.TITLE, WindowMatchMode.TITLE_AND_APP, WindowMatchMode.TITLE_AND_CLASS, WindowMatchMode.ALL]:
-                kwargs['title_re'] = self.title
-            if self.match_mode in [WindowMatchMode.CLASS, WindowMatchMode.TITLE_AND_CLASS, WindowMatchMode.CLASS_AND_APP, WindowMatchMode.ALL]:
-                kwargs['class_name'] = self.window_class
-            if self.match_mode in [WindowMatchMode.APP, WindowMatchMode.TITLE_AND_APP, WindowMatchMode.CLASS_AND_APP, WindowMatchMode.ALL]:
-                kwargs['process'] = get_app_pid(self.app_name)
-            kwargs['enabled_only'] = GLOBAL_MATCH_CONFIG_ENABLED_ONLY
-            kwargs['visible_only'] = GLOBAL_MATCH_CONFIG_VISIBLE_ONLY
-            kwargs['top_level_only'] = GLOBAL_MATCH_CONFIG_TOP_LEVEL_ONLY
-            return pywinauto.findwindows.find_windows(**kwargs)
-        else: #匹配 UWP 窗口
-            pass # TODO: 匹配 UWP 窗口
+        backend = get_window_backend()
+        use_title, use_class, use_app = MATCH_MODE_FIELDS.get(self.match_mode, (False, False, False))
+        windows = backend.enumerate_windows(enabled_only=GLOBAL_MATCH_CONFIG_ENABLED_ONLY,
+                                            visible_only=GLOBAL_MATCH_CONFIG_VISIBLE_ONLY,
+                                            top_level_only=GLOBAL_MATCH_CONFIG_TOP_LEVEL_ONLY)
+        matched_hwnds = []
+        for hwnd, window_class, title, _process_id in windows.iter_identities():
+            is_UWP = window_class in [UWP_CORE_WINDOW_CLASS, UWP_FRAME_WINDOW_CLASS]
+            if is_UWP != bool(self.is_UWP):
+                continue
+            title = title if use_title else None
+            class_or_package = (backend.get_package_full_name(hwnd) if is_UWP else window_class) if use_class else None
+            app_name = backend.get_app_name(hwnd) if use_app else None
+            if self.get_is_matched_fields(title, class_or_package, app_name):
+                matched_hwnds.append(hwnd)
+        return matched_hwnds
     
     def get_matched_window_infos(self) -> List['WindowInfo']:
         if not self.active:
             return []
         hwnds = self.get_matched_hwnds()
-        return [WindowInfo(hwnd, True) for hwnd in hwnds]
+        table = WindowTable()
+        return [WindowInfo(hwnd, True, table=table) for hwnd in hwnds]
     
+    # 匹配用的键，UWP 应用用包名代替窗口类
+    def get_match_key(self) -> tuple:
+        class_or_package = self.package_name if self.is_UWP else self.window_class
+        return get_match_key(self.match_mode, self.title, class_or_package, self.app_name)
+
+    # 编译匹配条件，字段没有变化时不重复编译，正则表达式无效时返回 False
+    def compile_pattern(self) -> bool:
+        compiled_from = (self.pattern_type, self.match_mode, self.get_match_key())
+        if compiled_from == self._compiled_from:
+            return self.pattern_error is None
+        self._compiled_from = compiled_from
+        self.pattern_source = None
+        self.pattern_error = None
+        self._field_patterns = None
+        if self.match_mode not in MATCH_MODE_FIELDS:
+            return True
+        class_or_package = self.package_name if self.is_UWP else self.window_class
+        sources = [get_field_pattern_source(self.pattern_type, value)
+                   for value in get_match_fields(self.match_mode, self.title, class_or_package, self.app_name)]
+        try:
+            self._field_patterns = [re.compile(source) for source in sources]
+        except re.error as e:
+            print(f"匹配规则的正则表达式无效: {self.title} {self.window_class} {self.app_name}，{e}")
+            self.pattern_error = e
+            return False
+        self.pattern_source = MATCH_FIELD_SEPARATOR.join(sources)
+        return True
+
+    # 匹配模式用到的字段中是否有含位置断言的正则表达式，见 get_has_position_assertion
+    def get_has_position_assertion(self) -> bool:
+        class_or_package = self.package_name if self.is_UWP else self.window_class
+        return any(get_has_position_assertion(self.pattern_type, value)
+                   for value in get_match_fields(self.match_mode, self.title, class_or_package, self.app_name))
+
+    # 用匹配模式用到的字段判断是否匹配，不用到的字段可以传 None
+    def get_is_matched_fields(self, title: str, class_or_package: str, app_name: str) -> bool:
+        if not self.active or self.match_mode not in MATCH_MODE_FIELDS:
+            return False
+        if self.pattern_type == WindowMatchPatternType.EXACT:
+            return get_match_key(self.match_mode, title, class_or_package, app_name) == self.get_match_key()
+        if not self.compile_pattern():
+            return False
+        values = get_match_fields(self.match_mode, title, class_or_package, app_name)
+        return all(pattern.fullmatch(value if value is not None else '') is not None
+                   for pattern, value in zip(self._field_patterns, values))
+
     def get_is_window_info_matched(self, window_info: 'WindowInfo') -> bool:
         if not self.active:
             return False
@@ -80,41 +210,51 @@ class WindowMatchConfig:
 
 
 # 所有窗口和他们的标题、类名、进程名、应用程序名、以及是否满足当前"Match Window"中的任意匹配条件
-class WindowInfo:
-    def __init__(self, hwnd: int, matched: bool = False) -> None:
-        self.hwnd: int = hwnd  # Top level window handle, even if the window is a UWP app.  It's not the UWP core window handle.
-        self.title: str = None
-        self.window_class: str = None
-        self.is_UWP: bool = False  # 如果是 UWP 应用，那么匹配时窗口类替换为 UWP 应用的包名
-        self.package_name: str = None
-        self.process_id: str = None
-        self.app_name: str = None
-        self.valid: bool = False
-        self.current_desktop_idx: int = None
-        self.matched: bool = matched
-        self.pinned: bool = False
-        self.refresh_window_info_from_hwnd(hwnd)
-
-    # @lp_wrapper
-    def refresh_window_info_from_hwnd(self, hwnd: int) -> None:
+# 字段存放在 WindowTable 的列中，见 WindowRow，table 为 None 时使用一个独立的表
+class WindowInfo(WindowRow):
+    __slots__ = ()
+
+    # class_name、title、process_id 是枚举窗口时已经取得的值，见 WindowBackend.enumerate_windows，为 None 时单独查询
+    def __init__(self, hwnd: int, matched: bool = False, resolve_desktop: bool = True, table: WindowTable = None,
+                 class_name: str = None, title: str = None, process_id: int = None) -> None:
+        super().__init__(table)
+        self.hwnd = hwnd
+        self.source_hwnd = hwnd
+        self.matched = matched
+        self.refresh_window_info_from_hwnd(hwnd, resolve_desktop, class_name, title, process_id)
+
+    @lp_wrapper
+    def refresh_window_info_from_hwnd(self, hwnd: int, resolve_desktop: bool = True,
+                                      class_name: str = None, title: str = None, process_id: int = None) -> None:
+        backend = get_window_backend()
+        timings = get_stage_timings()
+        self.source_hwnd = hwnd
+        self.identity_resolved = False
+        self.pending_desktop_info = False
+        self.app_name = None
         # try:
-        self.window_class = win32gui.GetClassName(hwnd)
+        start = time.perf_counter()
+        self.window_class = class_name if class_name is not None else backend.get_class_name(hwnd)
         if self.window_class is None or self.window_class == '':
+            timings.lap(STAGE_CLASS, start)
             self.valid = False
             return
-        self.is_UWP = self.window_class in ['Windows.UI.Core.CoreWindow', 'ApplicationFrameWindow']
+        self.is_UWP = self.window_class in [UWP_CORE_WINDOW_CLASS, UWP_FRAME_WINDOW_CLASS]
 
-        if self.window_class == 'Windows.UI.Core.CoreWindow':
+        if self.window_class == UWP_CORE_WINDOW_CLASS:
             self.is_UWP = True
-        elif self.window_class == 'ApplicationFrameWindow':
-            self.hwnd = get_UWP_core_hwnd(hwnd)
+        elif self.window_class == UWP_FRAME_WINDOW_CLASS:
+            self.hwnd = backend.get_UWP_core_hwnd(hwnd)
             if self.hwnd is None or self.hwnd <= 0:  # 这种情况是空的 UWP 沙盒，UWP 的 Core Window 最小化或在其他虚拟桌面的情况，Core Window 是额外的顶层窗口
+                timings.lap(STAGE_CLASS, start)
                 self.valid = False  
                 return
             self.is_UWP = True
+        start = timings.lap(STAGE_CLASS, start)
 
         # 为了能匹配到最小化的 UWP 窗口，必须采用 Core Window 的标题，这可能和用户看到的标题不一致，例如 Core Window 的标题为 "Calander" 的应用，显示的标题是 "Month View - Calender"，这个标题只有沙盒窗口才有        
-        self.title = win32gui.GetWindowText(hwnd)
+        self.title = title if title is not None else backend.get_window_text(hwnd)
+        start = timings.lap(STAGE_TITLE, start)
         
         if self.title is None or self.title == '': # 隐藏窗口的情况
             self.valid = False
@@ -122,71 +262,205 @@ class WindowInfo:
             # raise Exception(f'获取窗口信息无效，标题为空，hex_hwnd={hex(hwnd)}')
 
         if self.is_UWP:
-            self.process_id = get_UWP_core_pid(hwnd)
-            self.package_name = package_full_name_from_handle(get_UWP_core_hwnd(hwnd))
+            self.process_id = backend.get_UWP_core_pid(hwnd)
+            self.package_name = backend.get_package_full_name(hwnd)
         else:
-            _thread_id, self.process_id = win32process.GetWindowThreadProcessId(hwnd)
+            self.process_id = process_id if process_id is not None else backend.get_window_pid(hwnd)
+        timings.lap(STAGE_PID, start)
         
         if self.process_id is None or self.process_id <= 0:
             self.valid = False
             return
             # raise Exception(f'获取窗口信息无效，进程信息失效，hex_hwnd={hex(hwnd)}')
-        
-        has_pin_info = False
 
-        try:
-            self.pinned = get_window_is_pinned(hwnd)
-            has_pin_info = True
-        except Exception as e:
-            pass
+        # 窗口类、进程等不会变化的信息已经获取完毕，之后的刷新只需要 refresh_volatile_info
+        self.identity_resolved = True
+        self._finish_refresh(backend, resolve_desktop)
 
-        if not has_pin_info:
-            self.valid = False
+    # 只重新获取会变化的信息：标题、Pin 状态、虚拟桌面序号，用于已经完整解析过的窗口
+    # 句柄是否被系统回收再分配给了新窗口，由调用方用 get_is_same_window 检查
+    # 每次刷新每个窗口都会调用，直接读写 WindowTable 的列，不经过逐个字段的属性
+    # title 是枚举窗口时已经取得的标题，为 None 时单独查询
+    def refresh_volatile_info(self, resolve_desktop: bool = True, title: str = None) -> None:
+        table, row = self._table, self._row
+        flags = table.flags
+        if not flags[row] & WINDOW_FLAG_IDENTITY_RESOLVED:
+            self.refresh_window_info_from_hwnd(self.source_hwnd, resolve_desktop, title=title)
             return
+        backend = get_window_backend()
+        timings = get_stage_timings()
+        hwnd = table.source_hwnds[row]
 
-        try:
-            self.current_desktop_idx = get_window_desktop_number(hwnd)
-        except Exception as e:
-            pass
-        self.valid = True
-        if self.current_desktop_idx is not None:
-            self.valid = True
-            if self.current_desktop_idx < 0 and not self.pinned:
-                self.valid = False
+        if table.window_classes[row] == UWP_FRAME_WINDOW_CLASS:  # UWP 沙盒中的 Core Window 会随最小化、切换桌面而变化
+            start = time.perf_counter()
+            core_hwnd = backend.get_UWP_core_hwnd(hwnd)
+            self.hwnd = core_hwnd
+            timings.lap(STAGE_CLASS, start)
+            if core_hwnd is None or core_hwnd <= 0:
+                flags[row] &= ~(WINDOW_FLAG_VALID | WINDOW_FLAG_PENDING_DESKTOP)
                 return
-                # raise Exception(f'窗口信息虚拟桌面信息获取无效，hex_hwnd={hex(hwnd)}，虚拟桌面ID {self.current_desktop_idx}')
+
+        start = time.perf_counter()
+        if title is None:
+            title = backend.get_window_text(hwnd)
+        table.titles[row] = title
+        timings.lap(STAGE_TITLE, start)
+        if title is None or title == '':
+            flags[row] &= ~(WINDOW_FLAG_VALID | WINDOW_FLAG_PENDING_DESKTOP)
+            return
+
+        self._finish_refresh(backend, resolve_desktop)
+
+    # 枚举得到的窗口类和进程 id 是否和缓存的一致，不一致说明句柄已经被系统回收并分配给了新窗口
+    # UWP 窗口缓存的是 Core Window 的进程，只比较窗口类；还没有完整解析的窗口会在 refresh_volatile_info 中重新解析，视为一致
+    def get_is_same_window(self, class_name: str, process_id: int) -> bool:
+        table, row = self._table, self._row
+        if not table.flags[row] & WINDOW_FLAG_IDENTITY_RESOLVED:
+            return True
+        window_class = table.window_classes[row]
+        if window_class != class_name:
+            return False
+        return window_class in (UWP_FRAME_WINDOW_CLASS, UWP_CORE_WINDOW_CLASS) or table.process_ids[row] == process_id
+
+    def _finish_refresh(self, backend: WindowBackend, resolve_desktop: bool) -> None:
+        if resolve_desktop:
+            self.refresh_desktop_info(backend)
         else:
-            self.valid = False
+            self.update_flags(WINDOW_FLAG_PENDING_DESKTOP, WINDOW_FLAG_VALID)
+
+    # 获取 Pin 状态和虚拟桌面序号，并据此更新窗口是否有效
+    # state 是 get_windows_desktop_states 批量查询的结果，为 None 时单独查询
+    def refresh_desktop_info(self, backend: WindowBackend = None, state: WindowDesktopState = None) -> None:
+        if backend is None:
+            backend = get_window_backend()
+        table, row = self._table, self._row
+        flags = table.flags
+        hwnd = table.source_hwnds[row]
+
+        if state is None:
+            state = backend.get_windows_desktop_states([hwnd])[hwnd]
+
+        pinned = state.pinned
+        if pinned is None:
+            flags[row] &= ~(WINDOW_FLAG_VALID | WINDOW_FLAG_PENDING_DESKTOP)
             return
-            raise Exception(f'获取窗口信息无效，hex_hwnd={hex(hwnd)}')
 
+        desktop_idx = state.desktop_number
+        self.current_desktop_idx = desktop_idx
+        # 没有 Pin 的窗口虚拟桌面序号小于 0 时无效
+        valid = desktop_idx is not None and (desktop_idx >= 0 or pinned)
+        flags[row] = (flags[row] & ~(WINDOW_FLAG_PINNED | WINDOW_FLAG_VALID | WINDOW_FLAG_PENDING_DESKTOP)
+                      | (WINDOW_FLAG_PINNED if pinned else 0) | (WINDOW_FLAG_VALID if valid else 0))
+        if not valid:
+            return
 
-        self.app_name = get_app_name_from_hwnd(hwnd)
+        if table.app_names[row] is None:
+            start = time.perf_counter()
+            self.app_name = backend.get_app_name(hwnd)
+            get_stage_timings().lap(STAGE_APP_NAME, start)
+
+    def get_match_key(self, match_mode: WindowMatchMode) -> tuple:
+        class_or_package = self.package_name if self.is_UWP else self.window_class
+        return get_match_key(match_mode, self.title, class_or_package, self.app_name)
 
     def get_is_matched_for_config(self, config: WindowMatchConfig) -> bool:
         if not config.active:
             return False
         if self.is_UWP != config.is_UWP:
             return False
-        
-        title_matched = self.title == config.title
-        class_matched = self.window_class == config.window_class if not self.is_UWP else self.package_name == config.package_name
-        app_matched = self.app_name == config.app_name
-
-        if config.match_mode == WindowMatchMode.TITLE:
-            return title_matched
-        elif config.match_mode == WindowMatchMode.CLASS:
-            return class_matched
-        elif config.match_mode == WindowMatchMode.APP:
-            return app_matched
-        elif config.match_mode == WindowMatchMode.TITLE_AND_CLASS:
-            return title_matched and class_matched
-        elif config.match_mode == WindowMatchMode.TITLE_AND_APP:
-            return title_matched and app_matched
-        elif config.match_mode == WindowMatchMode.CLASS_AND_APP:
-            return class_matched and app_matched
-        elif config.match_mode == WindowMatchMode.ALL:
-            return  title_matched and class_matched and app_matched
-        else:
+        class_or_package = self.package_name if self.is_UWP else self.window_class
+        return config.get_is_matched_fields(self.title, class_or_package, self.app_name)
+
+
+# 同一 (是否 UWP, 匹配模式) 下的通配符、正则表达式规则，合并为一个多选分支的正则表达式
+# 对窗口用到的字段以 MATCH_FIELD_SEPARATOR 连接后做一次 fullmatch，就能判断是否匹配其中任意一条规则
+class _WindowMatchPatternGroup:
+    def __init__(self, match_mode: WindowMatchMode, configs: List[WindowMatchConfig]):
+        self.match_mode: WindowMatchMode = match_mode
+        self.configs: List[WindowMatchConfig] = configs
+        self.combined_pattern: re.Pattern = None
+        self.combined_configs: Dict[str, WindowMatchConfig] = {}
+        self.single_configs: List[WindowMatchConfig] = []  # 含有捕获组或位置断言的正则表达式，合并后结果会变化，单独匹配
+
+        alternatives = []
+        for config in configs:
+            if re.compile(config.pattern_source).groups > 0 or config.get_has_position_assertion():
+                self.single_configs.append(config)
+                continue
+            name = f'r{len(alternatives)}'
+            alternatives.append(f'(?P<{name}>{config.pattern_source})')
+            self.combined_configs[name] = config
+        if alternatives:
+            try:
+                self.combined_pattern = re.compile('|'.join(alternatives))
+            except re.error:
+                self.single_configs = list(configs)
+                self.combined_configs = {}
+
+    def get_is_matched(self, title: str, class_or_package: str, app_name: str) -> bool:
+        if self.combined_pattern is not None:
+            values = get_match_fields(self.match_mode, title, class_or_package, app_name)
+            subject = MATCH_FIELD_SEPARATOR.join(value if value is not None else '' for value in values)
+            match = self.combined_pattern.fullmatch(subject)
+            if match is not None:
+                # 用户的正则表达式可能跨越了字段分隔符，用命中的规则逐字段确认一次
+                if self.combined_configs[match.lastgroup].get_is_matched_fields(title, class_or_package, app_name):
+                    return True
+                if any(config.get_is_matched_fields(title, class_or_package, app_name) for config in self.combined_configs.values()):
+                    return True
+        return any(config.get_is_matched_fields(title, class_or_package, app_name) for config in self.single_configs)
+
+
+# 编译后的匹配规则索引，按 (是否 UWP, 匹配模式) 分组
+# 完全相等的规则是匹配键的集合，每个窗口每种匹配模式只需要一次哈希查找
+# 通配符、正则表达式规则在规则加入时编译，并合并为每组一个正则表达式
+class WindowMatchIndex:
+    def __init__(self, configs: List[WindowMatchConfig] = None):
+        self._keys_by_UWP: Dict[bool, Dict[WindowMatchMode, Set[tuple]]] = {False: {}, True: {}}
+        self._pattern_groups_by_UWP: Dict[bool, List[_WindowMatchPatternGroup]] = {False: [], True: []}
+        self._pattern_groups: Dict[tuple, _WindowMatchPatternGroup] = {}  # 上次编译的分组，规则没有变化的分组直接复用
+        self.rebuild(configs if configs is not None else [])
+
+    # 规则集合变化后重新编译，只修改了一条规则时只有它所在的分组需要重新合并
+    def rebuild(self, configs: List[WindowMatchConfig]):
+        keys_by_UWP = {False: {}, True: {}}
+        pattern_configs_by_UWP = {False: {}, True: {}}
+        for config in configs:
+            if not config.active or config.match_mode not in MATCH_MODE_FIELDS:
+                continue
+            if config.pattern_type == WindowMatchPatternType.EXACT:
+                keys_by_UWP[bool(config.is_UWP)].setdefault(config.match_mode, set()).add(config.get_match_key())
+            elif config.compile_pattern():
+                pattern_configs_by_UWP[bool(config.is_UWP)].setdefault(config.match_mode, []).append(config)
+        pattern_groups = {}
+        pattern_groups_by_UWP = {False: [], True: []}
+        for is_UWP, groups in pattern_configs_by_UWP.items():
+            for match_mode, pattern_configs in groups.items():
+                # 分组保存了规则对象，用对象本身和编译结果作为键，规则被原地修改后不会复用旧的分组
+                key = (is_UWP, match_mode, tuple((id(config), config.pattern_source) for config in pattern_configs))
+                group = self._pattern_groups.get(key)
+                if group is None:
+                    group = _WindowMatchPatternGroup(match_mode, pattern_configs)
+                pattern_groups[key] = group
+                pattern_groups_by_UWP[is_UWP].append(group)
+        self._keys_by_UWP = keys_by_UWP
+        self._pattern_groups_by_UWP = pattern_groups_by_UWP
+        self._pattern_groups = pattern_groups
+
+    def get_is_matched(self, window_info: WindowInfo) -> bool:
+        is_UWP = bool(window_info.is_UWP)
+        keys_by_mode = self._keys_by_UWP[is_UWP]
+        groups = self._pattern_groups_by_UWP[is_UWP]
+        if not keys_by_mode and not groups:
             return False
-        
+        # 每个字段只读取一次
+        title = window_info.title
+        class_or_package = window_info.package_name if is_UWP else window_info.window_class
+        app_name = window_info.app_name
+        for match_mode, keys in keys_by_mode.items():
+            if get_match_key(match_mode, title, class_or_package, app_name) in keys:
+                return True
+        for group in groups:
+            if group.get_is_matched(title, class_or_package, app_name):
+                return True
+        return False
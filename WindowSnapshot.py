@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# === 窗口列表快照
+# 退出时以及定期把窗口表保存到程序数据目录下的 window_snapshot.json，下次启动时先显示快照，再在后台刷新并核对。
+# 格式：{"version": 1, "saved_time": 秒, "windows": [[...WindowTable.get_row_values 的 9 个值, 图标键], ...]}
+# 窗口句柄在重启后会被重新分配，系统重启之前保存的快照直接丢弃。
+
+import json
+import time
+from typing import List, Tuple
+
+from AppData import get_app_data_path, atomic_write_text
+
+
+WINDOW_SNAPSHOT_FILE_NAME = "window_snapshot.json"
+WINDOW_SNAPSHOT_VERSION = 1
+
+
+# 系统启动时间，无法获取时返回 None
+def _get_boot_time() -> float:
+    try:
+        import psutil
+        return psutil.boot_time()
+    except Exception:
+        return None
+
+
+class WindowSnapshotStore:
+    def __init__(self, path: str = None):
+        self.path: str = path if path is not None else get_app_data_path(WINDOW_SNAPSHOT_FILE_NAME)
+
+    # rows 是 (WindowTable.get_row_values 的值, 图标键) 的列表
+    def save(self, rows: List[Tuple[tuple, tuple]]) -> bool:
+        data = {
+            'version': WINDOW_SNAPSHOT_VERSION,
+            'saved_time': time.time(),
+            'windows': [list(values) + [list(icon_key) if icon_key is not None else None] for values, icon_key in rows],
+        }
+        try:
+            atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        except OSError as e:
+            print(f"保存窗口快照失败: {e}")
+            return False
+        return True
+
+    # 返回 (值, 图标键) 的列表，文件不存在、版本不同或者是系统重启之前保存的快照时返回空列表
+    def load(self) -> List[Tuple[tuple, tuple]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"读取窗口快照失败: {e!r}")
+            return []
+        if not isinstance(data, dict) or data.get('version') != WINDOW_SNAPSHOT_VERSION:
+            return []
+        boot_time = _get_boot_time()
+        if boot_time is not None and data.get('saved_time', 0) < boot_time:
+            return []
+        rows = []
+        for row in data.get('windows', []):
+            if not isinstance(row, list) or len(row) != 10:
+                continue
+            icon_key = tuple(row[9]) if row[9] is not None else None
+            rows.append((tuple(row[:9]), icon_key))
+        return rows
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+# === 按列存储的窗口表
+# 每个窗口占表中的一行，整数字段存放在 array 中，标志位合并为一个字节，窗口类、应用名、包名是驻留（intern）的字符串，
+# 同一个应用的所有窗口共用一个字符串对象，只有标题每个窗口各存一份。
+# WindowRow 是只有 (表, 行号) 两个槽位的轻量视图，按属性名读写对应的列，WindowInfo 继承它，调用方不需要改动。
+#
+# 行号在窗口存在期间保持不变，窗口消失后调用 release 释放，行号之后会分配给新窗口。
+# 释放时视图会被转移到一个只有一行的独立表中，仍然被界面等引用的旧视图继续读到窗口消失前的值，不会读到新窗口的数据。
+# 按条件筛选（Pin、所在桌面、UWP、匹配状态）直接扫描标志位和桌面序号两列，不需要访问每个窗口对象。
+#
+# 表和视图本身不加锁：release 和 compact 会改变视图的 (表, 行号)，并截断各列，读到一半的视图可能越界。
+# 多个线程共用的表（VirtualDesktopEnhancerCore.window_table）只能在持有同一把锁（refresh_lock）时读写，
+# 其他线程需要窗口信息时在锁内取出 WindowRowSnapshot（get_row_snapshots），不要持有视图。
+
+import sys
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+# 整数列中表示 None 的值
+_NONE = -(1 << 63)
+
+WINDOW_FLAG_VALID = 0x01
+WINDOW_FLAG_UWP = 0x02
+WINDOW_FLAG_PINNED = 0x04
+WINDOW_FLAG_MATCHED = 0x08
+WINDOW_FLAG_IDENTITY_RESOLVED = 0x10  # 已经获取到窗口类、标题和进程，之后的刷新只需要更新会变化的信息
+WINDOW_FLAG_PENDING_DESKTOP = 0x20  # 等待批量填入虚拟桌面信息
+WINDOW_FLAG_IN_USE = 0x80  # 行已分配，空闲的行标志位为 0
+
+_INT_COLUMNS = ('hwnds', 'source_hwnds', 'process_ids', 'desktop_idxs')
+_STR_COLUMNS = ('titles', 'window_classes', 'app_names', 'package_names')
+_COLUMNS = _INT_COLUMNS + _STR_COLUMNS
+
+
+# (mask, expected) -> 256 字节的转换表，标志位满足 flags & mask == expected 的字节映射为 1，其余为 0
+_flag_filter_tables: Dict[Tuple[int, int], bytes] = {}
+
+def _get_flag_filter_table(mask: int, expected: int) -> bytes:
+    table = _flag_filter_tables.get((mask, expected))
+    if table is None:
+        table = bytes(1 if flags & mask == expected else 0 for flags in range(256))
+        _flag_filter_tables[(mask, expected)] = table
+    return table
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    if value is None or type(value) is not str:
+        return value
+    return sys.intern(value)
+
+# 属性按列序号访问 WindowTable.columns，比按名称 getattr 快
+def _int_column_property(column: str) -> property:
+    i = _COLUMNS.index(column)
+    def getter(self):
+        value = self._table.columns[i][self._row]
+        return None if value == _NONE else value
+    def setter(self, value):
+        self._table.columns[i][self._row] = _NONE if value is None else value
+    return property(getter, setter)
+
+def _str_column_property(column: str, interned: bool) -> property:
+    i = _COLUMNS.index(column)
+    def getter(self):
+        return self._table.columns[i][self._row]
+    if interned:
+        def setter(self, value):
+            self._table.columns[i][self._row] = _intern(value)
+    else:
+        def setter(self, value):
+            self._table.columns[i][self._row] = value
+    return property(getter, setter)
+
+def _flag_property(flag: int) -> property:
+    def getter(self) -> bool:
+        return bool(self._table.flags[self._row] & flag)
+    def setter(self, value: bool):
+        flags = self._table.flags
+        if value:
+            flags[self._row] |= flag
+        else:
+            flags[self._row] &= ~flag & 0xFF
+    return property(getter, setter)
+
+
+# 表中一行的视图
+class WindowRow:
+    __slots__ = ('_table', '_row')
+
+    hwnd = _int_column_property('hwnds')  # Top level window handle, even if the window is a UWP app.  It's not the UWP core window handle.
+    source_hwnd = _int_column_property('source_hwnds')  # 枚举得到的顶层窗口句柄，UWP 沙盒窗口的 hwnd 会被替换为 Core Window 句柄
+    process_id = _int_column_property('process_ids')
+    current_desktop_idx = _int_column_property('desktop_idxs')
+    title = _str_column_property('titles', False)
+    window_class = _str_column_property('window_classes', True)
+    app_name = _str_column_property('app_names', True)
+    package_name = _str_column_property('package_names', True)
+    valid = _flag_property(WINDOW_FLAG_VALID)
+    is_UWP = _flag_property(WINDOW_FLAG_UWP)  # 如果是 UWP 应用，那么匹配时窗口类替换为 UWP 应用的包名
+    pinned = _flag_property(WINDOW_FLAG_PINNED)
+    matched = _flag_property(WINDOW_FLAG_MATCHED)
+    identity_resolved = _flag_property(WINDOW_FLAG_IDENTITY_RESOLVED)
+    pending_desktop_info = _flag_property(WINDOW_FLAG_PENDING_DESKTOP)
+
+    def __init__(self, table: 'WindowTable' = None):
+        if table is None:
+            table = WindowTable()
+        self._table: WindowTable = table
+        self._row: int = table.allocate(self)
+
+    @property
+    def table(self) -> 'WindowTable':
+        return self._table
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    # 这一行所有列的值，见 WindowTable.get_row_values
+    def get_values(self) -> tuple:
+        return self._table.get_row_values(self._row)
+
+    # 一次修改多个标志位，先清零 clear_flags，再置位 set_flags
+    def update_flags(self, set_flags: int = 0, clear_flags: int = 0):
+        flags = self._table.flags
+        row = self._row
+        flags[row] = (flags[row] & ~clear_flags | set_flags) & 0xFF
+
+    # 窗口已经消失，释放表中的行
+    def release(self):
+        self._table.release(self._row)
+
+
+# 一行在某一时刻的值，之后表的变化（包括释放和整理）不会影响它，可以在线程之间传递
+# 字段和 WindowRow 相同，整数列中的 None 已经转换，标志位保留在 flags 中
+class WindowRowSnapshot(NamedTuple):
+    hwnd: Optional[int]
+    source_hwnd: Optional[int]
+    process_id: Optional[int]
+    current_desktop_idx: Optional[int]
+    title: Optional[str]
+    window_class: Optional[str]
+    app_name: Optional[str]
+    package_name: Optional[str]
+    flags: int
+
+    valid = property(lambda self: bool(self.flags & WINDOW_FLAG_VALID))
+    is_UWP = property(lambda self: bool(self.flags & WINDOW_FLAG_UWP))
+    pinned = property(lambda self: bool(self.flags & WINDOW_FLAG_PINNED))
+    matched = property(lambda self: bool(self.flags & WINDOW_FLAG_MATCHED))
+
+    # 用 WindowTable.get_row_values 得到的值构造，例如从保存的窗口快照中读取的值
+    @classmethod
+    def from_row_values(cls, values: tuple) -> 'WindowRowSnapshot':
+        hwnd, source_hwnd, process_id, desktop_idx = (None if value == _NONE else value for value in values[:4])
+        return cls(hwnd, source_hwnd, process_id, desktop_idx, *values[4:9])
+
+    # 和 WindowTable.get_row_values 相同格式的值，用于保存窗口快照
+    def to_row_values(self) -> tuple:
+        return tuple(_NONE if value is None else value for value in self[:4]) + self[4:]
+
+
+class WindowTable:
+    def __init__(self):
+        self.hwnds: array = array('q')
+        self.source_hwnds: array = array('q')
+        self.process_ids: array = array('q')
+        self.desktop_idxs: array = array('q')
+        self.flags: array = array('B')
+        self.titles: List[str] = []
+        self.window_classes: List[str] = []
+        self.app_names: List[str] = []
+        self.package_names: List[str] = []
+        self.views: List[WindowRow] = []  # 每行唯一的视图，空闲的行为 None
+        self.columns: list = [getattr(self, name) for name in _COLUMNS]  # 按 _COLUMNS 的顺序
+        self._free_rows: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.views) - len(self._free_rows)
+
+    # 分配一行并清空各列，view 是这一行的视图
+    def allocate(self, view: WindowRow) -> int:
+        if self._free_rows:
+            row = self._free_rows.pop()
+            for column in _INT_COLUMNS:
+                getattr(self, column)[row] = _NONE
+            for column in _STR_COLUMNS:
+                getattr(self, column)[row] = None
+            self.flags[row] = WINDOW_FLAG_IN_USE
+            self.views[row] = view
+            return row
+        for column in _INT_COLUMNS:
+            getattr(self, column).append(_NONE)
+        for column in _STR_COLUMNS:
+            getattr(self, column).append(None)
+        self.flags.append(WINDOW_FLAG_IN_USE)
+        self.views.append(view)
+        return len(self.views) - 1
+
+    def _copy_row(self, source: 'WindowTable', source_row: int, row: int):
+        for column, source_column in zip(self.columns, source.columns):
+            column[row] = source_column[source_row]
+        self.flags[row] = source.flags[source_row]
+
+    # 释放一行，这一行原来的视图转移到独立的表中，保留释放前的值
+    def release(self, row: int):
+        view = self.views[row]
+        if view is None:
+            return
+        # 先在独立的表中分配并复制好这一行，再同时切换视图的表和行号，视图不会指向还没有填好的行
+        detached = WindowTable()
+        detached_row = detached.allocate(view)
+        detached._copy_row(self, row, detached_row)
+        view._table, view._row = detached, detached_row
+        self.views[row] = None
+        self.flags[row] = 0
+        self.titles[row] = None  # 不再持有标题字符串
+        self._free_rows.append(row)
+
+    # 把后面的行移动到前面的空闲行中，空闲行超过一半时调用，移动的行的视图会更新行号
+    # 各列最后会被截断，调用方必须持有所有读者共用的锁，见文件开头的说明
+    def compact(self):
+        if not self._free_rows:
+            return
+        free_rows = sorted(self._free_rows)
+        last = len(self.views) - 1
+        i = 0
+        while i < len(free_rows) and free_rows[i] <= last:
+            row = free_rows[i]
+            while last > row and self.views[last] is None:
+                last -= 1
+            if last <= row:
+                break
+            view = self.views[last]
+            self._copy_row(self, last, row)
+            self.views[row] = view
+            view._row = row
+            self.views[last] = None
+            last -= 1
+            i += 1
+        count = len(self)
+        for column in self.columns + [self.flags, self.views]:
+            del column[count:]
+        self._free_rows = []
+
+    def get_is_sparse(self) -> bool:
+        return len(self._free_rows) > len(self)
+
+    # 按条件筛选行号，条件为 None 时不限制
+    # 标志位的条件通过 bytes.translate 一次映射整列，再取出满足条件的行号
+    def get_rows(self,
+                 valid: Optional[bool] = True,
+                 pinned: Optional[bool] = None,
+                 matched: Optional[bool] = None,
+                 is_UWP: Optional[bool] = None,
+                 pending_desktop_info: Optional[bool] = None,
+                 desktop_idx: Optional[int] = None) -> List[int]:
+        mask = WINDOW_FLAG_IN_USE
+        expected = WINDOW_FLAG_IN_USE
+        for flag, value in ((WINDOW_FLAG_VALID, valid), (WINDOW_FLAG_PINNED, pinned), (WINDOW_FLAG_MATCHED, matched),
+                            (WINDOW_FLAG_UWP, is_UWP), (WINDOW_FLAG_PENDING_DESKTOP, pending_desktop_info)):
+            if value is not None:
+                mask |= flag
+                if value:
+                    expected |= flag
+        selected = self.flags.tobytes().translate(_get_flag_filter_table(mask, expected))
+        count = selected.count(1)
+        if count * 8 < len(selected):
+            # 选中的行很少时用 find 跳过不满足条件的行
+            rows = []
+            row = selected.find(1)
+            while row >= 0:
+                rows.append(row)
+                row = selected.find(1, row + 1)
+        else:
+            rows = list(compress(range(len(selected)), selected))
+        if desktop_idx is not None:
+            desktop_idxs = self.desktop_idxs
+            rows = [row for row in rows if desktop_idxs[row] == desktop_idx]
+        return rows
+
+    def get_views(self, rows: Iterable[int] = None, **conditions) -> List[WindowRow]:
+        if rows is None:
+            rows = self.get_rows(**conditions)
+        views = self.views
+        return [views[row] for row in rows]
+
+    # 行的全部列的值和标志位，用于比较一行的内容是否变化，整数列中的 None 没有转换
+    def get_row_values(self, row: int) -> tuple:
+        hwnds, source_hwnds, process_ids, desktop_idxs, titles, window_classes, app_names, package_names = self.columns
+        return (hwnds[row], source_hwnds[row], process_ids[row], desktop_idxs[row],
+                titles[row], window_classes[row], app_names[row], package_names[row], self.flags[row])
+
+    def get_row_snapshot(self, row: int) -> WindowRowSnapshot:
+        return WindowRowSnapshot.from_row_values(self.get_row_values(row))
+
+    def get_row_snapshots(self, rows: Iterable[int] = None, **conditions) -> List[WindowRowSnapshot]:
+        if rows is None:
+            rows = self.get_rows(**conditions)
+        get_row_values = self.get_row_values
+        from_row_values = WindowRowSnapshot.from_row_values
+        return [from_row_values(get_row_values(row)) for row in rows]
+
+    # 用 get_row_values 得到的值填入一行，用于从快照恢复，行必须已经分配
+    def set_row_values(self, row: int, values: tuple):
+        hwnds, source_hwnds, process_ids, desktop_idxs, titles, window_classes, app_names, package_names = self.columns
+        hwnds[row], source_hwnds[row], process_ids[row], desktop_idxs[row], titles[row] = values[:5]
+        window_classes[row], app_names[row], package_names[row] = (_intern(value) for value in values[5:8])
+        self.flags[row] = (values[8] | WINDOW_FLAG_IN_USE) & 0xFF
+
+    def get_source_hwnds(self, rows: Iterable[int] = None, **conditions) -> List[int]:
+        if rows is None:
+            rows = self.get_rows(**conditions)
+        source_hwnds = self.source_hwnds
+        return [source_hwnds[row] for row in rows]
+
+    # 各列占用的内存（字节），字符串只计算一次，驻留的字符串被多行共用
+    def get_stats(self) -> dict:
+        arrays_bytes = sum(column.buffer_info()[1] * column.itemsize for column in
+                           [getattr(self, name) for name in _INT_COLUMNS] + [self.flags])
+        lists_bytes = sum(sys.getsizeof(getattr(self, name)) for name in _STR_COLUMNS + ('views',))
+        strings = {id(value): value for name in _STR_COLUMNS for value in getattr(self, name) if value is not None}
+        strings_bytes = sum(sys.getsizeof(value) for value in strings.values())
+        views_bytes = sum(sys.getsizeof(view) for view in self.views if view is not None)
+        return {
+            'rows': len(self),
+            'capacity': len(self.views),
+            'arrays_bytes': arrays_bytes,
+            'lists_bytes': lists_bytes,
+            'strings_bytes': strings_bytes,
+            'views_bytes': views_bytes,
+            'total_bytes': arrays_bytes + lists_bytes + strings_bytes + views_bytes,
+        }
@@ -1,18 +1,18 @@
 # -*- coding: utf-8 -*-
-from VirtualDesktopAccessor import get_current_desktop_number, get_desktop_name, move_window_to_desktop
-from AppUtility import get_is_app_running, get_app_pid, get_apps_pids, get_apps_is_running, get_window_title_from_hwnd, get_icon_from_hwnd
-from ShellHook import WM_SHELLHOOKMESSAGE, HSHELL_VIRTUAL_DESKTOP_CHANGED, MSG, RegisterShellHook
-from VirtualDesktopEnhancerWindow import VirtualDesktopEnhancerWindow
-from VirtualDesktopEnhancerCore import VirtualDesktopEnhancerCore
+from StartupTrace import get_startup_trace  # 最先导入，从这里开始计时
+with get_startup_trace().phase('import_core'):
+    from VirtualDesktopEnhancerCore import VirtualDesktopEnhancerCore
+# VirtualDesktopAccessor、AppUtility、ShellHook 由窗口系统后端和 DesktopEvents 在用到时才导入
 # from line_profiler import LineProfiler
 
 
 def main():
-    core = VirtualDesktopEnhancerCore()
-    core.run()  
+    with get_startup_trace().phase('core'):
+        core = VirtualDesktopEnhancerCore()
+    core.run()
     # get_icon_from_hwnd(0x00081AF2).save('test.png')
     # move_window_to_desktop(0x00C7293C, 3)
 
 if __name__ == '__main__':
     main()
-    print("main Done")
\ No newline at end of file
+    print("main Done")